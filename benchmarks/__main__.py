@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import json
+import logging
+import pathlib
+import platform
+import subprocess
+import sys
+
+from benchmarks import bench_backends, bench_extraction, bench_history, bench_info, bench_progress
+
+suites = {
+    'info': bench_info,
+    'history': bench_history,
+    'progress': bench_progress,
+    'backends': bench_backends,
+    'extraction': bench_extraction,
+}
+results_dir = pathlib.Path(__file__).parent / 'results'
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=pathlib.Path(__file__).parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def _compare(current: dict, previous_path: pathlib.Path):
+    """Print median ratios against an earlier result file."""
+    previous = json.loads(previous_path.read_text())['results']
+    print(f"{'case':60} {'before':>12} {'after':>12} {'ratio':>8}")
+    for name, stats in current.items():
+        before = previous.get(name, {}).get('median')
+        after = stats.get('median')
+        if before is None or after is None:
+            continue
+        print(f'{name:60} {before:12.6g} {after:12.6g} {after / before if before else 0:8.2f}')
+
+
+def main():
+    logging.basicConfig(format='[%(levelname)s] %(module)s::%(funcName)s(): %(message)s')
+
+    parser = argparse.ArgumentParser(description='Offline benchmarks for ytdl-qt.', prog='benchmarks')
+    parser.add_argument('-d', help='debug', action='store_true')
+    parser.add_argument('--only', nargs='+', choices=suites.keys(), default=list(suites.keys()))
+    parser.add_argument('--history-sizes', type=lambda s: [int(i) for i in s.split(',')],
+                        default=[10000, 100000, 1000000], help='comma-separated row counts')
+    parser.add_argument('--media-size', type=int, default=16 * 1000 ** 2, help='bytes of generated media')
+    parser.add_argument('--case-timeout', type=float, default=120, help='seconds per slow case')
+    parser.add_argument('-o', '--output', type=pathlib.Path, help='result file')
+    parser.add_argument('--compare', type=pathlib.Path, help='earlier result file')
+    args = parser.parse_args()
+
+    if args.d:
+        logging.getLogger().setLevel(level='DEBUG')
+
+    commit = _git_commit()
+    results = {}
+    for name in args.only:
+        print(f'Running {name}', file=sys.stderr)
+        results.update(suites[name].run(args))
+
+    report = {
+        'meta': {
+            'commit': commit,
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        results_dir.mkdir(exist_ok=True)
+        output = results_dir / f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{commit}.json"
+    output.write_text(json.dumps(report, indent=2))
+    print(f'Results written to {output}', file=sys.stderr)
+
+    if args.compare:
+        _compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
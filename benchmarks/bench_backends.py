@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from benchmarks.media_server import MediaServer
+from ytdl_qt.core_params import CoreParams
+from ytdl_qt.executors.downloader_aria2c import DownloaderAria2c
+from ytdl_qt.executors.downloader_ffmpeg import DownloaderFfmpeg
+from ytdl_qt.executors.downloader_ytdl import DownloaderYtdl
+from ytdl_qt.ytdl_info import Info
+
+backends = {
+    'ytdl': (DownloaderYtdl, None),
+    'ffmpeg': (DownloaderFfmpeg, 'ffmpeg'),
+    'aria2c': (DownloaderAria2c, 'aria2c'),
+}
+media = {
+    'http': 'media.ts',
+    'hls': 'media.m3u8',
+}
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def _download(cls, info: Info, params: CoreParams, timeout: float) -> dict:
+    finished = threading.Event()
+    downloader = cls(params, info)
+    downloader.finished_cb = lambda sender: finished.set()
+
+    start = time.perf_counter()
+    downloader.download_start()
+    if not finished.wait(timeout):
+        downloader.download_cancel()
+        return {'timeout': timeout}
+    elapsed = time.perf_counter() - start
+    if downloader.error:
+        return {'error': downloader.error}
+    size = _dir_size(params.download_dir)
+    return {
+        'min': elapsed,
+        'median': elapsed,
+        'mean': elapsed,
+        'repeat': 1,
+        'number': 1,
+        'bytes': size,
+        'throughput': size / elapsed if elapsed else None,
+    }
+
+
+def run(args) -> dict:
+    """Run each download backend against the local media server."""
+    results = {}
+    with MediaServer(args.media_size) as server:
+        results['backends/media'] = {'generator': server.generated_with, 'bytes': server.size_of('media.ts')}
+        for media_name, path in media.items():
+            info = Info(server.url(path), {'quiet': True})
+            fmt_ids = [info.get_formats()[0]['format_id']]
+            for name, (cls, exe) in backends.items():
+                key = f'backends/{name}/{media_name}'
+                exe_path = shutil.which(exe) if exe else None
+                if exe and exe_path is None:
+                    results[key] = {'skipped': f'{exe} not found'}
+                    continue
+                with tempfile.TemporaryDirectory() as tmp:
+                    params = CoreParams()
+                    params.download_dir = tmp
+                    params.ffmpeg_path = shutil.which('ffmpeg')
+                    params.fmt_id_selection = fmt_ids
+                    params.ytdl_params = {'quiet': True, 'noprogress': True}
+                    try:
+                        results[key] = _download(cls, info, params, args.case_timeout)
+                    except Exception as e:
+                        results[key] = {'error': str(e)}
+    return results
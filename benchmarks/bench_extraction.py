@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import statistics
+import threading
+import time
+
+from benchmarks.media_server import MediaServer
+from benchmarks.timing import measure_once
+from ytdl_qt.engine import engine
+from ytdl_qt.extract_pool import extract_pool
+
+page_count = 16
+# Generic extractor runs its embed regexes over the whole page, a big page keeps it busy
+page_size = 2 * 1000 ** 2
+frame_interval = 1 / 60  # s
+
+
+def _page(media_url: str) -> bytes:
+    filler = '<p>' + 'lorem ipsum dolor sit amet ' * 40 + '</p>\n'
+    body = filler * (page_size // len(filler))
+    return (f'<html><head><title>page</title></head><body>{body}'
+            f'<video src="{media_url}"></video></body></html>').encode()
+
+
+class FrameClock:
+    """Thread ticking at the GUI frame rate, records how late the ticks are."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self.late = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        due = time.perf_counter() + frame_interval
+        while not self._stop.is_set():
+            time.sleep(max(0.0, due - time.perf_counter()))
+            now = time.perf_counter()
+            self.late.append(now - due)
+            due = max(due + frame_interval, now)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+    def stats(self) -> dict:
+        late = self.late or [0.0]
+        return {
+            'min': min(late), 'median': statistics.median(late), 'mean': statistics.mean(late),
+            'max': max(late), 'repeat': 1, 'number': len(late),
+        }
+
+
+def _resolve_all(urls, processes: bool, timeout: float):
+    # Own params bypass the info cache, every URL is extracted
+    futures = [engine.submit(engine.extract(i, ytdl_params={'quiet': True}, processes=processes)) for i in urls]
+    concurrent.futures.wait(futures, timeout)
+    for future in futures:
+        future.result(0)
+
+
+def run(args) -> dict:
+    """Resolve a batch of pages with extraction threads and processes, timing frames meanwhile."""
+    results = {}
+    with MediaServer(1000 ** 2) as server:
+        page = _page(server.url('media.ts'))
+        urls = []
+        for i in range(page_count):
+            server.add(f'page{i}.html', page, 'text/html')
+            urls.append(server.url(f'page{i}.html'))
+        for mode, processes in (('threads', False), ('processes', True)):
+            # Workers and extractors are set up outside of the measurement
+            _resolve_all(urls[:extract_pool.max_workers], processes, args.case_timeout)
+            with FrameClock() as clock:
+                results[f'extraction/{page_count}_pages/{mode}'] = measure_once(
+                    lambda: _resolve_all(urls, processes, args.case_timeout))
+            results[f'extraction/{page_count}_pages/{mode}/frame_lateness'] = clock.stats()
+    engine.stop()
+    return results
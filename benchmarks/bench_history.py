@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import csv
+import multiprocessing
+import pathlib
+import tempfile
+
+from benchmarks.timing import measure, measure_once
+
+duplicate_every = 10  # Every n-th row repeats an earlier url
+
+
+def _write_history(path: pathlib.Path, rows: int):
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',', quotechar='\"', quoting=csv.QUOTE_ALL)
+        for i in range(rows):
+            video = i // 2 if i % duplicate_every == 0 else i
+            writer.writerow([f'Synthetic video #{video}', f'https://www.youtube.com/watch?v={video:011d}'])
+
+
+def _case(rows: int, queue):
+    """Runs in a child process so a case can be stopped at the time limit."""
+    from PyQt5.QtCore import QCoreApplication
+    from ytdl_qt.history import History
+    from ytdl_qt.qt_historytablemodel import HistoryTableModel
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp, 'url-history.csv')
+        _write_history(path, rows)
+
+        holder = {}
+        results['load'] = measure_once(lambda: holder.update(history=History(path)))
+        history = holder['history']
+        results['model'] = measure_once(lambda: holder.update(model=HistoryTableModel(history)))
+        model = holder['model']
+
+        visible = min(model.rowCount(None), 1000)
+        indexes = [model.index(row, col) for row in range(visible) for col in range(2)]
+        results['data_visible_rows'] = measure(lambda: [model.data(i) for i in indexes], number=10)
+
+        counter = iter(range(rows, rows * 2))
+        results['add_new_item'] = measure(
+            lambda: model.add_history_item('New', f'https://example.com/{next(counter)}'), number=10)
+        results['add_existing_item'] = measure(
+            lambda: model.add_history_item('Old', 'https://www.youtube.com/watch?v=00000000000'), number=10)
+    del app
+    queue.put(results)
+
+
+def run(args) -> dict:
+    """Load synthetic histories through History and HistoryTableModel."""
+    results = {}
+    ctx = multiprocessing.get_context('spawn')
+    for rows in args.history_sizes:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_case, args=(rows, queue), daemon=True)
+        proc.start()
+        proc.join(args.case_timeout)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+            results[f'history/{rows}'] = {'timeout': args.case_timeout}
+            continue
+        if proc.exitcode != 0 or queue.empty():
+            results[f'history/{rows}'] = {'error': f'exit code {proc.exitcode}'}
+            continue
+        for name, stats in queue.get().items():
+            results[f'history/{rows}/{name}'] = stats
+    return results
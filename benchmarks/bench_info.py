@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import json
+import pathlib
+
+from benchmarks.timing import measure
+from ytdl_qt.format_policy import FormatPolicy
+from ytdl_qt.utils import check_dict_attribute
+from ytdl_qt.ytdl_info import Info
+
+fixtures_dir = pathlib.Path(__file__).parent / 'fixtures'
+
+
+def _pick_pair(info: Info):
+    video = audio = None
+    for fmt in info.get_formats():
+        if check_dict_attribute(fmt, 'vcodec') and not check_dict_attribute(fmt, 'acodec'):
+            video = fmt['format_id']
+        elif check_dict_attribute(fmt, 'acodec') and not check_dict_attribute(fmt, 'vcodec'):
+            audio = fmt['format_id']
+    return [i for i in (video, audio) if i is not None]
+
+
+def run(args) -> dict:
+    """Replay recorded extract_info output through Info."""
+    results = {}
+    policy = FormatPolicy.parse('max_height=1080; vcodec=av1>vp9>h264; acodec=opus; min_abr=128')
+    for path in sorted(fixtures_dir.glob('*.json')):
+        name = path.stem
+        text = path.read_text()
+        info = Info.from_info_dict(json.loads(text))
+        pair = _pick_pair(info)
+
+        results[f'info/{name}/json_load'] = measure(lambda: Info.from_info_dict(json.loads(text)), number=100)
+        results[f'info/{name}/get_info_filtered'] = measure(info.get_info_filtered, number=1000)
+        results[f'info/{name}/get_format_url_list'] = measure(lambda: info.get_format_url_list(pair), number=1000)
+        results[f'info/{name}/get_protocol_list'] = measure(lambda: info.get_protocol_list(pair), number=1000)
+        if len(pair) == 2:
+            results[f'info/{name}/get_format_str'] = measure(lambda: info.get_format_str(pair), number=1000)
+        results[f'info/{name}/policy_select'] = measure(
+            lambda: policy.select(info.get_formats(), info.get_duration()), number=1000)
+    return results
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+import json
+import pathlib
+import tempfile
+
+from benchmarks.timing import measure
+from ytdl_qt.core_params import CoreParams
+from ytdl_qt.executors.downloader_ytdl import DownloaderYtdl
+from ytdl_qt.ytdl_info import Info
+
+fixture = pathlib.Path(__file__).parent / 'fixtures' / 'youtube_vod.json'
+events = 100000
+
+
+def _events(total: int, with_eta: bool):
+    step = total // events
+    for i in range(events):
+        d = {
+            'status': 'downloading',
+            'downloaded_bytes': i * step,
+            'total_bytes': total,
+            'filename': 'target.webm',
+        }
+        if with_eta:
+            d['eta'] = events - i
+        yield d
+
+
+def run(args) -> dict:
+    """Fire synthetic progress streams through DownloaderYtdl.ytdl_processing_hook."""
+    info = Info.from_info_dict(json.loads(fixture.read_text()))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        params = CoreParams()
+        params.download_dir = tmp
+        params.fmt_id_selection = ['399', '251']
+
+        for name, with_eta in (('no_eta', False), ('eta', True)):
+            downloader = DownloaderYtdl(params, info)
+            stream = list(_events(500 * 1000 ** 2, with_eta))
+
+            def fire():
+                for d in stream:
+                    downloader.ytdl_processing_hook(d)
+
+            stats = measure(fire, repeat=3)
+            stats.update({key: stats[key] / events for key in ('min', 'median', 'mean')})
+            stats['events'] = events
+            results[f'progress/hook_{name}'] = stats
+    return results
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+
+class MediaServer:
+    """
+    Local HTTP server with generated media: a progressive MPEG-TS file
+    and an HLS playlist with its segments. Supports HEAD and byte ranges.
+    """
+
+    ts_packet_size = 188
+    segment_count = 10
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        range_re = re.compile(r'bytes=(\d*)-(\d*)')
+
+        def log_message(self, fmt, *args):
+            logging.debug(fmt % args)
+
+        def _lookup(self) -> Optional[Tuple[bytes, str]]:
+            return self.server.files.get(self.path.split('?')[0])
+
+        def _send(self, body_wanted: bool):
+            item = self._lookup()
+            if item is None:
+                self.send_error(404)
+                return
+            data, content_type = item
+            start, end = 0, len(data) - 1
+            match = self.range_re.fullmatch(self.headers.get('Range', ''))
+            if match and (match[1] or match[2]):
+                if match[1]:
+                    start = int(match[1])
+                    if match[2]:
+                        end = min(int(match[2]), end)
+                else:
+                    start = max(0, len(data) - int(match[2]))
+                if start > end:
+                    self.send_error(416)
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+            if body_wanted:
+                try:
+                    self.wfile.write(memoryview(data)[start:end + 1])
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        def do_HEAD(self):
+            self._send(False)
+
+        def do_GET(self):
+            self._send(True)
+
+    def __init__(self, size: int = 16 * 1000 ** 2):
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self.Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.files: Dict[str, Tuple[bytes, str]] = {}
+        self._thread = None
+        self.generated_with = None
+        self._generate(size)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def url(self, name: str) -> str:
+        return f'{self.base_url}/{name}'
+
+    def _add(self, name: str, data: bytes, content_type: str):
+        self._httpd.files[f'/{name}'] = (data, content_type)
+
+    def _generate(self, size: int):
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is not None and self._generate_ffmpeg(ffmpeg, size):
+            self.generated_with = 'ffmpeg'
+        else:
+            self._generate_synthetic(size)
+            self.generated_with = 'synthetic'
+
+    def _generate_synthetic(self, size: int):
+        """Valid-looking MPEG-TS packets. Good enough for byte-level backends."""
+        packets = max(self.segment_count, size // self.ts_packet_size)
+        payload = bytes(self.ts_packet_size - 4)
+        # Sync byte, PID 0x100, payload only with running continuity counter
+        packet_list = [b'\x47\x01\x00' + bytes([0x10 | i]) + payload for i in range(16)]
+        data = b''.join(packet_list[i % 16] for i in range(packets))
+        self._add('media.ts', data, 'video/mp2t')
+        self._add_hls(data, self.ts_packet_size)
+
+    def _generate_ffmpeg(self, ffmpeg: str, size: int) -> bool:
+        """Real A/V stream; bitrate is picked so the file is roughly of the requested size."""
+        duration = 20
+        bitrate = size * 8 // duration
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'media.ts')
+            cmd = [
+                ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y',
+                '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={duration}',
+                '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+                '-c:v', 'mpeg2video', '-b:v', str(bitrate), '-c:a', 'mp2', '-f', 'mpegts', path
+            ]
+            try:
+                subprocess.run(cmd, check=True, timeout=300)
+            except Exception as e:
+                logging.warning(f'Media generation with ffmpeg failed: {e}')
+                return False
+            with open(path, 'rb') as f:
+                data = f.read()
+        self._add('media.ts', data, 'video/mp2t')
+        self._add_hls(data, self.ts_packet_size)
+        return True
+
+    def _add_hls(self, data: bytes, alignment: int):
+        """Cut data into segments at packet boundaries and add a VOD playlist."""
+        seg_len = len(data) // self.segment_count // alignment * alignment
+        playlist = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:2', '#EXT-X-MEDIA-SEQUENCE:0']
+        for i in range(self.segment_count):
+            end = len(data) if i == self.segment_count - 1 else (i + 1) * seg_len
+            self._add(f'seg{i}.ts', data[i * seg_len:end], 'video/mp2t')
+            playlist += ['#EXTINF:2.000,', f'seg{i}.ts']
+        playlist.append('#EXT-X-ENDLIST')
+        self._add('media.m3u8', '\n'.join(playlist).encode() + b'\n', 'application/vnd.apple.mpegurl')
+
+    def add(self, name: str, data: bytes, content_type: str):
+        """Serve other data next to the media, e.g. web pages."""
+        self._add(name, data, content_type)
+
+    def size_of(self, name: str) -> int:
+        return len(self._httpd.files[f'/{name}'][0])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
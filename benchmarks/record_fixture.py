@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import pathlib
+
+from yt_dlp import YoutubeDL
+
+fixtures_dir = pathlib.Path(__file__).parent / 'fixtures'
+
+
+def main():
+    """Record extract_info output of a URL as a fixture for the offline benchmarks."""
+    parser = argparse.ArgumentParser(description='Record extractor fixture.', prog='record_fixture')
+    parser.add_argument('url', metavar='URL')
+    parser.add_argument('name', metavar='NAME', help='fixture name without extension')
+    args = parser.parse_args()
+
+    with YoutubeDL({'noplaylist': True, 'quiet': True}) as ytdl:
+        info = ytdl.sanitize_info(ytdl.extract_info(url=args.url, download=False))
+    # Not used by Info and only bloats the fixture
+    for key in ('thumbnails', 'automatic_captions', 'subtitles', 'heatmap', 'requested_formats'):
+        info.pop(key, None)
+    for fmt in info.get('formats') or []:
+        fmt.pop('fragments', None)
+        fmt.pop('http_headers', None)
+
+    path = fixtures_dir / f'{args.name}.json'
+    path.write_text(json.dumps(info, indent=1))
+    print(f'Recorded {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import statistics
+import time
+from typing import Callable
+
+
+def measure(fn: Callable, repeat: int = 5, number: int = 1) -> dict:
+    """Return per-call wall time statistics in seconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.mean(samples),
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def measure_once(fn: Callable) -> dict:
+    """Time single call of a function whose side effects can't be repeated."""
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return {'min': elapsed, 'median': elapsed, 'mean': elapsed, 'repeat': 1, 'number': 1}
@@ -4,9 +4,11 @@ import argparse
 import logging
 import sys
 
-from PyQt5.QtWidgets import QApplication
+from ytdl_qt import metrics, single_instance
+from ytdl_qt.profiling import profiler
 
-from ytdl_qt.qt_mainwindow import MainWindow
+# Qt and yt-dlp are imported on demand: handing URLs over
+# to a running instance must not pay for them
 
 
 def main():
@@ -14,21 +16,132 @@ def main():
 
 	parser = argparse.ArgumentParser(description='GUI for youtube-dl.', prog='ytdl-qt.py')
 	parser.add_argument('-d', help='debug', action='store_true')
-	parser.add_argument('url', metavar='URL', nargs='?')
+	parser.add_argument('-b', '--batch', help='download URLs without GUI using the format policy', action='store_true')
+	parser.add_argument('-p', '--policy', help='format policy, overrides the saved one')
+	parser.add_argument(
+		'--clip',
+		help='in batch mode download only this time range of the videos, e.g. 1:20:00-1:25:30',
+		metavar='START-END'
+	)
+	parser.add_argument(
+		'--daemon',
+		help='run without GUI and serve the local HTTP API for scripts on PORT (default 8765)',
+		nargs='?',
+		const=8765,
+		type=int,
+		metavar='PORT'
+	)
+	parser.add_argument(
+		'-s', '--single-instance',
+		help='pass URLs to the already running instance if there is one',
+		action='store_true'
+	)
+	parser.add_argument(
+		'--metrics-out',
+		help='export task metrics on exit (.json, .csv, otherwise prometheus text)',
+		metavar='FILE'
+	)
+	parser.add_argument(
+		'--trace-out',
+		help='export Chrome trace-event JSON of the recent spans on exit',
+		metavar='FILE'
+	)
+	parser.add_argument(
+		'--profile',
+		help='profile the session or a single operation with cProfile',
+		nargs='?',
+		const=profiler.Scopes.session,
+		choices=profiler.Scopes.all,
+		metavar='SCOPE'
+	)
+	parser.add_argument(
+		'--trace-malloc',
+		help='trace allocations of the session or a single operation with tracemalloc',
+		nargs='?',
+		const=profiler.Scopes.session,
+		choices=profiler.Scopes.all,
+		metavar='SCOPE'
+	)
+	parser.add_argument('url', metavar='URL', nargs='*')
 	args = parser.parse_args()
 
 	if args.d:
 		logging.getLogger().setLevel(level='DEBUG')
 
+	if args.single_instance and not args.batch and single_instance.forward(args.url):
+		sys.exit(0)
+
+	if (args.profile or args.trace_malloc) and not args.d:
+		# Report where the dumps went
+		logging.getLogger().setLevel(level='INFO')
+
+	profiler.configure(args.profile, args.trace_malloc)
+	profiler.start_session()
+	try:
+		sys.exit(run(args, parser))
+	finally:
+		profiler.stop_session()
+
+
+def run(args, parser) -> int:
+	"""Run batch or GUI session. Return exit code."""
+	from ytdl_qt.engine import engine
+	from ytdl_qt.format_policy import FormatPolicy
+	from ytdl_qt.settings import Settings
+
+	if args.batch or args.daemon is not None:
+		settings = Settings()
+		try:
+			policy = FormatPolicy.parse(args.policy) if args.policy is not None else settings.format_policy.get_policy()
+		except Exception as e:
+			parser.error(str(e))
+
+		if args.daemon is not None:
+			from ytdl_qt import daemon
+
+			ret = daemon.run(settings, policy, args.daemon)
+			export(args)
+			return ret
+
+		from ytdl_qt.batch import BatchRunner
+		from ytdl_qt.clip_range import ClipRange
+
+		try:
+			clip = ClipRange.parse(args.clip) if args.clip else None
+		except Exception as e:
+			parser.error(str(e))
+		failed = BatchRunner(settings, policy, clip).run(args.url)
+		engine.stop()
+		export(args)
+		return 1 if failed else 0
+
+	from PyQt5.QtWidgets import QApplication
+	from ytdl_qt.qt_mainwindow import MainWindow
+	from ytdl_qt.qt_single_instance import SingleInstanceServer
+
 	app = QApplication(sys.argv)
 
 	w = MainWindow()
 	w.show()
+	if args.single_instance:
+		server = SingleInstanceServer(w)
+		server.urls_received.connect(w.open_urls)
+		server.listen()
 	if args.url:
-		w.ui.urlEdit.setText(args.url)
-		w.download_info(args.url)
+		w.open_urls(args.url)
+
+	ret = app.exec()
+	engine.stop()
+	export(args)
+	return ret
+
 
-	sys.exit(app.exec())
+def export(args):
+	if args.metrics_out:
+		metrics.registry.export(args.metrics_out)
+	if args.trace_out:
+		from ytdl_qt.tracing import tracer
+		tracer.export(args.trace_out)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import logging
+from typing import Callable, Dict, List, Optional
+
+from ytdl_qt import executables, utils
+from ytdl_qt.core_params import CoreParams
+from ytdl_qt.downloader_abstract import DownloaderAbstract
+from ytdl_qt.executors.downloader_aria2c import DownloaderAria2c
+from ytdl_qt.executors.downloader_ffmpeg import DownloaderFfmpeg
+from ytdl_qt.executors.downloader_ytdl import DownloaderYtdl
+from ytdl_qt.ytdl_info import Info
+
+
+class Backend:
+    """
+    Downloader with the protocols it handles and their relative cost,
+    i.e. expected transfer time per byte. Lower is faster.
+    """
+
+    def __init__(self, name: str, downloader_cls, protocol_costs: Dict[str, float], strength: str,
+                 default_cost: Optional[float] = None, parallel_inputs: bool = False, merge_cost: float = 0.0,
+                 clips: bool = True, segmented: bool = False, chunked: bool = False,
+                 check: Optional[Callable[[CoreParams, int], Optional[str]]] = None):
+        self.name = name
+        self.downloader_cls = downloader_cls
+        self.protocol_costs = protocol_costs
+        self.strength = strength
+        self.default_cost = default_cost  # for protocols not listed, None if unsupported
+        self.parallel_inputs = parallel_inputs  # formats are fetched at the same time
+        self.merge_cost = merge_cost  # of a separate merge pass after the transfer
+        self.clips = clips
+        self.segmented = segmented  # costs assume byte ranges fetched over several connections
+        self.chunked = chunked  # honours http_chunk_size of the formats
+        self._check = check
+
+    def get_protocol_cost(self, protocol: str) -> Optional[float]:
+        return self.protocol_costs.get(protocol, self.default_cost)
+
+    def unavailable_reason(self, params: CoreParams, format_count: int, chunked: bool = False) -> Optional[str]:
+        """
+        Return why the backend can't run with these params, or None if it can.
+        chunked tells that the formats want requests of http_chunk_size.
+        """
+        if params.clip is not None and not self.clips:
+            return "can't cut clips"
+        if chunked and not self.chunked:
+            # The server throttles or drops transfers requested otherwise
+            return 'ignores http_chunk_size'
+        return self._check(params, format_count) if self._check is not None else None
+
+    def estimate_cost(self, protocols: List[str], range_support: Optional[List[Optional[bool]]] = None) -> Optional[float]:
+        """
+        Return cost of downloading formats of the protocols or None if one isn't supported.
+        Formats known to refuse byte ranges are fetched over one connection by segmented backends.
+        """
+        costs = [self.get_protocol_cost(i) for i in protocols]
+        if not costs or None in costs:
+            return None
+        if self.segmented and range_support:
+            costs = [max(c, 1.0) if r is False else c for c, r in zip(costs, range_support)]
+        cost = max(costs) if self.parallel_inputs else sum(costs)
+        if len(costs) > 1:
+            cost += self.merge_cost
+        return cost
+
+    def create(self, params: CoreParams, ytdl_info: Info) -> DownloaderAbstract:
+        return self.downloader_cls(params, ytdl_info)
+
+
+class BackendChoice:
+
+    def __init__(self, backend: Backend, reason: str):
+        self.backend = backend
+        self.reason = reason
+
+
+class BackendRegistry:
+    """Known backends by name, with selection of the cheapest one for the formats."""
+
+    def __init__(self):
+        self._backends: Dict[str, Backend] = {}
+
+    def register(self, backend: Backend):
+        self._backends[backend.name] = backend
+
+    def get(self, name: str) -> Backend:
+        """Throws exception on unknown name."""
+        try:
+            return self._backends[name]
+        except KeyError:
+            raise Exception(f'Unknown backend {name}, use one of {", ".join(self._backends)}')
+
+    def names(self) -> List[str]:
+        return list(self._backends)
+
+    def choose(self, params: CoreParams, ytdl_info: Info) -> BackendChoice:
+        """Return the cheapest backend that can download the selected formats. Throws exception if none can."""
+        protocols = ytdl_info.get_protocol_list(params.fmt_id_selection)
+        range_support = ytdl_info.get_range_support(params.fmt_id_selection)
+        chunked = ytdl_info.get_chunked(params.fmt_id_selection)
+        costs = {}
+        rejected = []
+        for backend in self._backends.values():
+            reason = backend.unavailable_reason(params, len(protocols), chunked)
+            cost = backend.estimate_cost(protocols, range_support) if reason is None else None
+            if reason is None and cost is None:
+                reason = f'no {"/".join(sorted(set(protocols)))} support'
+            if reason is not None:
+                rejected.append(f'{backend.name} {reason}')
+            else:
+                costs[backend.name] = cost
+        if not costs:
+            raise Exception(f'No backend for these formats: {"; ".join(rejected)}')
+        # Registration order breaks ties
+        name = min(costs, key=costs.get)
+        backend = self._backends[name]
+        reason = f'{"+".join(protocols)}: {backend.strength}'
+        if False in range_support:
+            reason += ', no byte ranges on the server'
+        if chunked:
+            reason += ', formats fetched in chunks'
+        others = [f'{i} {c / costs[name]:.1f}x' for i, c in costs.items() if i != name]
+        if others:
+            reason += f' (vs {", ".join(others)})'
+        if rejected:
+            reason += f'; {", ".join(rejected)}'
+        logging.debug(f'Backend {name}: {reason}')
+        return BackendChoice(backend, reason)
+
+
+def _check_ffmpeg(params: CoreParams, format_count: int) -> Optional[str]:
+    if not params.ffmpeg_path or not utils.check_ffmpeg(params.ffmpeg_path):
+        return 'not configured'
+    return None
+
+
+def _check_aria2c(params: CoreParams, format_count: int) -> Optional[str]:
+    exe = executables.registry.get_aria2c()
+    if exe is None or not exe.usable():
+        return 'not installed'
+    if format_count > 1 and not utils.check_ffmpeg(params.ffmpeg_path):
+        return 'needs ffmpeg to merge'
+    return None
+
+
+registry = BackendRegistry()
+registry.register(Backend(
+    'ytdl', DownloaderYtdl, {}, 'native downloader of the extractor',
+    # Handles every protocol the extractor reports, one format after another.
+    # Always available as the fallback, without ffmpeg formats are left unmerged.
+    default_cost=1.0, merge_cost=0.3, chunked=True))
+registry.register(Backend(
+    'ffmpeg', DownloaderFfmpeg,
+    # Keeps connections alive between HLS segments
+    {'http': 1.0, 'https': 1.0, 'm3u8': 0.8, 'm3u8_native': 0.8, 'rtmp': 1.0, 'rtmps': 1.0, 'rtsp': 1.0},
+    'reads all formats at once and muxes in the same pass',
+    parallel_inputs=True, check=_check_ffmpeg))
+registry.register(Backend(
+    'aria2', DownloaderAria2c, {'http': 0.4, 'https': 0.4, 'ftp': 0.5},
+    'multiple connections per file',
+    parallel_inputs=True, merge_cost=0.3, clips=False, segmented=True, check=_check_aria2c))
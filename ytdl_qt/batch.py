@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from yt_dlp import YoutubeDL
+
+from ytdl_qt.clip_range import ClipRange
+from ytdl_qt.core import Core
+from ytdl_qt.download_archive import archive
+from ytdl_qt.engine import engine
+from ytdl_qt.format_policy import FormatPolicy
+from ytdl_qt.settings import Settings
+
+
+class BatchRunner(Core):
+    """
+    Headless download of URLs and playlists with formats picked by a policy.
+    Info of the next playlist entries is extracted while one downloads.
+    """
+
+    resolve_ahead = 8  # entries extracted ahead of the one downloading
+
+    def __init__(self, settings: Settings, policy: FormatPolicy, clip: Optional[ClipRange] = None):
+        super().__init__()
+        self._policy = policy
+        self._finished = threading.Event()
+        self._signal: Tuple[bool, str] = (True, '')
+
+        self.apply_settings(settings)
+        self.set_clip(clip)
+
+    def expand_url(self, url: str) -> List[Tuple[str, Optional[str]]]:
+        """
+        Return urls of playlist entries or the url itself, each with
+        its download archive key if it's known before extraction.
+        """
+        with YoutubeDL({'extract_flat': 'in_playlist', 'quiet': True}) as ytdl:
+            info = ytdl.extract_info(url=url, download=False)
+        if info.get('_type') == 'playlist':
+            # Same as the key of the selection, see get_archive_key
+            selection = f'policy:{self._policy}'
+            if self.params.clip is not None:
+                selection += f' clip:{self.params.clip}'
+            entries = []
+            for i in info.get('entries') or []:
+                key = None
+                if i.get('ie_key') and i.get('id'):
+                    key = archive.make_key(i['ie_key'], i['id'], selection)
+                entries.append((i.get('webpage_url') or i['url'], key))
+            return entries
+        return [(url, None)]
+
+    def task_finished_cb(self, signal: Tuple[bool, str]) -> None:
+        self._signal = signal
+        self._finished.set()
+
+    def show_msg_cb(self, msg: str) -> None:
+        logging.info(msg)
+
+    def run_one(self, url: str, archive_key: Optional[str] = None,
+                info_future: Optional[concurrent.futures.Future] = None) -> bool:
+        """
+        Download single video unless it's archived. Blocks until finished.
+        info_future is an extraction started in advance.
+        """
+        if archive_key is not None and archive_key in archive:
+            print(f'{url}: already downloaded')
+            return True
+        if info_future is not None:
+            self.set_info(info_future.result())
+        else:
+            self.download_info(url)
+        selection = self.select_formats(self._policy)
+        if self.get_archived() is not None:
+            print(f'{self.get_title()}: already downloaded')
+            return True
+        print(f'{self.get_title()}: {selection.explain()}')
+
+        self._finished.clear()
+        choice = self.download_auto()
+        print(f'{self.get_title()}: {choice.backend.name}, {choice.reason}')
+        self._finished.wait()
+        success, error = self._signal
+        if not success:
+            print(f'{url}: {error}')
+        return success
+
+    def run(self, url_list: List[str]) -> int:
+        """Return number of failed downloads."""
+        failed = 0
+        entries: List[Tuple[str, Optional[str]]] = []
+        for url in url_list:
+            try:
+                entries += self.expand_url(url)
+            except Exception as e:
+                print(f'{url}: {e}')
+                failed += 1
+        resolving: Dict[str, concurrent.futures.Future] = {}
+        for index, (entry, archive_key) in enumerate(entries):
+            for ahead, ahead_key in entries[index:index + self.resolve_ahead]:
+                if ahead not in resolving and (ahead_key is None or ahead_key not in archive):
+                    resolving[ahead] = engine.submit(self.extract(ahead))
+            try:
+                if not self.run_one(entry, archive_key, resolving.pop(entry, None)):
+                    failed += 1
+            except Exception as e:
+                print(f'{entry}: {e}')
+                failed += 1
+        return failed
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import hashlib
+import logging
+import os
+from typing import Optional
+
+
+class Checksum:
+    """Digest fed incrementally with the bytes of a file."""
+
+    # Algorithm -> sidecar suffix, files check with sha256sum -c and b2sum -c
+    algorithms = {'sha256': '.sha256', 'blake2b': '.b2'}
+    read_size = 1024 * 1024
+
+    def __init__(self, algorithm: str):
+        if algorithm not in self.algorithms:
+            raise Exception(f'Unknown checksum algorithm {algorithm}, use one of {", ".join(self.algorithms)}')
+        self.algorithm = algorithm
+        self._hash = hashlib.new(algorithm)
+        self.size = 0
+        self.path: Optional[str] = None  # file the digest is complete for
+
+    def update(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def get_sidecar_path(self) -> str:
+        assert self.path is not None
+        return self.path + self.algorithms[self.algorithm]
+
+    def write_sidecar(self) -> str:
+        """Write the digest next to the file in coreutils format. Return sidecar path."""
+        sidecar = self.get_sidecar_path()
+        with open(sidecar, 'w') as f:
+            f.write(f'{self.hexdigest()}  {os.path.basename(self.path)}\n')
+        return sidecar
+
+    @classmethod
+    def of_file(cls, algorithm: str, path: str) -> 'Checksum':
+        """Read the whole file. Only for outputs that couldn't be hashed while written."""
+        checksum = cls(algorithm)
+        with open(path, 'rb') as f:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            while True:
+                data = f.read(cls.read_size)
+                if not data:
+                    break
+                checksum.update(data)
+        checksum.path = path
+        logging.debug(f'Hashed {path} after writing')
+        return checksum
+
+
+class FileFollower:
+    """
+    Hashes a file another writer appends to, right behind the writer, so the
+    bytes come from the page cache instead of a second read of the finished file.
+    Gives up if the file shrinks, i.e. the writer started over.
+    """
+
+    def __init__(self, algorithm: str, path: str):
+        self.path = path
+        self.checksum: Optional[Checksum] = Checksum(algorithm)
+        try:
+            # Keeps following the file if the writer renames it
+            self._fd: Optional[int] = os.open(path, os.O_RDONLY)
+        except OSError as e:
+            logging.debug(f'Not following {path}: {e}')
+            self._fd = None
+            self.checksum = None
+
+    def feed(self):
+        """Hash what has been appended since the last call."""
+        if self._fd is None:
+            return
+        end = os.fstat(self._fd).st_size
+        if end < self.checksum.size:
+            logging.debug(f'{self.path} was truncated, checksum has to be computed later')
+            self.close()
+            self.checksum = None
+            return
+        while self.checksum.size < end:
+            data = os.pread(self._fd, min(Checksum.read_size, end - self.checksum.size), self.checksum.size)
+            if not data:
+                break
+            self.checksum.update(data)
+
+    def finish(self, path: str) -> Optional[Checksum]:
+        """Hash the rest and return the digest of the file, now at path, or None."""
+        self.feed()
+        self.close()
+        if self.checksum is not None:
+            self.checksum.path = path
+        return self.checksum
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import re
+from typing import List, Optional
+
+
+class ClipRange:
+    """
+    Time interval of a video to download instead of the whole of it.
+    String form START-END with times as [[H:]M:]S, e.g. 1:20:00-1:25:30.
+    Either side may be left out: -5:00 is the first five minutes.
+    """
+
+    time_re = re.compile(r'^(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d*)?)$')
+
+    def __init__(self, start: float = 0.0, end: Optional[float] = None):
+        if start < 0 or (end is not None and end <= start):
+            raise Exception('Clip has to end after it starts')
+        self.start = start
+        self.end = end  # None for the end of the video
+
+    @classmethod
+    def parse(cls, text: str) -> Optional['ClipRange']:
+        """Return None for an empty string. Throws exception on malformed range."""
+        text = text.strip()
+        if not text:
+            return None
+        start, sep, end = text.partition('-')
+        if not sep:
+            raise Exception(f'Clip range "{text}" has no "-" between start and end')
+        if not start.strip() and not end.strip():
+            raise Exception('Clip range needs a start or an end')
+        return cls(cls.parse_time(start) if start.strip() else 0.0,
+                   cls.parse_time(end) if end.strip() else None)
+
+    @classmethod
+    def parse_time(cls, text: str) -> float:
+        match = cls.time_re.match(text.strip())
+        if match is None:
+            raise Exception(f'Malformed time "{text.strip()}", use [[H:]M:]S')
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds)
+
+    @staticmethod
+    def format_time(seconds: float, sep: str = ':') -> str:
+        whole = int(seconds)
+        text = f'{whole // 3600}{sep}{whole // 60 % 60:02}{sep}{whole % 60:02}'
+        fraction = seconds - whole
+        if fraction:
+            text += f'{fraction:.3f}'.rstrip('0')[1:]
+        return text
+
+    def __str__(self):
+        end = self.format_time(self.end) if self.end is not None else ''
+        return f'{self.format_time(self.start)}-{end}'
+
+    def get_label(self) -> str:
+        """Filename-safe form, to tell clips apart from the whole video and each other."""
+        end = self.format_time(self.end, '.') if self.end is not None else 'end'
+        return f'{self.format_time(self.start, ".")}-{end}'
+
+    def get_duration(self, total: Optional[float]) -> Optional[float]:
+        """Return length of the clip within a video of total seconds, None if unknown."""
+        end = self.end
+        if total is not None:
+            end = min(end, total) if end is not None else total
+        return max(0.0, end - self.start) if end is not None else None
+
+    def check(self, total: Optional[float]):
+        """Throws exception if the clip is outside of a video of total seconds."""
+        if total is not None and self.start >= total:
+            raise Exception(f'Clip starts at {self.format_time(self.start)}, '
+                            f'the video is {self.format_time(total)} long')
+
+    def ffmpeg_input_args(self) -> List[str]:
+        """
+        Options for every ffmpeg input. Seeking on the input makes ffmpeg request
+        byte ranges or skip playlist segments instead of reading from the start.
+        """
+        args = ['-ss', str(self.start)]
+        if self.end is not None:
+            args += ['-to', str(self.end)]
+        return args
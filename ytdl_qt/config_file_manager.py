@@ -13,6 +13,16 @@ class ConfigFileManager:
         self.player_path: str = ''
         self.player_params: str = ''
         self.download_dir: str = ''
+        self.scratch_dir: str = ''
+        self.checksum: str = ''
+        self.ytdl_process: str = ''
+        self.extract_processes: str = ''
+        self.format_policy: str = ''
+        self.probe_formats: str = ''
+        self.timeshift_minutes: str = ''
+        self.segment_minutes: str = ''
+        self.retention_hours: str = ''
+        self.retention_gb: str = ''
 
         self.read(path)
 
@@ -26,11 +36,41 @@ class ConfigFileManager:
             self.ffmpeg_path = self.core['Paths'].get('ffmpeg_path', '')
             self.player_path = self.core['Paths'].get('player_path', '')
             self.download_dir = self.core['Paths'].get('download_dir', '')
+            self.scratch_dir = self.core['Paths'].get('scratch_dir', '')
 
             self.player_params = self.core['Paths'].get('player_params', '')
         except KeyError:
             pass
 
+        try:
+            self.format_policy = self.core['Formats'].get('format_policy', '')
+            self.probe_formats = self.core['Formats'].get('probe', '')
+        except KeyError:
+            pass
+
+        try:
+            self.checksum = self.core['Integrity'].get('checksum', '')
+        except KeyError:
+            pass
+
+        try:
+            self.ytdl_process = self.core['Downloads'].get('ytdl_process', '')
+            self.extract_processes = self.core['Downloads'].get('extract_processes', '')
+        except KeyError:
+            pass
+
+        try:
+            self.timeshift_minutes = self.core['Streaming'].get('timeshift_minutes', '')
+        except KeyError:
+            pass
+
+        try:
+            self.segment_minutes = self.core['Recording'].get('segment_minutes', '')
+            self.retention_hours = self.core['Recording'].get('retention_hours', '')
+            self.retention_gb = self.core['Recording'].get('retention_gb', '')
+        except KeyError:
+            pass
+
     def save(self, path=None):
         assert self.core
         if not path:
@@ -41,6 +81,26 @@ class ConfigFileManager:
             'player_path': '' if not self.player_path else self.player_path,
             'player_params': '' if not self.player_params else self.player_params,
             'download_dir': '' if not self.download_dir else self.download_dir,
+            'scratch_dir': '' if not self.scratch_dir else self.scratch_dir,
+        }
+        self.core['Formats'] = {
+            'format_policy': '' if not self.format_policy else self.format_policy,
+            'probe': '' if not self.probe_formats else self.probe_formats,
+        }
+        self.core['Integrity'] = {
+            'checksum': '' if not self.checksum else self.checksum,
+        }
+        self.core['Downloads'] = {
+            'ytdl_process': '' if not self.ytdl_process else self.ytdl_process,
+            'extract_processes': '' if not self.extract_processes else self.extract_processes,
+        }
+        self.core['Streaming'] = {
+            'timeshift_minutes': '' if not self.timeshift_minutes else self.timeshift_minutes,
+        }
+        self.core['Recording'] = {
+            'segment_minutes': '' if not self.segment_minutes else self.segment_minutes,
+            'retention_hours': '' if not self.retention_hours else self.retention_hours,
+            'retention_gb': '' if not self.retention_gb else self.retention_gb,
         }
 
         if not path.is_file():
@@ -1,20 +1,25 @@
 #!/usr/bin/env python3
 
+import copy
 import logging
+import shlex
 import subprocess
-from enum import Enum, auto
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import os
 
 from ytdl_qt.executor_abstract import ExecutorAbstract
 from ytdl_qt.streamer_abstract import StreamerAbstract
 from ytdl_qt.downloader_abstract import DownloaderAbstract
 from ytdl_qt.executors.streamer_ffmpeg import StreamerFfmpeg
-from ytdl_qt.executors.downloader_aria2c import DownloaderAria2c
-from ytdl_qt.executors.downloader_ffmpeg import DownloaderFfmpeg
-from ytdl_qt.executors.downloader_ytdl import DownloaderYtdl
+from ytdl_qt import backends
 from ytdl_qt.ytdl_info import Info
 from ytdl_qt.core_params import CoreParams
+from ytdl_qt.format_policy import FormatPolicy
+from ytdl_qt.settings import Settings
+from ytdl_qt.clip_range import ClipRange
+from ytdl_qt.engine import engine
+from ytdl_qt.download_archive import archive
+from ytdl_qt.tracing import tracer
 
 
 class Callbacks:
@@ -22,6 +27,9 @@ class Callbacks:
 	def task_finished_cb(self, signal: Tuple[bool, str]) -> None:
 		pass
 
+	def info_loaded_cb(self, signal: Tuple[bool, str]) -> None:
+		pass
+
 	def playback_enabled_cb(self) -> None:
 		pass
 
@@ -40,16 +48,18 @@ class Callbacks:
 
 class Core(Callbacks):
 
-	class DownloaderType(Enum):
-		YTDL = auto()
-		FFMPEG = auto()
-		ARIA2 = auto()
+	auto_backend = 'auto'
 
 	def __init__(self):
 		self.ytdl_info = None
 		self.downloader = None
 		self.streamer_list = []
 		self.d_blocked = False
+		self.info_task = None
+		self.download_task = None
+		# Format selection as recorded in the download archive
+		self.selection_label = 'best'
+		self.archive_key: Optional[str] = None
 
 		self.params = CoreParams()
 		self.params.ytdl_params = {
@@ -59,7 +69,36 @@ class Core(Callbacks):
 		}
 
 	def download_info(self, url: str) -> None:
-		self.ytdl_info = Info(url)
+		"""Blocking version of load_info."""
+		info = Info(url)
+		if self.params.probe_formats:
+			info.probe()
+		self.set_info(info)
+
+	def load_info(self, url: str) -> None:
+		"""Extract info in the engine. Calls info_loaded_cb when done."""
+
+		def done(future):
+			if future.cancelled():
+				return
+			try:
+				self.set_info(future.result())
+				signal = (True, '')
+			except Exception as e:
+				signal = (False, str(e))
+			self.info_loaded_cb(signal)
+
+		self.info_task = engine.submit(self.extract(url), done)
+
+	def extract(self, url: str):
+		"""Return engine coroutine extracting info of the url with the current params."""
+		return engine.extract(url, probe=self.params.probe_formats, processes=self.params.extract_processes)
+
+	def is_info_loading(self) -> bool:
+		return self.info_task is not None and not self.info_task.done()
+
+	def set_info(self, info: Info) -> None:
+		self.ytdl_info = info
 		self.params.file_for_playback = None
 
 	def get_info(self):
@@ -79,36 +118,89 @@ class Core(Callbacks):
 
 	def set_format(self, fmt_id_list: List[str]) -> None:
 		self.params.fmt_id_selection = fmt_id_list
+		self.selection_label = '+'.join(fmt_id_list) if fmt_id_list else 'best'
 		#self.ytdl_info.set_format(fmt_id_list)
 
-	def download_with_ffmpeg(self) -> None:
-		self.download_target(self.DownloaderType.FFMPEG)
-
-	def download_with_ytdl(self) -> None:
-		self.download_target(self.DownloaderType.YTDL)
-
-	def download_with_aria2(self) -> None:
-		self.download_target(self.DownloaderType.ARIA2)
-
-	def download_target(self, d_type: DownloaderType) -> None:
-		"""Run selected downloader."""
-
-		if d_type is self.DownloaderType.YTDL:
-			self.downloader = DownloaderYtdl(self.params, self.ytdl_info)
-		elif d_type is self.DownloaderType.FFMPEG:
-			self.downloader = DownloaderFfmpeg(self.params, self.ytdl_info)
-		elif d_type is self.DownloaderType.ARIA2:
-			self.downloader = DownloaderAria2c(self.params, self.ytdl_info)
+	def select_formats(self, policy: FormatPolicy) -> FormatPolicy.Selection:
+		"""Pick formats according to the policy and use them for the next task."""
+		with tracer.span('select_formats', 'core', policy=str(policy)):
+			selection = policy.select(self.ytdl_info.get_formats(), self.ytdl_info.get_duration())
+		logging.debug(f'Policy selection {selection.fmt_id_list}: {selection.explain()}')
+		self.set_format(selection.fmt_id_list)
+		self.selection_label = f'policy:{policy}'
+		return selection
+
+	def get_archive_key(self) -> str:
+		selection = self.selection_label
+		if self.params.clip is not None:
+			selection += f' clip:{self.params.clip}'
+		return archive.make_key(self.ytdl_info.get_extractor(), self.ytdl_info.get_video_id(), selection)
+
+	def get_archived(self) -> Optional[dict]:
+		"""Return download archive record of the current video and selection or None."""
+		return archive.get(self.get_archive_key())
+
+	def download_with_ffmpeg(self, force: bool = False) -> None:
+		self.download_target('ffmpeg', force)
+
+	def download_with_ytdl(self, force: bool = False) -> None:
+		self.download_target('ytdl', force)
+
+	def download_with_aria2(self, force: bool = False) -> None:
+		self.download_target('aria2', force)
+
+	def choose_backend(self, fmt_id_list: Optional[List[str]] = None) -> backends.BackendChoice:
+		"""
+		Return the fastest backend for the selected formats, or for the given ones
+		without selecting them. Throws exception if none can download them.
+		"""
+		params = self.params
+		if fmt_id_list is not None:
+			params = copy.copy(self.params)
+			params.fmt_id_selection = fmt_id_list
+		return backends.registry.choose(params, self.ytdl_info)
+
+	def download_auto(self, force: bool = False) -> backends.BackendChoice:
+		"""Run the backend picked by choose_backend and return the choice."""
+		choice = self.choose_backend()
+		self.download_target(choice.backend.name, force)
+		return choice
+
+	def download_target(self, name: str, force: bool = False) -> None:
+		"""
+		Run backend of the name or the automatically chosen one.
+		Throws exception if archived unless forced.
+		"""
+		if name == self.auto_backend:
+			self.download_auto(force)
+			return
+		clip = self.params.clip
+		if clip is not None:
+			clip.check(self.ytdl_info.get_duration())
+		self.archive_key = self.get_archive_key()
+		if not force:
+			record = archive.get(self.archive_key)
+			if record is not None:
+				raise Exception(f"Already downloaded to {record['path']}")
+
+		self.downloader = backends.registry.get(name).create(self.params, self.ytdl_info)
 
 		self.connect_downloader(self.downloader)
 		self.d_blocked = True
-		self.downloader.download_start()
+		size = self.ytdl_info.estimate_size(self.params.fmt_id_selection)
+		duration = self.ytdl_info.get_duration()
+		if size is not None and clip is not None and duration:
+			# Only the part covering the clip is fetched
+			size = int(size * clip.get_duration(duration) / duration)
+		self.download_task = engine.submit(engine.download(self.downloader, size=size))
 
 	def stream_target(self) -> None:
-		self.streamer_list.append(StreamerFfmpeg(self.params, self.ytdl_info))
-		self.connect_streamer(self.streamer_list[-1])
-		# self.streamer_list[-1].stream_start()
-		self.streamer_list[-1].stream_start_detached()
+		streamer = StreamerFfmpeg(self.params, self.ytdl_info)
+		self.streamer_list.append(streamer)
+		self.connect_streamer(streamer)
+		# Timeshift needs the relay to live as long as the player, latency is measured while it plays
+		detached = not self.params.timeshift_minutes and not streamer.is_low_latency()
+		engine.submit(engine.stream(streamer, detached=detached))
 
 	def play_target(self) -> None:
 		assert self.params.file_for_playback
@@ -118,7 +210,7 @@ class Core(Callbacks):
 		)
 
 	def download_cancel(self) -> None:
-		self.downloader.download_cancel()
+		self.download_task.cancel()
 
 	def connect_downloader(self, downloader: DownloaderAbstract) -> None:
 		downloader.set_progress_max_cb = self.set_progress_max_cb
@@ -140,6 +232,14 @@ class Core(Callbacks):
 	def task_finished(self, sender: ExecutorAbstract) -> None:
 		self.d_blocked = False
 		signal = (False if sender.error else True, sender.error)
+		if sender is self.downloader and not sender.error and sender.metrics.status == 'finished':
+			try:
+				fields = {}
+				if sender.checksum is not None:
+					fields[sender.checksum.algorithm] = sender.checksum.hexdigest()
+				archive.add(self.archive_key, sender.ytdl_info.get_title(), self.params.file_for_playback, **fields)
+			except Exception as e:
+				logging.warning(f'Couldn\'t update download archive: {e}')
 		self.task_finished_cb(signal)
 
 	def set_ffmpeg_path(self, path: str) -> None:
@@ -150,6 +250,30 @@ class Core(Callbacks):
 		logging.debug(f'Setting download directory: {path}')
 		self.params.download_dir = path
 
+	def set_scratch_dir(self, path: str) -> None:
+		logging.debug(f'Setting scratch directory: {path}')
+		self.params.scratch_dir = path
+
+	def set_clip(self, clip: Optional[ClipRange]) -> None:
+		logging.debug(f'Setting clip range: {clip}')
+		self.params.clip = clip
+
+	def set_ytdl_process(self, enabled: bool) -> None:
+		logging.debug(f'Setting youtube-dl worker process: {enabled}')
+		self.params.ytdl_process = enabled
+
+	def set_extract_processes(self, enabled: bool) -> None:
+		logging.debug(f'Setting extraction processes: {enabled}')
+		self.params.extract_processes = enabled
+
+	def set_probe_formats(self, enabled: bool) -> None:
+		logging.debug(f'Setting format probing: {enabled}')
+		self.params.probe_formats = enabled
+
+	def set_checksum(self, algorithm: str) -> None:
+		logging.debug(f'Setting checksum algorithm: {algorithm}')
+		self.params.checksum = algorithm
+
 	def set_player_path(self, path: str) -> None:
 		logging.debug(f'Setting player path: {path}')
 		self.params.player_path = path
@@ -157,3 +281,35 @@ class Core(Callbacks):
 	def set_player_params(self, params: List[str]) -> None:
 		logging.debug(f'Setting player params: {params}')
 		self.params.player_params = params
+
+	def set_timeshift_minutes(self, minutes: int) -> None:
+		logging.debug(f'Setting timeshift: {minutes} min')
+		self.params.timeshift_minutes = minutes
+
+	def set_low_latency(self, enabled: bool) -> None:
+		logging.debug(f'Setting low-latency live profile: {enabled}')
+		self.params.low_latency = enabled
+
+	def set_recording(self, segment_minutes: int, retention_hours: int, retention_gb: int) -> None:
+		"""Segment length of live recordings and limits of kept segments, 0 is off."""
+		logging.debug(f'Setting recording: {segment_minutes} min segments, {retention_hours} h, {retention_gb} GB')
+		self.params.segment_minutes = segment_minutes
+		self.params.retention_hours = retention_hours
+		self.params.retention_gb = retention_gb
+
+	def apply_settings(self, settings: Settings) -> None:
+		"""Take over the saved settings, same in the GUI, batch and daemon modes."""
+		self.set_ffmpeg_path(settings.ffmpeg_path.current)
+		self.set_download_dir(settings.download_dir.current)
+		self.set_scratch_dir(settings.scratch_dir.current)
+		self.set_checksum(settings.checksum.current)
+		self.set_ytdl_process(settings.ytdl_process.get_value())
+		self.set_extract_processes(settings.extract_processes.get_value())
+		self.set_probe_formats(settings.probe_formats.get_value())
+		self.set_player_path(settings.player_path.current)
+		self.set_player_params(shlex.split(settings.player_params.current))
+		self.set_timeshift_minutes(settings.timeshift_minutes.get_minutes())
+		self.set_recording(
+			settings.segment_minutes.get_value(),
+			settings.retention_hours.get_value(),
+			settings.retention_gb.get_value())
@@ -3,8 +3,19 @@ class CoreParams:
     def __init__(self):
         self.player_path = None
         self.download_dir = None
+        self.scratch_dir = None  # staging of partial files, off if empty
+        self.ytdl_process = False  # youtube-dl downloads in a worker process, killed on cancel
+        self.checksum = ''  # algorithm of checksums of finished files, off if empty
         self.player_params = None
         self.ffmpeg_path = None
         self.file_for_playback = None
         self.fmt_id_selection = []
+        self.extract_processes = False  # info extraction in worker processes
+        self.probe_formats = False  # ask format URLs for sizes and range support
+        self.clip = None  # ClipRange, the whole video if None
+        self.timeshift_minutes = 0
+        self.low_latency = True  # low-latency profile for streaming live video
+        self.segment_minutes = 0
+        self.retention_hours = 0
+        self.retention_gb = 0
         self.ytdl_params: dict = {}
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+import itertools
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from ytdl_qt import backends
+from ytdl_qt.clip_range import ClipRange
+from ytdl_qt.core import Core
+from ytdl_qt.engine import engine
+from ytdl_qt.format_policy import FormatPolicy
+from ytdl_qt.paths import Paths
+from ytdl_qt.settings import Settings
+
+
+class Job(Core):
+    """One submitted URL: extraction, format selection by policy and download."""
+
+    class States:
+
+        extracting = 'extracting'
+        downloading = 'downloading'
+        finished = 'finished'
+        skipped = 'skipped'  # already in the download archive
+        error = 'error'
+        cancelled = 'cancelled'
+
+        final = [finished, skipped, error, cancelled]
+
+    progress_interval = 0.5  # s between progress events of a job
+
+    def __init__(self, daemon, job_id: int, url: str, policy: FormatPolicy, backend: str, force: bool,
+                 clip: Optional[ClipRange]):
+        super().__init__()
+        self._daemon = daemon
+        self.id = job_id
+        self.url = url
+        self.policy = policy
+        self.backend = backend
+        self.force = force
+        self.set_clip(clip)
+        self.state = self.States.extracting
+        self.title = ''
+        self.selection = ''
+        self.backend_reason = ''
+        self.progress: Optional[int] = None
+        self.message = ''
+        self.error = ''
+        self.created = time.time()
+        self._cancel_flag = False
+        self._last_progress = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'url': self.url,
+            'title': self.title,
+            'state': self.state,
+            'policy': str(self.policy),
+            'backend': self.backend,
+            'backend_reason': self.backend_reason,
+            'clip': str(self.params.clip) if self.params.clip is not None else None,
+            'selection': self.selection,
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'path': self.params.file_for_playback,
+            'created': self.created,
+        }
+
+    def _set_state(self, state: str, error: str = ''):
+        self.state = state
+        self.error = error
+        self._daemon.publish('state', self)
+
+    def start(self):
+        self.load_info(self.url)
+
+    def cancel(self) -> bool:
+        """Return False if the job is already over."""
+        if self.state in self.States.final:
+            return False
+        self._cancel_flag = True
+        if self.download_task is not None:
+            self.download_cancel()
+        elif self.info_task is not None:
+            self.info_task.cancel()
+            self._set_state(self.States.cancelled)
+        return True
+
+    def info_loaded_cb(self, signal: Tuple[bool, str]) -> None:
+        success, error = signal
+        if not success:
+            self._set_state(self.States.error, error)
+            return
+        if self._cancel_flag:
+            self._set_state(self.States.cancelled)
+            return
+        try:
+            self.title = self.get_title()
+            self.selection = self.select_formats(self.policy).explain()
+            record = self.get_archived() if not self.force else None
+            if record is not None:
+                self.params.file_for_playback = record.get('path')
+                self._set_state(self.States.skipped)
+                return
+            if self.backend == self.auto_backend:
+                choice = self.choose_backend()
+                self.backend_reason = choice.reason
+                self.download_target(choice.backend.name, force=True)
+            else:
+                self.download_target(self.backend, force=True)
+        except Exception as e:
+            self._set_state(self.States.error, str(e))
+            return
+        self._set_state(self.States.downloading)
+
+    def set_progress_val_cb(self, val: int) -> None:
+        self.progress = val
+        now = time.monotonic()
+        if now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self._daemon.publish('progress', self)
+
+    def show_msg_cb(self, msg: str) -> None:
+        self.message = msg
+
+    def task_finished_cb(self, signal: Tuple[bool, str]) -> None:
+        success, error = signal
+        if self.downloader.metrics.status == 'cancelled':
+            self._set_state(self.States.cancelled)
+        elif success:
+            self.progress = 100
+            self._set_state(self.States.finished)
+        else:
+            self._set_state(self.States.error, error)
+
+
+class Daemon:
+    """
+    Keeps the engine, the info cache and warm YoutubeDL instances around
+    between submissions. Jobs run concurrently within the engine's limits.
+    """
+
+    max_finished_jobs = 1000  # oldest finished jobs are forgotten beyond this
+    subscriber_queue_size = 1000  # events, slower subscribers are dropped
+    stop_timeout = 5  # s for cancelled jobs to stop their downloaders
+
+    def __init__(self, settings: Settings, policy: FormatPolicy):
+        self._settings = settings
+        self._policy = policy
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._subscribers: List[queue.Queue] = []
+
+    def submit(self, url: str, policy: Optional[str] = None, backend: str = Core.auto_backend, force: bool = False,
+               clip: Optional[str] = None) -> Job:
+        """Throws exception on malformed policy or clip range, or unknown backend."""
+        if backend != Core.auto_backend:
+            backends.registry.get(backend)
+        job_policy = FormatPolicy.parse(policy) if policy is not None else self._policy
+        job_clip = ClipRange.parse(clip) if clip else None
+        with self._lock:
+            job = Job(self, next(self._ids), url, job_policy, backend, force, job_clip)
+            job.apply_settings(self._settings)
+            self._jobs[job.id] = job
+            self._forget_finished()
+        self.publish('submitted', job)
+        job.start()
+        return job
+
+    def _forget_finished(self):
+        finished = [i for i in self._jobs.values() if i.state in Job.States.final]
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def subscribe(self) -> queue.Queue:
+        q = queue.Queue(self.subscriber_queue_size)
+        with self._lock:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def stop(self):
+        """Cancel unfinished jobs, so no ffmpeg or aria2c outlives the daemon, and stop the engine."""
+        for job in self.list():
+            job.cancel()
+        deadline = time.monotonic() + self.stop_timeout
+        while any(i.state not in Job.States.final for i in self.list()):
+            if time.monotonic() > deadline:
+                logging.warning('Jobs didn\'t stop in time')
+                break
+            time.sleep(0.1)
+        engine.stop()
+
+    def publish(self, event: str, job: Job):
+        data = {'event': event, 'job': job.as_dict()}
+        with self._lock:
+            for q in list(self._subscribers):
+                try:
+                    q.put_nowait(data)
+                except queue.Full:
+                    logging.warning('Dropping event subscriber that doesn\'t keep up')
+                    self._subscribers.remove(q)
+                    # Make room for the end marker
+                    q.get_nowait()
+                    q.put_nowait(None)
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    GET /jobs, POST /jobs, GET /jobs/ID, DELETE /jobs/ID and GET /events
+    (server-sent events). Every request needs the daemon token as a bearer token.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    job_path = re.compile(r'^/jobs/(\d+)$')
+    keepalive_interval = 15  # s, comment lines on an idle event stream
+    max_body = 1024 * 1024
+
+    def log_message(self, fmt, *args):
+        logging.debug(fmt % args)
+
+    def _send_json(self, code: int, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, code: int, msg: str):
+        self._send_json(code, {'error': msg})
+
+    def _authorized(self) -> bool:
+        expected = f'Bearer {self.server.token}'
+        if secrets.compare_digest(self.headers.get('Authorization', ''), expected):
+            return True
+        self._error(401, 'Missing or wrong token')
+        return False
+
+    def _read_json(self):
+        """Return request body object or None after sending an error."""
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self._error(400, 'Malformed Content-Length')
+            return None
+        if length > self.max_body:
+            self._error(413, 'Request too large')
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            self._error(400, f'Malformed JSON: {e}')
+            return None
+        if not isinstance(body, dict):
+            self._error(400, 'Body has to be a JSON object')
+            return None
+        return body
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        daemon: Daemon = self.server.daemon
+        if self.path == '/jobs':
+            self._send_json(200, [i.as_dict() for i in daemon.list()])
+        elif self.path == '/events':
+            self._stream_events()
+        else:
+            match = self.job_path.match(self.path)
+            job = daemon.get(int(match[1])) if match else None
+            if job is None:
+                self._error(404, 'No such job')
+            else:
+                self._send_json(200, job.as_dict())
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path != '/jobs':
+            self._error(404, 'Not found')
+            return
+        body = self._read_json()
+        if body is None:
+            return
+        urls = body.get('urls') or ([body['url']] if body.get('url') else [])
+        if not urls or not isinstance(urls, list) or not all(isinstance(i, str) for i in urls):
+            self._error(400, 'Give url or a list of urls')
+            return
+        try:
+            jobs = [self.server.daemon.submit(
+                url, body.get('policy'), body.get('backend', Core.auto_backend), bool(body.get('force')), body.get('clip'))
+                for url in urls]
+        except Exception as e:
+            self._error(400, str(e))
+            return
+        self._send_json(201, [i.as_dict() for i in jobs])
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        match = self.job_path.match(self.path)
+        job = self.server.daemon.get(int(match[1])) if match else None
+        if job is None:
+            self._error(404, 'No such job')
+        elif not job.cancel():
+            self._error(409, f'Job is {job.state}')
+        else:
+            self._send_json(202, job.as_dict())
+
+    def _stream_events(self):
+        daemon: Daemon = self.server.daemon
+        q = daemon.subscribe()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                try:
+                    data = q.get(timeout=self.keepalive_interval)
+                except queue.Empty:
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                if data is None:
+                    break
+                self.wfile.write(f"event: {data['event']}\ndata: {json.dumps(data['job'])}\n\n".encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            daemon.unsubscribe(q)
+
+
+def load_token() -> str:
+    """Return the API token, created on first use and readable by the user only."""
+    path = Paths.get_daemon_token_path()
+    try:
+        token = path.read_text().strip()
+        if token:
+            return token
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token + '\n')
+    return token
+
+
+def run(settings: Settings, policy: FormatPolicy, port: int, host: str = '127.0.0.1') -> int:
+    """Serve the API until interrupted. Return exit code."""
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.daemon = Daemon(settings, policy)
+    server.token = load_token()
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f'Listening on http://{server.server_address[0]}:{server.server_address[1]}, '
+          f'token in {Paths.get_daemon_token_path()}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.daemon.stop()
+    return 0
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import errno
+import logging
+import os
+import shutil
+import threading
+from typing import List, Optional, Tuple
+
+from ytdl_qt import metrics
+from ytdl_qt.utils import convert_size
+
+
+class Reservation:
+    """Space promised to a task. Shrinks as the task reports received bytes."""
+
+    def __init__(self, manager, device: int, size: int, task: Optional[metrics.TaskMetrics]):
+        self._manager = manager
+        self.device = device
+        self.size = size
+        self._task = task
+
+    def outstanding(self) -> int:
+        received = self._task.get_bytes_received() if self._task is not None else 0
+        return max(0, self.size - received)
+
+    def release(self):
+        self._manager.release(self)
+
+
+class DiskSpace:
+    """
+    Admission control for downloads. Every admitted task reserves its estimated
+    size on the device of its download directory, the next task has to fit
+    into the free space left after all outstanding reservations.
+    """
+
+    margin = 256 * 1024 * 1024  # B left free for everything else
+    merge_factor = 2  # merged inputs stay on disk until the output is written
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reservations: List[Reservation] = []
+
+    @staticmethod
+    def _existing_dir(directory: str) -> str:
+        """Return directory or its closest existing parent."""
+        path = os.path.abspath(directory or '.')
+        while not os.path.isdir(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        return path
+
+    @classmethod
+    def device(cls, directory: str) -> int:
+        return os.stat(cls._existing_dir(directory)).st_dev
+
+    @classmethod
+    def required(cls, size: int, input_count: int) -> int:
+        return size * cls.merge_factor if input_count > 1 else size
+
+    def try_reserve(self, directory: str, size: int,
+                    task: Optional[metrics.TaskMetrics] = None) -> Optional[Reservation]:
+        """
+        Reserve size bytes in directory. Return None if the space is held by
+        other reservations, throw exception if it won't fit even without them.
+        """
+        path = self._existing_dir(directory)
+        device = self.device(path)
+        free = shutil.disk_usage(path).free
+        with self._lock:
+            reserved = sum(r.outstanding() for r in self._reservations if r.device == device)
+            if size + self.margin > free:
+                raise Exception(
+                    f'Not enough disk space in {path}: '
+                    f'{convert_size(size)} needed, {convert_size(free)} free')
+            if size + self.margin > free - reserved:
+                logging.debug(f'Deferring {size} B, {reserved} B reserved on device {device}')
+                return None
+            reservation = Reservation(self, device, size, task)
+            self._reservations.append(reservation)
+        logging.debug(f'Reserved {size} B in {path}')
+        return reservation
+
+    def try_reserve_all(self, wanted: List[Tuple[str, int, Optional[metrics.TaskMetrics]]]) \
+            -> Optional[List[Reservation]]:
+        """try_reserve every (directory, size, task), all or none of them."""
+        reservations = []
+        try:
+            for directory, size, task in wanted:
+                reservation = self.try_reserve(directory, size, task)
+                if reservation is None:
+                    break
+                reservations.append(reservation)
+            else:
+                return reservations
+        except BaseException:
+            for reservation in reservations:
+                reservation.release()
+            raise
+        for reservation in reservations:
+            reservation.release()
+        return None
+
+    def release(self, reservation: Reservation):
+        with self._lock:
+            if reservation in self._reservations:
+                self._reservations.remove(reservation)
+
+    def get_reserved(self) -> int:
+        with self._lock:
+            return sum(r.outstanding() for r in self._reservations)
+
+
+def preallocate(fd: int, size: int) -> bool:
+    """
+    Allocate size bytes for a file we write ourselves, so it fails early on
+    ENOSPC and isn't fragmented. The file grows to size, truncate it when done.
+    Return False where unsupported, throw OSError if the space isn't there.
+    """
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError as e:
+        if e.errno in (errno.ENOSPC, errno.EDQUOT):
+            raise
+        # EOPNOTSUPP on some filesystems
+        logging.debug(f'posix_fallocate failed: {e}')
+        return False
+    return True
+
+
+disk_space = DiskSpace()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import struct
+import threading
+import time
+from typing import Iterable, Optional
+
+from ytdl_qt.paths import Paths
+
+
+class BloomFilter:
+    """Set membership with false positives only. Stored as a small header and the bit array."""
+
+    header = struct.Struct('<QII')  # bits, hashes, count
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        # Double hashing, one digest gives both hashes
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def save(self, path: str):
+        # Other processes sharing the archive may save at the same time
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.header.pack(self.bits, self.hashes, self.count))
+            f.write(self._array)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, capacity: int):
+        """Throws exception on missing or damaged file."""
+        with open(path, 'rb') as f:
+            bits, hashes, count = cls.header.unpack(f.read(cls.header.size))
+            array = bytearray(f.read())
+        if len(array) != (bits + 7) // 8:
+            raise ValueError('Truncated bloom filter')
+        bloom = cls.__new__(cls)
+        bloom.capacity = capacity
+        bloom.bits = bits
+        bloom.hashes = hashes
+        bloom.count = count
+        bloom._array = array
+        return bloom
+
+
+class DownloadArchive:
+    """
+    Record of finished downloads keyed by extractor, video id and format selection.
+    Records live in an SQLite file in WAL mode, shared by every running instance
+    (GUI, batch and daemon). A Bloom filter in front of it answers most lookups
+    of new videos without a query. Records are never deleted, so rowids grow
+    by one and the filter covers the first count of them; records added by
+    other processes are caught up with whenever the database changes.
+    """
+
+    initial_capacity = 10000
+    busy_timeout = 10  # s, waiting for a write of another process
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._bloom: Optional[BloomFilter] = None
+        self._data_version: Optional[int] = None
+
+    @staticmethod
+    def make_key(extractor: str, video_id: str, selection: str) -> str:
+        return f'{extractor.lower()} {video_id} {selection}'
+
+    def _get_path(self) -> str:
+        return str(self._path if self._path is not None else Paths.get_archive_path())
+
+    def _open(self):
+        if self._db is not None:
+            self._catch_up()
+            return
+        path = self._get_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Calls are serialized by the lock, any thread may use the connection
+        self._db = sqlite3.connect(path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS records (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        count = self._count()
+        try:
+            self._bloom = BloomFilter.load(path + '.bloom', self.initial_capacity)
+            if self._bloom.count > count:
+                raise ValueError('Bloom filter is ahead of the archive')
+            self._bloom.capacity = max(self.initial_capacity, count * 2)
+        except (OSError, ValueError, struct.error) as e:
+            logging.debug(f'Rebuilding archive bloom filter: {e}')
+            self._rebuild(max(self.initial_capacity, count * 2))
+        self._catch_up()
+
+    def _count(self) -> int:
+        return self._db.execute('SELECT count(*) FROM records').fetchone()[0]
+
+    def _catch_up(self):
+        """Add records written since the filter was saved, also by other processes."""
+        version = self._db.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        rows = self._db.execute('SELECT key FROM records WHERE rowid > ? ORDER BY rowid', (self._bloom.count,))
+        added = False
+        for key, in rows:
+            self._bloom.add(key)
+            added = True
+        if not added:
+            return
+        if self._bloom.count > self._bloom.capacity:
+            self._rebuild(self._bloom.count * 2)
+        else:
+            self._bloom.save(self._get_path() + '.bloom')
+
+    def _rebuild(self, capacity: int):
+        self._bloom = BloomFilter(capacity)
+        for key, in self._db.execute('SELECT key FROM records ORDER BY rowid'):
+            self._bloom.add(key)
+        self._bloom.save(self._get_path() + '.bloom')
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return record of the download or None."""
+        with self._lock:
+            self._open()
+            if key not in self._bloom:
+                return None
+            row = self._db.execute('SELECT value FROM records WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def add(self, key: str, title: str = '', path: Optional[str] = None, **fields):
+        """Record finished download. Extra fields are stored with the record."""
+        record = {'title': title, 'path': path, 'time': time.time()}
+        record.update(fields)
+        value = json.dumps(record)
+        with self._lock:
+            self._open()
+            with self._db:
+                self._db.execute('BEGIN IMMEDIATE')
+                # Keeps the rowid of an existing record, see the class docstring
+                if self._db.execute('UPDATE records SET value = ? WHERE key = ?', (value, key)).rowcount == 0:
+                    self._db.execute('INSERT INTO records (key, value) VALUES (?, ?)', (key, value))
+            # data_version only tells about commits of other connections
+            self._data_version = None
+            self._catch_up()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+                self._data_version = None
+
+
+archive = DownloadArchive()
@@ -1,14 +1,28 @@
 #!/usr/bin/env python3
 
+import asyncio
+import logging
+import os
+import threading
 from abc import abstractmethod
+from typing import Callable, Optional
 
+from ytdl_qt.checksum import Checksum
+from ytdl_qt.engine import engine
 from ytdl_qt.executor_abstract import ExecutorAbstract
+from ytdl_qt.staging import Staging
 
 
 class DownloaderAbstract(ExecutorAbstract):
 
+    threaded: bool = False  # True if the work is done in a thread of its own, profiled there
+
     def __init__(self, params, ytdl_info):
         super().__init__(params, ytdl_info)
+        self.staging: Optional[Staging] = Staging(params.scratch_dir) if params.scratch_dir else None
+        self.checksum: Optional[Checksum] = None  # of the finished file
+        self._finalize_task = None
+        self._finalize_cancelled = threading.Event()  # stops a commit between copied chunks
 
     @abstractmethod
     def download_start(self):
@@ -20,3 +34,91 @@ class DownloaderAbstract(ExecutorAbstract):
 
     def file_ready_for_playback_cb(self, path: str):
         pass
+
+    def get_output_name(self) -> str:
+        """Filename without extension, clips are named after their range."""
+        name = self.ytdl_info.get_filename()
+        if self.params.clip is not None:
+            name += f' [{self.params.clip.get_label()}]'
+        return name
+
+    def get_work_dir(self) -> str:
+        """Directory to write partial files into."""
+        return self.staging.get_dir() if self.staging is not None else self.params.download_dir
+
+    def needs_finalizing(self) -> bool:
+        return self.staging is not None or bool(self.params.checksum)
+
+    def finalize_file(self, path: str, checksum: Optional[Checksum] = None) -> str:
+        """
+        Move finished file into the download directory and record its checksum.
+        checksum is the digest computed while the file was written, if any.
+        Return the final path. Blocks, meant for a post-processing slot.
+        """
+        algorithm = self.params.checksum
+        if self.staging is not None:
+            copied = Checksum(algorithm) if algorithm and checksum is None else None
+            path = self.staging.commit(path, self.params.download_dir, copied, self._finalize_cancelled)
+            if copied is not None and copied.path is not None:
+                checksum = copied
+            elif checksum is not None:
+                checksum.path = path
+        if algorithm and checksum is None:
+            # Written by a muxer that seeks back, nothing else to do but read it
+            checksum = Checksum.of_file(algorithm, path)
+        if checksum is not None:
+            checksum.write_sidecar()
+            self.checksum = checksum
+        return path
+
+    def _finalize(self, path: str, done_cb: Callable[[Optional[str], str], None]):
+        """
+        finalize_file in a post-processing slot, after giving up the network slot.
+        done_cb gets the final path, or None and the error.
+        """
+        if not self.needs_finalizing():
+            done_cb(path, '')
+            return
+        self.transfer_finished_cb(self)
+        self.send_msg_cb('Finishing file')
+
+        def finished(future):
+            if future.cancelled():
+                return
+            try:
+                final = future.result()
+            except Exception as e:
+                done_cb(None, str(e))
+                return
+            done_cb(final, '')
+
+        self._finalize_task = engine.submit(self._finalize_in_slot(path), finished)
+
+    async def _finalize_in_slot(self, path: str) -> str:
+        try:
+            return await engine.postprocess(self.finalize_file, path)
+        except asyncio.CancelledError:
+            # postprocess returns once the thread has, nothing writes to the directory now
+            if self.staging is not None:
+                self.staging.cleanup()
+            raise
+
+    def _keep_staged(self, path: str, error: str) -> str:
+        """
+        Leave the file of a failed commit in the scratch directory, it's complete.
+        Return error with where the file is.
+        """
+        if self.staging is None or not os.path.exists(path):
+            return error
+        logging.warning(f'Keeping {path}: {error}')
+        # Nothing removes the directory now
+        self.staging = None
+        return f'{error}. The file is kept in {path}'
+
+    def _discard_staged(self):
+        self._finalize_cancelled.set()
+        if self._finalize_task is not None and not self._finalize_task.done():
+            # Cleans up when the commit has stopped
+            self._finalize_task.cancel()
+        elif self.staging is not None:
+            self.staging.cleanup()
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import weakref
+from typing import Callable, Coroutine, Dict, List, Optional
+
+from ytdl_qt import utils
+from ytdl_qt.disk_space import Reservation, disk_space
+from ytdl_qt.executor_abstract import ExecutorAbstract
+from ytdl_qt.extract_pool import extract_pool
+from ytdl_qt.info_cache import info_cache
+from ytdl_qt.process_supervisor import supervisor
+from ytdl_qt.profiling import profiler
+from ytdl_qt.tracing import tracer
+from ytdl_qt.ytdl_info import Info
+
+
+class _ThreadPool(concurrent.futures.ThreadPoolExecutor):
+    """Cancels queued calls on shutdown, shutdown(cancel_futures=True) needs Python 3.9."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending = weakref.WeakSet()
+
+    def submit(self, *args, **kwargs) -> concurrent.futures.Future:
+        future = super().submit(*args, **kwargs)
+        self._pending.add(future)
+        return future
+
+    def shutdown(self, wait: bool = True):
+        # Running calls can't be cancelled and finish on their own
+        for future in list(self._pending):
+            future.cancel()
+        super().shutdown(wait)
+
+
+class Engine:
+    """
+    asyncio loop in a background thread running extraction, download, stream
+    and merge tasks. Callers submit coroutines from any thread and get
+    concurrent.futures.Future objects back. Results reach the GUI through
+    the usual callbacks, which marshal themselves to the Qt thread.
+
+    Extraction, network transfers and post-processing have separate concurrency
+    limits, waiting tasks only cost a coroutine. A download leaves its slot once
+    it calls transfer_finished_cb, so merging doesn't hold up the next transfer.
+
+    Prefetches run one at a time in their own low priority thread and never
+    take an extraction slot. An interactive extraction of a URL that is being
+    prefetched waits for the prefetch instead of starting another one.
+    """
+
+    max_extractions = 4
+    max_downloads = 2
+    max_postprocessing = max(1, (os.cpu_count() or 2) // 2)
+    space_poll_interval = 2  # s, while waiting for disk space
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._extract_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._postprocess_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._extractions: Optional[asyncio.Semaphore] = None
+        self._downloads: Optional[asyncio.Semaphore] = None
+        self._postprocessing: Optional[asyncio.Semaphore] = None
+        self._prefetch_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._prefetching: Dict[str, asyncio.Future] = {}
+        self._busy = 0  # interactive extractions and running executors
+        self._last_activity = 0.0  # monotonic time of the last interactive request
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._extract_pool = _ThreadPool(self.max_extractions, thread_name_prefix='Extract')
+            self._postprocess_pool = _ThreadPool(self.max_postprocessing, thread_name_prefix='Postprocess')
+            self._prefetch_pool = _ThreadPool(
+                1, thread_name_prefix='Prefetch', initializer=self._lower_thread_priority)
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name='Engine', daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run(self, ready: threading.Event):
+        asyncio.set_event_loop(self._loop)
+
+        async def init():
+            # Semaphores are bound to the loop they are first used in
+            self._extractions = asyncio.Semaphore(self.max_extractions)
+            self._downloads = asyncio.Semaphore(self.max_downloads)
+            self._postprocessing = asyncio.Semaphore(self.max_postprocessing)
+            ready.set()
+
+        self._loop.run_until_complete(init())
+        self._loop.run_forever()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._extract_pool.shutdown(wait=False)
+            self._postprocess_pool.shutdown(wait=False)
+            self._prefetch_pool.shutdown(wait=False)
+            extract_pool.shutdown()
+            self._thread = None
+
+    def submit(self, coro: Coroutine, done_cb: Optional[Callable[[concurrent.futures.Future], None]] = None) \
+            -> concurrent.futures.Future:
+        """Schedule coroutine from any thread. done_cb is called from the engine thread."""
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        if done_cb is not None:
+            future.add_done_callback(done_cb)
+        return future
+
+    @staticmethod
+    def _lower_thread_priority():
+        # Linux keeps a nice value per thread
+        if sys.platform.startswith('linux'):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+            except OSError as e:
+                logging.debug(f'Couldn\'t lower prefetch thread priority: {e}')
+
+    def _mark_activity(self):
+        self._last_activity = time.monotonic()
+
+    def is_idle(self, idle_delay: float) -> bool:
+        """True if nothing interactive runs or was requested for idle_delay seconds."""
+        return self._busy == 0 and time.monotonic() - self._last_activity >= idle_delay
+
+    async def extract(self, url: str, ytdl_params=None, timeout: Optional[float] = None,
+                      probe: bool = False, processes: bool = False) -> Info:
+        """
+        Extract info in the pool. Timed out extraction is abandoned, not interrupted.
+        With default parameters a cached or prefetching Info is used if there is one.
+        With probe the format URLs are probed for sizes and range support once.
+        With processes extraction runs in extract_pool instead of a thread.
+        """
+        self._mark_activity()
+        self._busy += 1
+        try:
+            info = await self._get_info(url, ytdl_params, timeout, processes)
+            if probe and not info.probed:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self._extract_pool, info.probe)
+            return info
+        finally:
+            self._busy -= 1
+            self._mark_activity()
+
+    async def _get_info(self, url: str, ytdl_params, timeout: Optional[float], processes: bool) -> Info:
+        if ytdl_params is None:
+            info = info_cache.get(url)
+            if info is not None:
+                logging.debug(f'Info of {url} served from cache')
+                return info
+            prefetch = self._prefetching.get(url)
+            if prefetch is not None:
+                try:
+                    return await asyncio.wait_for(asyncio.shield(prefetch), timeout)
+                except asyncio.TimeoutError:
+                    raise
+                except Exception as e:
+                    logging.debug(f'Prefetch of {url} failed, extracting again: {e}')
+        if processes:
+            # The pool limits concurrency by its number of workers
+            with tracer.span('extract', 'info', url=url, process=True):
+                payload, elapsed = await asyncio.wait_for(
+                    asyncio.wrap_future(extract_pool.submit(url, ytdl_params)), timeout)
+            info = Info.from_extraction(url, payload, elapsed, ytdl_params)
+        else:
+            async with self._extractions:
+                loop = asyncio.get_running_loop()
+                info = await asyncio.wait_for(
+                    loop.run_in_executor(self._extract_pool, Info, url, ytdl_params), timeout)
+        if ytdl_params is None:
+            info_cache.put(url, info)
+        return info
+
+    async def prefetch(self, url: str) -> Info:
+        """Extract info into the cache at low priority. Throws exception on failure."""
+        if url in self._prefetching:
+            return await asyncio.shield(self._prefetching[url])
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._prefetch_pool, Info, url, None)
+        self._prefetching[url] = future
+        try:
+            info = await asyncio.shield(future)
+            info_cache.put(url, info)
+            return info
+        finally:
+            del self._prefetching[url]
+
+    async def _reserve_space(self, executor: ExecutorAbstract, size: int) -> List[Reservation]:
+        """Wait until the download fits next to other queued ones. Throws exception if it never will."""
+        params = executor.params
+        input_count = len(params.fmt_id_selection)
+        # Staged downloads need the space on the scratch device first
+        wanted = [(params.scratch_dir or params.download_dir, disk_space.required(size, input_count), executor.metrics)]
+        if params.scratch_dir and disk_space.device(params.scratch_dir) != disk_space.device(params.download_dir):
+            # and then for the copy of the final file, which received bytes don't shrink
+            wanted.append((params.download_dir, size, None))
+        reservations = disk_space.try_reserve_all(wanted)
+        if reservations is None:
+            executor.send_msg_cb('Waiting for disk space')
+            while reservations is None:
+                await asyncio.sleep(self.space_poll_interval)
+                reservations = disk_space.try_reserve_all(wanted)
+        return reservations
+
+    async def _refresh_urls(self, executor: ExecutorAbstract):
+        """Renew expired format URLs for backends that use them directly."""
+        fmt_ids = executor.params.fmt_id_selection
+        if not executor.uses_format_urls or not executor.ytdl_info.is_expired(fmt_ids):
+            return
+        executor.send_msg_cb('Refreshing expired URLs')
+        span = tracer.begin('refresh_urls', 'engine', task=executor.metrics.task_id)
+        try:
+            async with self._extractions:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self._extract_pool, executor.ytdl_info.refresh_expired, fmt_ids)
+        finally:
+            span.end()
+
+    async def _run_executor(self, executor: ExecutorAbstract, start: Callable[[], None],
+                            cancel: Callable[[], None], semaphore: Optional[asyncio.Semaphore],
+                            timeout: Optional[float], size: Optional[int] = None):
+        """Await callback-driven executor until it calls finished_cb."""
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        finished_cb = executor.finished_cb
+
+        def set_done():
+            if not done.done():
+                done.set_result(None)
+
+        def finished(sender: ExecutorAbstract):
+            loop.call_soon_threadsafe(set_done)
+            finished_cb(sender)
+
+        transfer_done = loop.create_future()
+
+        def set_transfer_done():
+            if not transfer_done.done():
+                transfer_done.set_result(None)
+
+        def transfer_finished(sender: ExecutorAbstract):
+            loop.call_soon_threadsafe(set_transfer_done)
+
+        executor.finished_cb = finished
+        executor.transfer_finished_cb = transfer_finished
+        started = False
+        reservations = []
+        self._mark_activity()
+        self._busy += 1
+        # Time spent waiting for disk space and a slot
+        queued = tracer.begin('queued', 'engine', task=executor.metrics.task_id)
+        try:
+            if size is not None:
+                reservations = await self._reserve_space(executor, size)
+            if semaphore is not None:
+                await semaphore.acquire()
+            queued.end()
+            try:
+                await self._refresh_urls(executor)
+                started = True
+                start()
+                await asyncio.wait_for(
+                    asyncio.wait([done, transfer_done], return_when=asyncio.FIRST_COMPLETED), timeout)
+            finally:
+                if semaphore is not None:
+                    semaphore.release()
+            # Post-processing, if any, doesn't count against the timeout
+            await done
+        except asyncio.CancelledError:
+            if started:
+                cancel()
+            else:
+                executor.metrics.finish(cancelled=True)
+                executor.send_msg_cb('Cancelled')
+                finished(executor)
+            raise
+        except asyncio.TimeoutError:
+            logging.debug(f'{type(executor).__name__} timed out after {timeout} s')
+            executor.error = 'Timed out'
+            cancel()
+        except Exception as e:
+            # Refused admission or failed to start
+            executor.error = str(e)
+            executor.metrics.finish(error=executor.error)
+            executor.send_msg_cb('Error')
+            finished(executor)
+        finally:
+            queued.end()
+            for reservation in reservations:
+                reservation.release()
+            self._busy -= 1
+            self._mark_activity()
+        return executor
+
+    async def download(self, downloader, timeout: Optional[float] = None, size: Optional[int] = None):
+        """
+        Run downloader in a download slot until it finishes.
+        Estimated size in bytes is reserved on the target device first.
+        """
+
+        def start():
+            if downloader.threaded:
+                downloader.download_start()
+                return
+            with profiler.operation(profiler.Scopes.download):
+                downloader.download_start()
+
+        return await self._run_executor(
+            downloader, start, downloader.download_cancel, self._downloads, timeout, size)
+
+    async def stream(self, streamer, detached: bool = True):
+        """Start streamer. Detached stream isn't tracked past the spawn."""
+        if detached:
+            try:
+                await self._refresh_urls(streamer)
+            except Exception as e:
+                # Stale URLs may still work, let ffmpeg try
+                logging.warning(f'Couldn\'t refresh URLs: {e}')
+            streamer.stream_start_detached()
+            return streamer
+        return await self._run_executor(streamer, streamer.stream_start, lambda: None, None, None)
+
+    async def merge(self, ffmpeg_path: str, input_list: List[str], output_file: str,
+                    timeout: Optional[float] = None, started_cb: Optional[Callable[[], None]] = None):
+        """
+        Merge inputs into output file with ffmpeg in a post-processing slot.
+        started_cb is called once the slot is taken. Throws exception on failure.
+        """
+        async with self._postprocessing:
+            if started_cb is not None:
+                started_cb()
+            cmd = utils.build_ffmpeg_args_list(input_list, output_file=output_file, quiet=True)
+            logging.debug(f'Merge command line {[ffmpeg_path] + cmd}')
+            loop = asyncio.get_running_loop()
+            exited = loop.create_future()
+
+            def on_exit(returncode: int):
+                loop.call_soon_threadsafe(exited.set_result, returncode)
+
+            # The supervisor waits for it, not a watcher thread of asyncio
+            proc = subprocess.Popen([ffmpeg_path] + cmd)
+            supervisor.watch(proc, on_exit)
+            try:
+                ret = await asyncio.wait_for(asyncio.shield(exited), timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                proc.terminate()
+                await exited
+                raise
+            if ret != 0:
+                raise Exception(f'FFmpeg Error. Exit code {ret}')
+
+    async def postprocess(self, func: Callable, *args):
+        """Run CPU or disk bound function in the post-processing pool."""
+        async with self._postprocessing:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._postprocess_pool, func, *args)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The thread can't be stopped, the slot is taken until it returns
+                await asyncio.wait([future])
+                if not future.cancelled():
+                    future.exception()  # retrieved, it's the cancellation that counts
+                raise
+
+    def acquire_postprocessing_slot(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block the calling thread until a post-processing slot is free. For backends
+        that post-process in their own thread. Not to be called from the engine thread.
+        Return False if no slot was free within timeout seconds.
+        """
+        self._ensure_started()
+        try:
+            asyncio.run_coroutine_threadsafe(
+                asyncio.wait_for(self._postprocessing.acquire(), timeout), self._loop).result()
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def release_postprocessing_slot(self):
+        self._loop.call_soon_threadsafe(self._postprocessing.release)
+
+engine = Engine()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+from typing import Dict, List, Optional
+
+from ytdl_qt.paths import Paths
+
+
+class Executable:
+    """Version and capabilities of an external program."""
+
+    def __init__(self, path: str, mtime: float = 0, size: int = 0):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.version: Optional[str] = None
+        self.muxers: List[str] = []
+        self.protocols: List[str] = []
+        self.options: List[str] = []
+        self.features: List[str] = []
+        self.checked_options: List[str] = []  # ffmpeg options asked for when probed
+        self.player: Optional[str] = None  # mpv, vlc, ffplay or mplayer if recognized
+
+    def usable(self) -> bool:
+        return self.version is not None
+
+    def has_muxer(self, name: str) -> bool:
+        return name in self.muxers
+
+    def has_protocol(self, name: str) -> bool:
+        return name in self.protocols
+
+    def has_option(self, name: str) -> bool:
+        return name in self.options
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+    @staticmethod
+    def from_dict(d: dict):
+        exe = Executable(d['path'], d['mtime'], d['size'])
+        for key in ('version', 'muxers', 'protocols', 'options', 'features', 'checked_options', 'player'):
+            setattr(exe, key, d.get(key, getattr(exe, key)))
+        return exe
+
+
+class ExecutableRegistry:
+    """
+    Resolves ffmpeg, aria2c and the player once per session and probes their
+    capabilities. Probe results are cached on disk keyed by path, mtime and size.
+    """
+
+    probe_timeout = 10  # s
+
+    # ffmpeg AVOptions the backends know how to use
+    ffmpeg_options = [
+        'reconnect',
+        'reconnect_streamed',
+        'reconnect_delay_max',
+        'multiple_requests',
+        'http_persistent',
+        'live_start_index',
+        'http_multiple',
+    ]
+
+    # Version output of known players -> player name
+    player_patterns = [
+        (r'^mpv ', 'mpv'),
+        (r'^VLC (media player|version) ', 'vlc'),
+        (r'^ffplay version ', 'ffplay'),
+        (r'^MPlayer ', 'mplayer'),
+    ]
+
+    def __init__(self, cache_path=None):
+        self._cache_path = cache_path
+        self._lock = threading.Lock()
+        self._probed: Dict[str, Executable] = {}
+        self._cache: Optional[Dict[str, dict]] = None
+
+    def _get_cache_path(self):
+        return self._cache_path if self._cache_path is not None else Paths.get_executables_cache_path()
+
+    def _load_cache(self):
+        if self._cache is not None:
+            return
+        self._cache = {}
+        try:
+            with open(self._get_cache_path()) as f:
+                self._cache = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def _save_cache(self):
+        path = self._get_cache_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(self._cache, f, indent=1)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.warning(f'Couldn\'t save executable cache: {e}')
+
+    def get(self, path: Optional[str]) -> Optional[Executable]:
+        """Return probed executable or None if the file doesn't exist."""
+        if not path:
+            return None
+        if os.path.dirname(path) == '':
+            path = Paths.find_in_path(path)
+            if path is None:
+                return None
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            exe = self._probed.get(path)
+            if exe is not None and exe.mtime == st.st_mtime and exe.size == st.st_size:
+                return exe
+
+            self._load_cache()
+            cached = self._cache.get(path)
+            # Entries probed before options or player detection were added are probed again
+            if cached is not None and cached['mtime'] == st.st_mtime and cached['size'] == st.st_size \
+                    and cached.get('checked_options') == self.ffmpeg_options and 'player' in cached:
+                exe = Executable.from_dict(cached)
+            else:
+                exe = Executable(path, st.st_mtime, st.st_size)
+                self._probe(exe)
+                self._cache[path] = exe.to_dict()
+                self._save_cache()
+            self._probed[path] = exe
+            return exe
+
+    def _run(self, args: List[str]) -> Optional[str]:
+        try:
+            proc = subprocess.run(
+                args,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=self.probe_timeout
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.debug(f'Probe {args} failed: {e}')
+            return None
+        return proc.stdout.decode(errors='replace')
+
+    def _probe(self, exe: Executable):
+        logging.debug(f'Probing {exe.path}')
+        exe.checked_options = list(self.ffmpeg_options)
+        name = os.path.basename(exe.path).lower()
+        if name.startswith('ffmpeg'):
+            self._probe_ffmpeg(exe)
+        elif name.startswith('aria2c'):
+            self._probe_aria2c(exe)
+        else:
+            self._probe_other(exe)
+
+    @staticmethod
+    def _table_names(out: str) -> List[str]:
+        """Parse names from ffmpeg -muxers output (' E mp4    MP4 (MPEG-4 Part 14)')."""
+        names = []
+        for line in out.splitlines():
+            match = re.match(r'^\s*[DE]{1,2}\s+(\S+)\s', line)
+            if match:
+                names += match[1].split(',')
+        return names
+
+    def _probe_ffmpeg(self, exe: Executable):
+        out = self._run([exe.path, '-hide_banner', '-version'])
+        if not out or not out.startswith('ffmpeg version'):
+            return
+        exe.version = out.split()[2]
+
+        out = self._run([exe.path, '-hide_banner', '-muxers'])
+        if out:
+            exe.muxers = self._table_names(out)
+
+        out = self._run([exe.path, '-hide_banner', '-protocols'])
+        if out:
+            # Input section lists protocols one per line
+            section = out.split('Output:')[0]
+            exe.protocols = [i.strip() for i in section.splitlines()[1:] if i.strip() and ':' not in i]
+
+        out = self._run([exe.path, '-hide_banner', '-h', 'full'])
+        if out:
+            exe.options = [i for i in self.ffmpeg_options if re.search(rf'^\s*-{i}\s', out, re.MULTILINE)]
+
+    def _probe_aria2c(self, exe: Executable):
+        out = self._run([exe.path, '--version'])
+        if not out or not out.startswith('aria2 version'):
+            return
+        exe.version = out.split()[2]
+        for line in out.splitlines():
+            if line.startswith('Enabled Features:'):
+                exe.features = [i.strip() for i in line.split(':', 1)[1].split(',')]
+
+    def _probe_other(self, exe: Executable):
+        out = self._run([exe.path, '--version'])
+        if not out or not out.strip():
+            return
+        exe.version = out.strip().splitlines()[0]
+        # VLC may log plugin warnings before the version line
+        for pattern, player in self.player_patterns:
+            match = re.search(pattern, out, re.MULTILINE)
+            if match:
+                exe.player = player
+                exe.version = out[match.start():].splitlines()[0]
+                break
+
+    def get_ffmpeg(self, path: Optional[str] = None) -> Optional[Executable]:
+        return self.get(path if path else Paths.get_ffmpeg_path())
+
+    def get_aria2c(self) -> Optional[Executable]:
+        return self.get(Paths.get_aria2c_exe())
+
+    def get_player(self, path: Optional[str]) -> Optional[Executable]:
+        """Player is whatever the user configured, its player field tells which one it is."""
+        return self.get(path)
+
+
+registry = ExecutableRegistry()
@@ -3,6 +3,7 @@
 from __future__ import annotations  # in 3.10 gets into the mainline
 from abc import ABC, abstractmethod
 
+from ytdl_qt import metrics
 from ytdl_qt.ytdl_info import Info
 from ytdl_qt.core_params import CoreParams
 
@@ -10,12 +11,15 @@ from ytdl_qt.core_params import CoreParams
 class ExecutorAbstract(ABC):
     process_timeout: int = 5000  # ms
     error: str = ''
+    uses_format_urls: bool = True  # False if the backend extracts on its own
 
     def __init__(self, params: CoreParams, ytdl_info: Info):
         assert params is not None
         assert ytdl_info is not None
         self.params: CoreParams = params
         self.ytdl_info: Info = ytdl_info
+        self.metrics: metrics.TaskMetrics = metrics.registry.new_task(
+            type(self).__name__, ytdl_info.get_title(), ytdl_info.extraction_time)
 
     @abstractmethod
     def _setup_ui(self):
@@ -33,5 +37,9 @@ class ExecutorAbstract(ABC):
     def send_msg_cb(self, msg: str):
         pass
 
+    def transfer_finished_cb(self, sender: ExecutorAbstract):
+        """Network part is done, post-processing follows."""
+        pass
+
     def finished_cb(self, sender: ExecutorAbstract):
         pass
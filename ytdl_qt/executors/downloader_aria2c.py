@@ -1,70 +1,125 @@
 #!/usr/bin/env python3
 
+import asyncio
 import logging
 import os
-from typing import List
+import re
+import tempfile
+from typing import Callable, List, Optional
 
 from PyQt5.QtCore import QProcess
 import subprocess
-import threading
 
 from ytdl_qt.paths import Paths
 from ytdl_qt.downloader_abstract import DownloaderAbstract
+from ytdl_qt.engine import engine
+from ytdl_qt.process_supervisor import supervisor
+from ytdl_qt.tracing import tracer
+from ytdl_qt.ytdl_info import Info
 from ytdl_qt import utils
 
 
 class DownloaderAria2c(DownloaderAbstract):
 
+    # [#2089b0 400KiB/33MiB(1%) CN:1 DL:115KiB ETA:4m51s]
+    summary_re = re.compile(r'\[#\w+ ([\d.]+)(\w*)/([\d.]+)(\w*)\((\d+)%\)')
+    units = {'B': 1, '': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4}
+
     def __init__(self, params, ytdl_info):
         super().__init__(params, ytdl_info)
         self._child = None
+        self._exited = False  # _download_finish has been called
         self._cancel_flag = False
-        self._merging = False
+        self._merge_task = None
         self._files_to_merge: List[str] = []
         self._final_filepath: str = ''
+        self._cookie_file: Optional[str] = None
 
     def _setup_ui(self):
-        self.set_progress_max_cb(0)
+        self.set_progress_max_cb(100)
         self.send_msg_cb('Downloading target')
 
+    def _get_ext(self, fmt_id: str) -> str:
+        for fmt in self.ytdl_info.get_formats():
+            if fmt[Info.Keys.id] == fmt_id:
+                return fmt.get('ext', 'mp4')
+        return 'mp4'
+
     def download_start(self):
         """Download with aria2 (doesn't block)."""
         assert self._child is None
         self._setup_ui()
 
+        exe = Paths.get_aria2c_exe()
+        if exe is None:
+            raise Exception('aria2c not found')
+        if self.params.clip is not None:
+            # Mapping times to byte offsets needs the container index, aria2c only sees bytes
+            raise Exception('aria2c can\'t download clips, use ytdl or ffmpeg')
+        download_dir = self.get_work_dir() or os.getcwd()
         cmd = [
-            Paths.get_aria2c_exe(), '-c', '-x', '3', '-k', '1M',
+            exe, '-c', '-x', '3', '-k', '1M', '-d', download_dir,
             '--summary-interval=1', '--enable-color=false', '--file-allocation=falloc'
         ]
 
-        url_list: List[str] = self.ytdl.get_format_url_list()
+        fmts = self.params.fmt_id_selection
+        url_list: List[str] = self.ytdl_info.get_format_url_list(fmts)
+        headers_list = self.ytdl_info.get_http_headers_list(fmts)
+        name = self.ytdl_info.get_filename()
+        cookies = [c for i in self.ytdl_info.get_cookies_list(fmts) for c in i]
+        if cookies:
+            self._cookie_file = self._write_cookie_file(cookies)
+            cmd.append(f'--load-cookies={self._cookie_file}')
 
         aria2_input = ''
         if len(url_list) == 1:
             single = True
-            name, ext = self.ytdl.get_filename()
-            file = name + ext
-            self._final_filepath = file
-            url = ''.join(url_list)
+            file = f'{name}.{self._get_ext(fmts[0]) if fmts else "mp4"}'
+            self._final_filepath = os.path.join(download_dir, file)
             logging.debug(file)
-            cmd += ['-o', f"{file}", f"{url}"]
+            cmd += [f'--header={k}: {v}' for k, v in headers_list[0].items()]
+            cmd += ['-o', file, url_list[0]]
         else:
             single = False
-            name = self.ytdl.get_filename()[0]
-            fmts = self.ytdl.fmt_id_selection
-            for index, url in enumerate(url_list):
-                path = f"{name}.{fmts[index]}.input{index}"
-                aria2_input += url + f"\n out={path}\n"
-                if self.ytdl.get_ffmpeg_path() is not None:
-                    self._files_to_merge.append(path)
+            for fmt_id in fmts:
+                url = self.ytdl_info.get_format_url_list([fmt_id])[0]
+                file = f'{name}.f{fmt_id}.{self._get_ext(fmt_id)}'
+                aria2_input += url + f"\n out={file}\n"
+                for k, v in self.ytdl_info.get_http_headers_list([fmt_id])[0].items():
+                    aria2_input += f" header={k}: {v}\n"
+                self._files_to_merge.append(os.path.join(download_dir, file))
+            if not self.params.ffmpeg_path:
+                # Nothing to merge with, leave the parts as they are
+                self._final_filepath = self._files_to_merge[0]
+                self._files_to_merge = []
             cmd += ['-i', '-']
         logging.debug(f"Command line {' '.join(cmd)}")
 
-        # If you use this, comment out self.wait() at the top of self._download_finish
         # self.exec_qprocess_download(cmd, single, aria2_input)
 
         self._exec_pyprocess_download(cmd, single, aria2_input)
 
+    @staticmethod
+    def _write_cookie_file(cookies) -> str:
+        """Return path of a Netscape cookie file, aria2c sends each cookie only to its domain."""
+        fd, path = tempfile.mkstemp(prefix='ytdl-qt-cookies-', suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write('# Netscape HTTP Cookie File\n')
+            for c in cookies:
+                expires = c['expires'] if str(c['expires']).isdigit() else 0
+                f.write('\t'.join([
+                    c['domain'], 'TRUE' if c['domain'].startswith('.') else 'FALSE', c['path'] or '/',
+                    'TRUE' if c['secure'] else 'FALSE', str(expires), c.key, c.value]) + '\n')
+        return path
+
+    def _remove_cookie_file(self):
+        if self._cookie_file is not None:
+            try:
+                os.remove(self._cookie_file)
+            except OSError:
+                pass
+            self._cookie_file = None
+
     def _exec_qprocess_download(self, cmd: list, single: bool, aria2_input: str):
         subproc = QProcess()
         subproc.finished.connect(self._download_finish)
@@ -83,86 +138,130 @@ class DownloaderAria2c(DownloaderAbstract):
 
     def _exec_pyprocess_download(self, cmd: list, single: bool, aria2_input: str):
         try:
-            subproc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            with tracer.span('spawn', 'process', task=self.metrics.task_id, exe='aria2c'):
+                subproc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
         except Exception as e:
+            self._remove_cookie_file()
+            self._discard_staged()
             self.send_msg_cb('Download error')
             self.error = str(e)
+            self.metrics.finish(error=self.error)
             self.finished_cb(self)
             return
         if not single:
-            subproc.communicate(aria2_input.encode())
-            subproc.stdin.close()
-        else:
+            subproc.stdin.write(aria2_input.encode())
+        subproc.stdin.close()
+        if single:
             self.file_ready_for_playback_cb(self._final_filepath)
         self._child = subproc
+        supervisor.watch(subproc, self._download_finish, on_stdout=self._progress)
 
-        self._monitor = threading.Thread(target=self._download_finish, daemon=True)
-        self._monitor.start()
+    def _progress(self, line: str):
+        """Handle aria2c summary line."""
+        match = self.summary_re.search(line)
+        if match is None or self._cancel_flag:
+            return
+        done = float(match[1]) * self.units.get(match[2], 1)
+        total = float(match[3]) * self.units.get(match[4], 1)
+        self.metrics.progress(int(done))
+        self.set_progress_val_cb(int(match[5]))
+        self.send_msg_cb(f'{utils.convert_size(done)} / {utils.convert_size(total)}')
 
     def download_cancel(self):
         assert self._child is not None
         self._cancel_flag = True
-        self._child.terminate()
-        logging.debug('Sent SIGTERM to subprocess')
+        if not self._exited:
+            # aria2c writes its control file on SIGTERM, _download_finish cleans up once it exits
+            self._child.terminate()
+            logging.debug('Sent SIGTERM to subprocess')
+        elif self._merge_task is not None and not self._merge_task.done():
+            # _merge cleans up once ffmpeg has exited
+            self._merge_task.cancel()
+        else:
+            self._discard_staged()
+        self.metrics.finish(cancelled=True)
         self.send_msg_cb('Cancelled')
         self.finished_cb(self)
 
-    def _download_finish(self):
-        self._child.wait()  # for pyprocess only
-        if not self._cancel_flag:
-            ret = self._child.returncode
-            if ret == 0:
-
-                def good_end():
-                    self.file_ready_for_playback_cb(self._final_filepath)
-                    self.send_msg_cb('Download Finished')
-                    self.finished_cb(self)
-
-                if self._merging:
-                    for file in self._files_to_merge:
-                        os.remove(file)
-                        logging.debug(f'Removed temporary file: {file}')
-                    good_end()
-                else:
-                    if self._files_to_merge:
-                        self._merge_files()
-                    else:
-                        good_end()
+    def _good_end(self):
+        if self.needs_finalizing():
+            self._finalize(self._final_filepath, self._finalize_finish)
+            return
+        self._finished_ok()
+
+    def _finalize_finish(self, path, error: str):
+        if self._cancel_flag:
+            return
+        if path is None:
+            self.error = self._keep_staged(self._final_filepath, error)
+            self.send_msg_cb('Download error')
+            self.metrics.finish(error=self.error)
+            self.finished_cb(self)
+            return
+        self._final_filepath = path
+        self._finished_ok()
+
+    def _fail(self, error: str):
+        self._discard_staged()
+        self.error = error
+        self.send_msg_cb('Download error')
+        self.metrics.finish(error=self.error)
+        self.finished_cb(self)
+
+    def _finished_ok(self):
+        self.metrics.finish(path=self._final_filepath)
+        self.file_ready_for_playback_cb(self._final_filepath)
+        self.send_msg_cb('Download Finished')
+        self.finished_cb(self)
+
+    def _download_finish(self, ret: int):
+        self._exited = True
+        self._remove_cookie_file()
+        if self._cancel_flag:
+            self._discard_staged()
+            return
+        if ret == 0:
+            if self._files_to_merge:
+                self._merge_files()
             else:
-                if self._merging:
-                    self.error = f'FFmpeg Error. Exit code {ret}'
-                else:
-                    self.error = f'aria2c Error. Exit code {ret}'
-                self.send_msg_cb('Download error')
-                self.finished_cb(self)
+                self._good_end()
+        else:
+            self._fail(f'aria2c Error. Exit code {ret}')
 
     def _merge_files(self):
-        """Merge outputs."""
+        """Merge outputs in a post-processing slot. The network slot is given up right away."""
         assert self._files_to_merge
-        self._merging = True
-        self.send_msg_cb('Merging files')
-
-        name = self.ytdl.get_filename()[0]
-        filepath = f"{name}.mkv"
-        # cmd = utils.build_ffmpeg_args_list(self._files_to_merge, output_file=filepath, protected_args=True)
-        cmd = [self.ytdl.get_ffmpeg_path()] + \
-              utils.build_ffmpeg_args_list(self._files_to_merge, output_file=filepath, quoted=True)
-        logging.debug(f"Command line {cmd}")
-
-        # subproc = QProcess()
-        # subproc.finished.connect(self._download_finish)
-        # subproc.start(cmd[0], cmd[1:])
-        # if not subproc.waitForStarted(self.process_timeout):  # timeout in ms
-        # 	subproc.kill()
-        # 	self._release_ui('FFMPEG execution error')
+        self.transfer_finished_cb(self)
+        self.send_msg_cb('Waiting for merge')
+
+        name = self.ytdl_info.get_filename()
+        filepath = os.path.join(os.path.dirname(self._files_to_merge[0]), f"{name}.mkv")
+        self._final_filepath = filepath
+
+        def started():
+            self.metrics.merge_started()
+            self.send_msg_cb('Merging files')
+
+        self._merge_task = engine.submit(self._merge(filepath, started), self._merge_finish)
 
+    async def _merge(self, filepath: str, started_cb: Callable[[], None]):
         try:
-            subproc = subprocess.Popen(' '.join(cmd), shell=True)
-            self._child = subproc
-            self._monitor = threading.Thread(target=self._download_finish, daemon=True)
-            self._monitor.start()
-            self._final_filepath = filepath
+            await engine.merge(self.params.ffmpeg_path, self._files_to_merge, filepath, started_cb=started_cb)
+        except asyncio.CancelledError:
+            # engine.merge returns once ffmpeg has exited
+            self._discard_staged()
+            raise
+
+    def _merge_finish(self, future):
+        if self._cancel_flag or future.cancelled():
+            return
+        try:
+            future.result()
         except Exception as e:
-            self.send_msg_cb('Download error')
-            self.error = str(e)
-            self.finished_cb(self)
+            self._fail(str(e))
+            return
+        self.metrics.merge_finished()
+        for file in self._files_to_merge:
+            os.remove(file)
+            logging.debug(f'Removed temporary file: {file}')
+        self._good_end()
@@ -3,11 +3,13 @@
 import logging
 import os
 import subprocess
-import threading
 
 # from PyQt5.QtCore import QProcess
 
 from ytdl_qt.downloader_abstract import DownloaderAbstract
+from ytdl_qt.process_supervisor import supervisor
+from ytdl_qt.recording import SegmentRecorder
+from ytdl_qt.tracing import tracer
 from ytdl_qt import utils
 
 
@@ -15,8 +17,10 @@ class DownloaderFfmpeg(DownloaderAbstract):
     def __init__(self, params, ytdl_info):
         super().__init__(params, ytdl_info)
         self._child = None
+        self._exited: bool = False  # _download_finish has been called
         self._cancel_flag: bool = False
-        self._monitor = None
+        self._filepath = None
+        self._recorder = None
 
     def _setup_ui(self):
         self.set_progress_max_cb(0)
@@ -29,16 +33,39 @@ class DownloaderFfmpeg(DownloaderAbstract):
         self._setup_ui()
 
         # path, ext = self.ytdl_info.get_filename()
-        path = os.path.join(self.params.download_dir, self.ytdl_info.get_filename())
-        ext = '.mkv'
-        filepath = ''.join([path, ext])
+        output_args = None
+        if self.ytdl_info.is_live() and self.params.segment_minutes > 0:
+            # Live recording goes into a directory of segments with an index.
+            # Segments are final as they are written, so they aren't staged.
+            self.staging = None
+            path = os.path.join(self.params.download_dir, self.get_output_name())
+            self._recorder = self._create_recorder(path)
+            output_file = self._recorder.get_output_pattern()
+            output_args = self._recorder.output_args()
+            filepath = self._recorder.get_index_path()
+        else:
+            path = os.path.join(self.get_work_dir(), self.get_output_name())
+            ext = '.mkv'
+            filepath = ''.join([path, ext])
+            output_file = filepath
+        self._filepath = filepath
 
         exe = self.params.ffmpeg_path
         assert exe
 
+        fmt_ids = self.params.fmt_id_selection
+        input_args_list = [
+            utils.ffmpeg_input_args(exe, protocol, self.params.clip) + utils.ffmpeg_request_args(headers, cookies)
+            for protocol, headers, cookies in zip(self.ytdl_info.get_protocol_list(fmt_ids),
+                                                  self.ytdl_info.get_http_headers_list(fmt_ids),
+                                                  self.ytdl_info.get_cookies_list(fmt_ids))]
         cmd = [exe] + \
               utils.build_ffmpeg_args_list(
-                  self.ytdl_info.get_format_url_list(self.params.fmt_id_selection), output_file=filepath)
+                  self.ytdl_info.get_format_url_list(fmt_ids),
+                  output_file=output_file,
+                  input_args_list=input_args_list,
+                  progress=True,
+                  output_args=output_args)
         logging.debug(f"Command line list: {cmd}")
         logging.debug(f"Command line: {' '.join(cmd)}")
         # logging.debug(f"Command line: {cmd}")
@@ -53,23 +80,41 @@ class DownloaderFfmpeg(DownloaderAbstract):
 
         # subproc = subprocess.Popen(' '.join(cmd), shell=True)
         try:
-            subproc = subprocess.Popen(cmd)
+            with tracer.span('spawn', 'process', task=self.metrics.task_id, exe='ffmpeg'):
+                subproc = subprocess.Popen(
+                    cmd, stdout=subprocess.PIPE, env=self._recorder.ffmpeg_env() if self._recorder else None)
             self._child = subproc
-            self._monitor = threading.Thread(target=self._download_finish, daemon=True)
-            self._monitor.start()
+            supervisor.watch(subproc, self._download_finish, on_stdout=self._progress)
         except Exception as e:
+            self._discard_staged()
             self.send_msg_cb('Download error')
             self.error = str(e)
+            self.metrics.finish(error=self.error)
             self.finished_cb(self)
             return
 
+        # Playable while it's being written, from the scratch directory if staged
         self.file_ready_for_playback_cb(filepath)
 
+    def _create_recorder(self, path: str) -> SegmentRecorder:
+        hours = self.params.retention_hours
+        gigabytes = self.params.retention_gb
+        return SegmentRecorder(
+            path,
+            self.params.segment_minutes * 60,
+            max_age=hours * 3600 if hours else None,
+            max_bytes=gigabytes * 1000 ** 3 if gigabytes else None)
+
     def download_cancel(self):
         assert self._child is not None
         self._cancel_flag = True
-        self._child.terminate()
-        logging.debug('Sent SIGTERM to subprocess')
+        if not self._exited:
+            # ffmpeg writes until it exits, _download_finish cleans up then
+            self._child.terminate()
+            logging.debug('Sent SIGTERM to subprocess')
+        else:
+            self._discard_staged()
+        self.metrics.finish(cancelled=True)
         self.send_msg_cb('Cancelled')
         self.finished_cb(self)
 
@@ -82,13 +127,49 @@ class DownloaderFfmpeg(DownloaderAbstract):
     # 		else:
     # 			self._release_ui(f'FFmpeg Error. Exit code {ret}')
 
-    def _download_finish(self):
-        self._child.wait()
-        if not self._cancel_flag:
-            ret = self._child.returncode
-            if ret == 0:
-                self.send_msg_cb('Download Finished')
-            else:
-                self.send_msg_cb('Download error')
-                self.error = f'FFmpeg Error. Exit code {ret}'
-            self.finished_cb(self)
+    def _progress(self, line: str):
+        """Handle a line of ffmpeg -progress output."""
+        if self._cancel_flag:
+            return
+        key, _, val = line.partition('=')
+        if key == 'progress' and self._recorder is not None and self._recorder.update():
+            recorder = self._recorder
+            self.send_msg_cb(
+                f'{len(recorder.segments)} segments, {utils.convert_size(recorder.get_total_size())} kept')
+        elif key == 'total_size' and val.isdigit() and self._recorder is None:
+            size = int(val)
+            self.metrics.progress(size)
+            self.send_msg_cb(utils.convert_size(size))
+
+    def _download_finish(self, ret: int):
+        self._exited = True
+        if self._recorder is not None:
+            # Stopping a recording cancels it, the last segment is indexed anyway
+            self._recorder.finish()
+        if self._cancel_flag:
+            self._discard_staged()
+            return
+        if ret == 0 and self._recorder is None and self.needs_finalizing():
+            self._finalize(self._filepath, self._finalize_finish)
+            return
+        if ret == 0:
+            self.send_msg_cb('Download Finished')
+        else:
+            self._discard_staged()
+            self.send_msg_cb('Download error')
+            self.error = f'FFmpeg Error. Exit code {ret}'
+        self.metrics.finish(error=self.error, path=self._filepath)
+        self.finished_cb(self)
+
+    def _finalize_finish(self, path, error: str):
+        if self._cancel_flag:
+            return
+        if path is None:
+            self.send_msg_cb('Download error')
+            self.error = self._keep_staged(self._filepath, error)
+        else:
+            self._filepath = path
+            self.file_ready_for_playback_cb(path)
+            self.send_msg_cb('Download Finished')
+        self.metrics.finish(error=self.error, path=self._filepath)
+        self.finished_cb(self)
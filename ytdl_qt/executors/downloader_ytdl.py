@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import datetime
+import glob
 import logging
 import os
 import threading
@@ -8,45 +9,235 @@ from math import floor
 import copy
 
 from yt_dlp import YoutubeDL
+from yt_dlp.utils import download_range_func, prepend_extension
 # from youtube_dl import YoutubeDL
 
 from ytdl_qt.downloader_abstract import DownloaderAbstract
+from ytdl_qt.engine import engine
 from ytdl_qt import utils
+from ytdl_qt.checksum import FileFollower
+from ytdl_qt.profiling import profiler
+from ytdl_qt.tracing import tracer
 from ytdl_qt.ytdl_info import Info
+from ytdl_qt.ytdl_process import YtdlProcess
 
 
 class DownloaderYtdl(DownloaderAbstract):
     class Cancelled(Exception):
         pass
 
+    uses_format_urls = False
+    threaded = True
+
+    # Postprocessors that run in the engine's post-processing slots
+    heavy_postprocessors = ('Merger', 'EmbedThumbnail', 'FFmpeg')
+    cancel_poll_interval = 0.5  # s, while waiting for a post-processing slot
+
+    class Logger:
+        """Forwards youtube-dl messages to logging and counts retries."""
+
+        def __init__(self, task_metrics):
+            self._metrics = task_metrics
+
+        def _count(self, msg: str):
+            if 'Retrying' in msg:
+                self._metrics.retry()
+
+        def debug(self, msg: str):
+            self._count(msg)
+            logging.debug(msg)
+
+        def warning(self, msg: str):
+            self._count(msg)
+            logging.warning(msg)
+
+        def error(self, msg: str):
+            logging.error(msg)
+
     def __init__(self, params, ytdl_info):
         super().__init__(copy.copy(params), ytdl_info)
 
         self._download_ct: int = len(params.fmt_id_selection)
         self._cancel_flag: bool = False
+        self._bytes_done: int = 0  # by already finished files
+        self._final_path = None
+        self._pp_slot: bool = False
+        self._fragment_span = None
+        self._fragment_index = None
+        self._pp_spans = {}  # postprocessor name -> span
+        self._follower = None  # hashes the file being downloaded
+        self._checksums = {}  # path -> checksum of downloaded files
+        self._rewritten = False  # by a postprocessor, streamed checksums don't apply
+        self._process = None  # YtdlProcess if youtube-dl runs in a worker process
+        # Removed on cancel: files being written and complete ones this run wrote to be merged.
+        # Files that were there before or are final are never in here.
+        self._partials = set()
+        self._written = set()  # names of files downloaded by this run, their .ytdl and -Frag files go too
 
         self.params.ytdl_params = self.params.ytdl_params.copy()
         self.params.ytdl_params.update({
             Info.Keys.format_requested: self.ytdl_info.get_format_str(params.fmt_id_selection),
             Info.Keys.hooks: [self.ytdl_processing_hook],
-            'outtmpl': os.path.join(self.params.download_dir, '%(title)s.%(ext)s'),
+            Info.Keys.pp_hooks: [self.ytdl_postprocessor_hook],
+            'logger': self.Logger(self.metrics),
+            'outtmpl': os.path.join(self.get_work_dir(), '%(title)s.%(ext)s'),
         })
+        clip = self.params.clip
+        if clip is not None:
+            # youtube-dl fetches only the fragments covering the range, or has ffmpeg seek in the input
+            self.params.ytdl_params.update({
+                'download_ranges': download_range_func(None, [(clip.start, clip.end or float('inf'))]),
+                'outtmpl': os.path.join(self.get_work_dir(), f'%(title)s [{clip.get_label()}].%(ext)s'),
+            })
 
     def _setup_ui(self):
         self.set_progress_max_cb(100)
         self.send_msg_cb('Downloading target')
 
+    def _release_pp_slot(self):
+        if self._pp_slot:
+            engine.release_postprocessing_slot()
+            self._pp_slot = False
+
+    def _end_spans(self):
+        if self._fragment_span is not None:
+            self._fragment_span.end()
+            self._fragment_span = None
+        for span in self._pp_spans.values():
+            span.end()
+        self._pp_spans.clear()
+
+    def _trace_fragment(self, d: dict):
+        """Keep a span open for the fragment the hook reports."""
+        index = d.get('fragment_index')
+        if index is None or index == self._fragment_index:
+            return
+        if self._fragment_span is not None:
+            self._fragment_span.end()
+        self._fragment_index = index
+        self._fragment_span = tracer.begin(
+            'fragment', 'ytdl', task=self.metrics.task_id, index=index, count=d.get('fragment_count'))
+
     def _do(self):
         try:
-            with YoutubeDL(self.params.ytdl_params) as ytdl:
-                ytdl.download([self.ytdl_info.get_url()])
-        except self.Cancelled:
-            self.send_msg_cb('Cancelled')
+            with profiler.operation(profiler.Scopes.download):
+                if self.params.ytdl_process:
+                    self._download_in_process()
+                else:
+                    with YoutubeDL(self.params.ytdl_params) as ytdl:
+                        ytdl.download([self.ytdl_info.get_url()])
+            # Post-processing (merge) is done by now
+            if self.needs_finalizing() and self._final_path is not None:
+                self._finalize_blocking()
+            self.metrics.finish(path=self._final_path)
+            if self._final_path is not None:
+                self.file_ready_for_playback_cb(self._final_path)
+            self.send_msg_cb('Download Finished')
             self.finished_cb(self)
+        except self.Cancelled:
+            self._finish_cancelled()
         except Exception as e:
+            if self._cancel_flag:
+                # Failed before reaching a hook, e.g. on the stalled connection
+                self._finish_cancelled()
+                return
             self.send_msg_cb('Download Error')
             self.error = str(e)
+            self.metrics.finish(error=self.error)
             self.finished_cb(self)
+        finally:
+            # Postprocessor that failed doesn't report finished
+            self._release_pp_slot()
+            self._end_spans()
+            if self._follower is not None:
+                self._follower.close()
+            if self.staging is not None:
+                self.staging.cleanup()
+
+    def _finish_cancelled(self):
+        self._remove_partials()
+        self.metrics.finish(cancelled=True)
+        self.send_msg_cb('Cancelled')
+        self.finished_cb(self)
+
+    def _download_in_process(self):
+        """Run youtube-dl in a YtdlProcess and call the hooks with what it reports. Throws exception on failure."""
+        excluded = (Info.Keys.hooks, Info.Keys.pp_hooks, 'logger')
+        ytdl_params = {k: v for k, v in self.params.ytdl_params.items() if k not in excluded}
+        logger = self.params.ytdl_params['logger']
+        self._process = YtdlProcess(self.ytdl_info.get_url(), ytdl_params, self.heavy_postprocessors)
+        try:
+            if self._cancel_flag:
+                raise self.Cancelled
+            while True:
+                msg = self._process.recv()
+                if msg is None:
+                    if self._cancel_flag:
+                        raise self.Cancelled
+                    raise Exception(f'youtube-dl process exited with code {self._process.join()}')
+                kind, *args = msg
+                if kind == 'hook':
+                    self.ytdl_processing_hook(args[0])
+                elif kind == 'pp':
+                    d = args[0]
+                    self.ytdl_postprocessor_hook(d)
+                    if d[Info.Keys.status] == Info.Keys.started and \
+                            d[Info.Keys.postprocessor].startswith(self.heavy_postprocessors):
+                        self._process.send(('go',))
+                elif kind == 'log':
+                    getattr(logger, args[0])(args[1])
+                elif kind == 'error':
+                    if self._cancel_flag:
+                        raise self.Cancelled
+                    raise Exception(args[0])
+                elif kind == 'done':
+                    return
+        except BaseException:
+            self._process.kill()
+            raise
+        finally:
+            self._process.join()
+
+    def _remove_partials(self):
+        """Delete partial and intermediate files of a cancelled download."""
+        candidates = list(self._partials)
+        for path in self._written:
+            candidates.append(f'{path}.ytdl')
+            candidates += glob.glob(f'{glob.escape(path)}-Frag*')
+        for candidate in candidates:
+            try:
+                os.remove(candidate)
+                logging.debug(f'Removed {candidate}')
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f'Couldn\'t remove {candidate}: {e}')
+
+    def _finalize_blocking(self):
+        self.transfer_finished_cb(self)
+        self.send_msg_cb('Finishing file')
+        checksum = self._checksums.get(self._final_path) if not self._rewritten else None
+        engine.acquire_postprocessing_slot()
+        self._pp_slot = True
+        try:
+            self._final_path = self.finalize_file(self._final_path, checksum)
+        except Exception as e:
+            if self._cancel_flag:
+                raise
+            raise Exception(self._keep_staged(self._final_path, str(e)))
+        finally:
+            self._release_pp_slot()
+
+    def _follow(self, d: dict):
+        """Hash the bytes youtube-dl has appended to the file since the last hook call."""
+        path = d.get(Info.Keys.tmpfilename)
+        if not self.params.checksum or path is None:
+            return
+        if self._follower is None or self._follower.path != path:
+            if self._follower is not None:
+                self._follower.close()
+            self._follower = FileFollower(self.params.checksum, path)
+        self._follower.feed()
 
     def download_start(self):
         self._setup_ui()
@@ -60,6 +251,10 @@ class DownloaderYtdl(DownloaderAbstract):
 
     def download_cancel(self):
         self._cancel_flag = True
+        self._finalize_cancelled.set()
+        if self._process is not None:
+            # Doesn't wait for youtube-dl to reach a hook
+            self._process.kill()
 
     def ytdl_processing_hook(self, d: dict):
         """
@@ -74,6 +269,13 @@ class DownloaderYtdl(DownloaderAbstract):
         if d[Info.Keys.status] == Info.Keys.downloading:
             total_str = ''
             downloaded = d[Info.Keys.downloaded_bytes]
+            # Fragments are named after the temporary file, the .ytdl state after the final one
+            tmp = d.get(Info.Keys.tmpfilename) or d[Info.Keys.filename]
+            self._partials.add(tmp)
+            self._written.update((tmp, d[Info.Keys.filename]))
+            self.metrics.progress(self._bytes_done + downloaded)
+            self._trace_fragment(d)
+            self._follow(d)
             downloaded_str = utils.convert_size(downloaded)
             if Info.Keys.total_bytes in d:
                 total = d[Info.Keys.total_bytes]
@@ -92,11 +294,64 @@ class DownloaderYtdl(DownloaderAbstract):
 
         elif d[Info.Keys.status] == Info.Keys.finished:
             logging.debug('Hook status = finished')
+            tracer.instant('file_finished', 'ytdl', task=self.metrics.task_id, file=d[Info.Keys.filename])
+            if self._fragment_span is not None:
+                self._fragment_span.end()
+                self._fragment_span = None
+                self._fragment_index = None
+            self._bytes_done += d.get(Info.Keys.total_bytes) or d.get(Info.Keys.downloaded_bytes) or 0
+            self._final_path = os.path.join(self.get_work_dir(), d[Info.Keys.filename])
+            filename = d[Info.Keys.filename]
+            # Complete now. Skipped files that were already there don't pass the downloading status
+            self._partials.discard(filename)
+            if filename in self._written and len(self.params.fmt_id_selection) > 1:
+                # Format files are intermediate until merged
+                self._partials.add(filename)
+            if self._follower is not None:
+                checksum = self._follower.finish(self._final_path)
+                if checksum is not None:
+                    self._checksums[self._final_path] = checksum
+                self._follower = None
             self._download_ct -= 1
             if self._download_ct == 0:
-                self.file_ready_for_playback_cb(os.path.join(self.params.download_dir, d[Info.Keys.filename]))
-                self.send_msg_cb('Download Finished')
-                self.finished_cb(self)
+                self.send_msg_cb('Post-processing')
 
         elif d[Info.Keys.status] == Info.Keys.error:
             raise Exception('Something happened inside youtube-dl')
+
+    def ytdl_postprocessor_hook(self, d: dict):
+        """
+        Moves heavy postprocessors into post-processing slots, times the merge
+        step and tracks the final file path.
+        """
+        name = d[Info.Keys.postprocessor]
+        if d[Info.Keys.status] == Info.Keys.started:
+            self._pp_spans[name] = tracer.begin(name, 'postprocess', task=self.metrics.task_id)
+        elif d[Info.Keys.status] == Info.Keys.finished and name in self._pp_spans:
+            self._pp_spans.pop(name).end()
+
+        if d[Info.Keys.status] == Info.Keys.started and name.startswith(self.heavy_postprocessors):
+            self._rewritten = True
+            # The transfer is over, let the next download have the network slot
+            self.transfer_finished_cb(self)
+            self.send_msg_cb('Waiting for post-processing')
+            while not engine.acquire_postprocessing_slot(self.cancel_poll_interval):
+                if self._cancel_flag:
+                    raise self.Cancelled
+            self._pp_slot = True
+            self.send_msg_cb('Post-processing')
+        elif d[Info.Keys.status] == Info.Keys.finished:
+            self._release_pp_slot()
+
+        if d[Info.Keys.status] == Info.Keys.started:
+            path = d[Info.Keys.info_dict].get(Info.Keys.filepath)
+            if path:
+                # Merger and fixups write here before renaming to the final name
+                self._partials.add(prepend_extension(path, 'temp'))
+        if name != 'Merger':
+            return
+        if d[Info.Keys.status] == Info.Keys.started:
+            self.metrics.merge_started()
+        elif d[Info.Keys.status] == Info.Keys.finished:
+            self.metrics.merge_finished()
+            self._final_path = d[Info.Keys.info_dict].get(Info.Keys.filepath, self._final_path)
@@ -1,21 +1,60 @@
 #!/usr/bin/env python3
 
 import logging
+import os
+import shlex
 import subprocess
-import threading
+import uuid
 from typing import List
 
 # from PyQt5.QtCore import QProcess
 
 from ytdl_qt import utils
+from ytdl_qt.disk_space import disk_space
+from ytdl_qt.live_latency import LatencyMeter
+from ytdl_qt.paths import Paths
+from ytdl_qt.process_supervisor import supervisor
 from ytdl_qt.streamer_abstract import StreamerAbstract
+from ytdl_qt.timeshift import TimeshiftRelay
+from ytdl_qt.tracing import tracer
+from ytdl_qt.ytdl_info import Info
 
 
 class StreamerFfmpeg(StreamerAbstract):
+
+    default_bitrate = 8000  # kbit/s, for sizing the timeshift buffer
+
     def __init__(self, params, ytdl_info):
         super().__init__(params, ytdl_info)
         self._children = []
-        self._monitor = None  # for pyprocess
+        self._running = 0
+        self._relay = None
+        self._reservation = None  # disk space of the timeshift buffer
+        self._latency = None
+
+    def is_low_latency(self) -> bool:
+        """Live streams get the low-latency profile unless it's turned off."""
+        return self.params.low_latency and self.ytdl_info.is_live()
+
+    def _input_args_list(self, protocol_list: List[str]) -> List[List[str]]:
+        ffmpeg_exe = self.params.ffmpeg_path
+        fmt_ids = self.params.fmt_id_selection
+        args_list = [
+            utils.ffmpeg_input_args(ffmpeg_exe, protocol, self.params.clip) + utils.ffmpeg_request_args(headers, cookies)
+            for protocol, headers, cookies in zip(protocol_list, self.ytdl_info.get_http_headers_list(fmt_ids),
+                                                  self.ytdl_info.get_cookies_list(fmt_ids))]
+        if self.is_low_latency():
+            args_list = [args + utils.ffmpeg_live_input_args(ffmpeg_exe, i)
+                         for args, i in zip(args_list, protocol_list)]
+        return args_list
+
+    def _create_latency_meter(self) -> LatencyMeter:
+        # Capture times come from the first HLS format's playlist
+        for fmt in self.ytdl_info.get_formats():
+            if fmt[Info.Keys.id] in self.params.fmt_id_selection and \
+                    fmt.get(Info.Keys.protocol) in ('m3u8', 'm3u8_native'):
+                return LatencyMeter(self.metrics, fmt.get(Info.Keys.format_url), fmt.get('http_headers'))
+        return LatencyMeter(self.metrics)
 
     def _setup_ui(self):
         self.send_msg_cb('Streaming target')
@@ -35,13 +74,29 @@ class StreamerFfmpeg(StreamerAbstract):
         ffmpeg_exe = self.params.ffmpeg_path
         assert ffmpeg_exe
 
-        ffmpeg_cmd = [ffmpeg_exe] + utils.build_ffmpeg_args_list(url_list=url_list, flv=flv, quiet=True)
+        timeshift = self.params.timeshift_minutes > 0
+        low_latency = self.is_low_latency()
+        ffmpeg_cmd = [ffmpeg_exe] + utils.build_ffmpeg_args_list(
+            url_list=url_list,
+            flv=flv,
+            quiet=True,
+            input_args_list=self._input_args_list(protocol_list),
+            # Byte offsets into MPEG-TS are seekable
+            output_format='mpegts' if timeshift else None,
+            # Stdout carries the stream
+            progress=low_latency,
+            progress_url='pipe:2',
+            low_latency=low_latency)
         logging.debug(' '.join(ffmpeg_cmd))
 
         player_exe = self.params.player_path
         assert player_exe
 
-        player_cmd = [player_exe] + self.params.player_params + ['-']
+        player_cmd = [player_exe]
+        if low_latency:
+            # Options given by the user come later and win
+            player_cmd += utils.player_low_latency_args(player_exe)
+        player_cmd += self.params.player_params
         logging.debug(' '.join(player_cmd))
 
         # ffmpeg = QProcess()
@@ -71,20 +126,35 @@ class StreamerFfmpeg(StreamerAbstract):
         # player = subprocess.Popen(' '.join(player_cmd), shell=True, stdin=ffmpeg.stdout)
 
         try:
-            ffmpeg = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE)
-            player = subprocess.Popen(player_cmd, stdin=ffmpeg.stdout)
-
+            with tracer.span('spawn', 'process', task=self.metrics.task_id, exe='ffmpeg'):
+                ffmpeg = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE,
+                                          stderr=subprocess.PIPE if low_latency else None)
+            if low_latency:
+                self._latency = self._create_latency_meter()
             self._children.append(ffmpeg)
+            with tracer.span('spawn', 'process', task=self.metrics.task_id, exe='player'):
+                if timeshift:
+                    self._relay = self._create_relay(ffmpeg.stdout)
+                    player = subprocess.Popen(player_cmd + [self._relay.url()])
+                else:
+                    player = subprocess.Popen(player_cmd + ['-'], stdin=ffmpeg.stdout)
             self._children.append(player)
-
-            self._monitor = threading.Thread(target=self._stream_finish, daemon=True)
-            self._monitor.start()
         except Exception as e:
             self.send_msg_cb('Streaming error')
             self.error = str(e)
-            if self._monitor is not None:
-                self._monitor.join()
+            for child in self._children:
+                child.kill()
+                child.wait()
+            if self._relay is not None:
+                self._relay.close()
+            self._release_reservation()
+            self.metrics.finish(error=self.error)
             self.finished_cb(self)
+            return
+
+        self._running = 2
+        supervisor.watch(ffmpeg, self._child_exited, on_stderr=self._progress if low_latency else None)
+        supervisor.watch(player, self._player_exited)
 
     def stream_start_detached(self):
         self._setup_ui()
@@ -98,7 +168,15 @@ class StreamerFfmpeg(StreamerAbstract):
         assert ffmpeg_exe
 
         ffmpeg_cmd = [f'\"{ffmpeg_exe}\"'] + \
-                     utils.build_ffmpeg_args_list(url_list=url_list, flv=flv, quiet=True, quoted=True)
+                     utils.build_ffmpeg_args_list(
+                         url_list=url_list,
+                         flv=flv,
+                         quiet=True,
+                         quoted=True,
+                         # Headers hold spaces and line breaks
+                         input_args_list=[[shlex.quote(i) for i in args]
+                                          for args in self._input_args_list(protocol_list)],
+                         low_latency=self.is_low_latency())
 
         player_exe = self.params.player_path
         assert player_exe
@@ -113,6 +191,8 @@ class StreamerFfmpeg(StreamerAbstract):
         except Exception as e:
             self.send_msg_cb('Streaming error')
             self.error = str(e)
+        # Detached pipeline isn't tracked past the spawn
+        self.metrics.finish(error=self.error)
 
     # def _stream_finish(self):
     # Relies on QProcess
@@ -121,11 +201,63 @@ class StreamerFfmpeg(StreamerAbstract):
     # 		logging.debug('Sent SIGTERM to subprocess')
     # 	self._release_ui('Finished streaming')
 
+    def _buffer_path(self) -> str:
+        path = Paths.get_cache_dir()
+        path.mkdir(parents=True, exist_ok=True)
+        return str(path / f'timeshift-{uuid.uuid4().hex}.ts')
+
+    def _create_relay(self, source) -> TimeshiftRelay:
+        """Timeshift relay with its whole buffer reserved on the cache disk first."""
+        path = self._buffer_path()
+        size = self._buffer_size()
+        # The buffer is allocated at once, received bytes don't shrink the reservation
+        self._reservation = disk_space.try_reserve(os.path.dirname(path), size)
+        if self._reservation is None:
+            raise Exception('Not enough disk space for the timeshift buffer while downloads are running')
+        return TimeshiftRelay(source, path, size)
+
+    def _release_reservation(self):
+        if self._reservation is not None:
+            self._reservation.release()
+            self._reservation = None
+
+    def _buffer_size(self) -> int:
+        """Bytes needed for the timeshift minutes at the selected formats' bitrate."""
+        bitrate = 0
+        for fmt in self.ytdl_info.get_formats():
+            if fmt[Info.Keys.id] in self.params.fmt_id_selection:
+                bitrate += fmt.get('tbr') or 0
+        bitrate = bitrate or self.default_bitrate
+        return int(self.params.timeshift_minutes * 60 * bitrate * 1000 / 8)
+
+    def _progress(self, line: str):
+        """Handle a line of ffmpeg -progress output of the low-latency profile."""
+        report = self._latency.progress(line)
+        if report is not None:
+            self.send_msg_cb(report)
+
+    def _player_exited(self, ret: int):
+        if self._relay is not None:
+            # ffmpeg may keep recording a live stream forever
+            self._children[0].terminate()
+        else:
+            # ffmpeg gets EPIPE once nobody reads the pipe
+            self._children[0].stdout.close()
+        self._child_exited(ret)
+
+    def _child_exited(self, ret: int):
+        # Both are watched from the supervisor thread, no locking needed
+        self._running -= 1
+        if self._running == 0:
+            self._stream_finish()
+
     def _stream_finish(self):
-        if self._children:
-            self._children[1].wait()
+        if self._relay is not None:
+            self._relay.close()
             self._children[0].stdout.close()
-            self._children[0].wait()
-        logging.debug('Sent SIGTERM to subprocess')
+        self._release_reservation()
+        if self._latency is not None and self._latency.delay is not None:
+            logging.info(f'Live latency: {self._latency.describe()}')
         self.send_msg_cb('Finished streaming')
+        self.metrics.finish()
         self.finished_cb(self)
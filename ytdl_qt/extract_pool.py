@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+# Top-level fields of extract_info output that nothing here reads.
+# Captions and thumbnails alone are most of a YouTube info dict.
+bulky_keys = (
+    'thumbnails', 'automatic_captions', 'subtitles', 'requested_subtitles', 'heatmap', 'chapters',
+    'description', 'tags', 'categories', 'comments', 'requested_formats', 'requested_downloads',
+)
+
+
+def compact_info(info: dict) -> dict:
+    """Return info without bulky_keys, cheap to pickle and keep in the cache."""
+    compact = {k: v for k, v in info.items() if k not in bulky_keys}
+    entries = compact.get('entries')
+    if entries is not None:
+        compact['entries'] = [compact_info(i) if isinstance(i, dict) else i for i in entries]
+    return compact
+
+
+def _extract(url: str, ytdl_params: dict) -> Tuple[dict, float]:
+    """Runs in a worker process. Return compact info and extraction time."""
+    from yt_dlp import YoutubeDL
+
+    from ytdl_qt.ytdl_info import Info
+
+    start = time.monotonic()
+    info = Info.extract_info_dict(url, ytdl_params)
+    elapsed = time.monotonic() - start
+    # Drops objects that can't be pickled
+    return compact_info(YoutubeDL.sanitize_info(info)), elapsed
+
+
+class ExtractPool:
+    """
+    Info extraction in worker processes. Page parsing and player script
+    handling of extractors then don't hold the GIL of the process running
+    the GUI, and extractions of many URLs use all cores.
+    Workers are started on first use and kept.
+    """
+
+    # Extraction mostly waits on the network, more workers than cores still pay off
+    max_workers = max(4, min(8, os.cpu_count() or 2))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Forking a process with Qt and the engine threads running isn't safe
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def submit(self, url: str, ytdl_params: Optional[dict] = None) -> concurrent.futures.Future:
+        """Return future of (compact info dict, extraction time)."""
+        return self._get_pool().submit(_extract, url, ytdl_params if ytdl_params is not None else {})
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                logging.debug('Stopping extraction processes')
+                # The exit handler of concurrent.futures would wait for running extractions.
+                # The broken pool also fails queued ones, shutdown(cancel_futures=True) needs
+                # Python 3.9 and cancelling them here races with the pool failing them.
+                for process in list((getattr(self._pool, '_processes', None) or {}).values()):
+                    process.terminate()
+                # Returns once the pool has noticed the workers are gone
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+
+extract_pool = ExtractPool()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import re
+from typing import List, Optional
+
+from ytdl_qt.utils import check_dict_attribute, convert_size
+
+
+class FormatPolicy:
+    """
+    Declarative rules for picking formats out of the format list.
+    Policy string example:
+    max_height=1080; vcodec=av1>vp9>h264; acodec=opus; min_abr=128; max_size=500M; prefer=size
+    """
+
+    class Selection:
+
+        def __init__(self, fmt_id_list: List[str], reasons: List[str]):
+            self.fmt_id_list = fmt_id_list
+            self.reasons = reasons
+
+        def explain(self) -> str:
+            return '; '.join(self.reasons)
+
+    class Keys:
+
+        max_height = 'max_height'
+        vcodec = 'vcodec'
+        acodec = 'acodec'
+        min_abr = 'min_abr'
+        max_size = 'max_size'
+        prefer = 'prefer'
+
+        # Values of prefer
+        quality = 'quality'
+        size = 'size'
+
+    # Prefix of the codec string -> codec family
+    codec_families = {
+        'avc': 'h264',
+        'h264': 'h264',
+        'hev': 'h265',
+        'hvc': 'h265',
+        'h265': 'h265',
+        'hevc': 'h265',
+        'vp09': 'vp9',
+        'vp9': 'vp9',
+        'vp8': 'vp8',
+        'av01': 'av1',
+        'av1': 'av1',
+        'mp4a': 'aac',
+        'aac': 'aac',
+        'opus': 'opus',
+        'vorbis': 'vorbis',
+        'mp3': 'mp3',
+        'ac-3': 'ac3',
+        'ec-3': 'eac3',
+        'flac': 'flac',
+    }
+
+    size_units = {'': 1, 'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3}
+
+    def __init__(self, max_height: Optional[int] = None, vcodecs: Optional[List[str]] = None,
+                 acodecs: Optional[List[str]] = None, min_abr: Optional[float] = None,
+                 max_size: Optional[int] = None, prefer: str = Keys.quality):
+        if prefer not in (self.Keys.quality, self.Keys.size):
+            raise Exception(f'Unknown preference: {prefer}')
+        self.max_height = max_height
+        self.vcodecs: List[str] = vcodecs if vcodecs else []
+        self.acodecs: List[str] = acodecs if acodecs else []
+        self.min_abr = min_abr
+        self.max_size = max_size
+        self.prefer = prefer
+
+    @staticmethod
+    def parse(text: str):
+        """Build policy from its string representation. Throws exception on error."""
+        kwargs = {}
+        for rule in filter(None, (i.strip() for i in text.split(';'))):
+            key, sep, value = (i.strip() for i in rule.partition('='))
+            if not sep or not value:
+                raise Exception(f'Malformed policy rule: {rule}')
+            try:
+                if key == FormatPolicy.Keys.max_height:
+                    kwargs['max_height'] = int(value.rstrip('pP'))
+                elif key == FormatPolicy.Keys.vcodec:
+                    kwargs['vcodecs'] = [i.strip().lower() for i in value.split('>')]
+                elif key == FormatPolicy.Keys.acodec:
+                    kwargs['acodecs'] = [i.strip().lower() for i in value.split('>')]
+                elif key == FormatPolicy.Keys.min_abr:
+                    kwargs['min_abr'] = float(value.lower().rstrip('k'))
+                elif key == FormatPolicy.Keys.max_size:
+                    kwargs['max_size'] = FormatPolicy._parse_size(value)
+                elif key == FormatPolicy.Keys.prefer:
+                    kwargs['prefer'] = value
+                else:
+                    raise Exception(f'Unknown policy rule: {key}')
+            except ValueError:
+                raise Exception(f'Malformed policy value: {rule}')
+        return FormatPolicy(**kwargs)
+
+    @staticmethod
+    def _parse_size(value: str) -> int:
+        match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMG]?)B?', value.upper())
+        if not match:
+            raise ValueError
+        return int(float(match[1]) * FormatPolicy.size_units[match[2]])
+
+    @staticmethod
+    def _format_size(size: int) -> str:
+        for unit in ('G', 'M', 'K'):
+            if size % FormatPolicy.size_units[unit] == 0:
+                return f'{size // FormatPolicy.size_units[unit]}{unit}'
+        return str(size)
+
+    def __str__(self):
+        rules = []
+        if self.max_height is not None:
+            rules.append(f'{self.Keys.max_height}={self.max_height}')
+        if self.vcodecs:
+            rules.append(f"{self.Keys.vcodec}={'>'.join(self.vcodecs)}")
+        if self.acodecs:
+            rules.append(f"{self.Keys.acodec}={'>'.join(self.acodecs)}")
+        if self.min_abr is not None:
+            rules.append(f'{self.Keys.min_abr}={self.min_abr:g}')
+        if self.max_size is not None:
+            rules.append(f'{self.Keys.max_size}={self._format_size(self.max_size)}')
+        if self.prefer != self.Keys.quality:
+            rules.append(f'{self.Keys.prefer}={self.prefer}')
+        return '; '.join(rules)
+
+    @staticmethod
+    def codec_family(codec: str) -> str:
+        codec = codec.lower()
+        for prefix, family in FormatPolicy.codec_families.items():
+            if codec.startswith(prefix):
+                return family
+        return codec.split('.')[0]
+
+    @staticmethod
+    def _codec_rank(codec: str, preference: List[str]) -> int:
+        """Position in the preference list. Codecs not on the list go last."""
+        family = FormatPolicy.codec_family(codec)
+        if family in preference:
+            return preference.index(family)
+        return len(preference)
+
+    @staticmethod
+    def estimate_size(fmt: dict, duration) -> Optional[int]:
+        """Return exact, approximate or bitrate-derived size in bytes."""
+        for key in ('filesize', 'filesize_approx'):
+            if check_dict_attribute(fmt, key):
+                return int(fmt[key])
+        if check_dict_attribute(fmt, 'tbr') and duration:
+            return int(fmt['tbr'] * 1000 / 8 * duration)
+        return None
+
+    def _video_key(self, fmt: dict, size: Optional[int]):
+        codec_rank = self._codec_rank(fmt['vcodec'], self.vcodecs)
+        height = fmt.get('height') or 0
+        tbr = fmt.get('tbr') or 0
+        if self.prefer == self.Keys.size:
+            return codec_rank, size if size is not None else float('inf'), -height
+        return -height, codec_rank, -tbr
+
+    def _audio_key(self, fmt: dict, size: Optional[int]):
+        codec_rank = self._codec_rank(fmt['acodec'], self.acodecs)
+        abr = fmt.get('abr') or fmt.get('tbr') or 0
+        if self.prefer == self.Keys.size:
+            return codec_rank, size if size is not None else float('inf'), -abr
+        return codec_rank, -abr
+
+    def _fits(self, size: Optional[int]) -> bool:
+        return self.max_size is None or size is None or size <= self.max_size
+
+    def select(self, formats: List[dict], duration=None) -> Selection:
+        """
+        Pick the best video+audio pair whose total fits (or the best single format).
+        Video alone is only picked if there's no audio format. Throws exception if nothing fits.
+        """
+        best_video = []
+        best_audio = []
+        audio_seen = False  # audio-only formats exist, fitting the policy or not
+        best_muxed = None
+        best_unknown = None
+        for fmt in formats:
+            has_video = check_dict_attribute(fmt, 'vcodec')
+            has_audio = check_dict_attribute(fmt, 'acodec')
+            size = self.estimate_size(fmt, duration)
+            if not has_video and not has_audio:
+                # 'none' means the stream is absent, missing key means codecs weren't reported
+                if fmt.get('vcodec') is None and fmt.get('acodec') is None and self._fits(size):
+                    key = (-(fmt.get('height') or 0), -(fmt.get('tbr') or 0))
+                    if best_unknown is None or key < best_unknown[0]:
+                        best_unknown = (key, fmt, size)
+                continue
+            if has_audio and not has_video:
+                audio_seen = True
+            if has_video:
+                if self.max_height is not None and (fmt.get('height') or 0) > self.max_height:
+                    continue
+            if has_audio and self.min_abr is not None and fmt.get('abr') is not None \
+                    and fmt['abr'] < self.min_abr:
+                continue
+            if not self._fits(size):
+                continue
+
+            if has_video and has_audio:
+                key = self._video_key(fmt, size) + self._audio_key(fmt, size)
+                if best_muxed is None or key < best_muxed[0]:
+                    best_muxed = (key, fmt, size)
+            elif has_video:
+                # Every fitting video is kept: the pair has to fit max_size as a whole
+                best_video.append((self._video_key(fmt, size), fmt, size))
+            else:
+                best_audio.append((self._audio_key(fmt, size), fmt, size))
+
+        # Best video first, then the best audio that still fits with it
+        best_video.sort(key=lambda i: i[0])
+        best_audio.sort(key=lambda i: i[0])
+        for _, video, video_size in best_video:
+            for _, audio, audio_size in best_audio:
+                if video_size is None or audio_size is None:
+                    total = None
+                else:
+                    total = video_size + audio_size
+                if self._fits(total):
+                    return self.Selection(
+                        [video['format_id'], audio['format_id']],
+                        [self._describe(video, video_size), self._describe(audio, audio_size),
+                         f'total {convert_size(total) if total is not None else "unknown size"}']
+                    )
+        if best_muxed is not None:
+            _, fmt, size = best_muxed
+            return self.Selection([fmt['format_id']], [self._describe(fmt, size), 'single muxed format'])
+        if best_video and not audio_seen:
+            _, fmt, size = best_video[0]
+            return self.Selection([fmt['format_id']], [self._describe(fmt, size), 'no audio available'])
+        if best_audio and not best_video:
+            _, fmt, size = best_audio[0]
+            return self.Selection([fmt['format_id']], [self._describe(fmt, size), 'no video available'])
+        if best_unknown is not None:
+            _, fmt, size = best_unknown
+            return self.Selection([fmt['format_id']], [self._describe(fmt, size), 'codecs unknown'])
+        raise Exception(f'No formats satisfy the policy: {self}')
+
+    def _describe(self, fmt: dict, size: Optional[int]) -> str:
+        parts = [fmt['format_id']]
+        if check_dict_attribute(fmt, 'vcodec'):
+            parts.append(f"{self.codec_family(fmt['vcodec'])}")
+            if fmt.get('height'):
+                parts.append(f"{fmt['height']}p")
+        if check_dict_attribute(fmt, 'acodec') and not check_dict_attribute(fmt, 'vcodec'):
+            parts.append(f"{self.codec_family(fmt['acodec'])}")
+            if fmt.get('abr'):
+                parts.append(f"{fmt['abr']:g}k")
+        if size is not None:
+            parts.append(convert_size(size))
+        return ' '.join(parts)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import collections
+import threading
+import time
+from typing import Optional, Tuple
+
+from ytdl_qt.ytdl_info import Info
+
+
+class InfoCache:
+    """
+    Recently extracted Info by URL. Entries live for ttl seconds, the least
+    recently used ones go first when full. Stale format URLs of a cached
+    Info are renewed by the engine before a download starts.
+    """
+
+    ttl = 30 * 60  # s
+    max_entries = 64
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: 'collections.OrderedDict[str, Tuple[float, Info]]' = collections.OrderedDict()
+
+    def get(self, url: str) -> Optional[Info]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            stored, info = entry
+            if time.monotonic() - stored > self.ttl:
+                del self._entries[url]
+                return None
+            self._entries.move_to_end(url)
+            return info
+
+    def __contains__(self, url: str) -> bool:
+        return self.get(url) is not None
+
+    def put(self, url: str, info: Info):
+        with self._lock:
+            self._entries[url] = (time.monotonic(), info)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+info_cache = InfoCache()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import datetime
+import logging
+import threading
+import time
+import urllib.request
+from typing import Optional
+
+from ytdl_qt.metrics import TaskMetrics
+
+
+class LatencyMeter:
+    """
+    Measures how far a live stream relayed by ffmpeg is behind the live edge,
+    from the ffmpeg -progress output time.
+
+    With EXT-X-PROGRAM-DATE-TIME in the HLS playlist the delay is glass to
+    glass up to the player's own buffer: wall clock now minus the capture time
+    of the segment being output. The playlist is read when ffmpeg starts, so
+    the anchor may be one segment off if the playlist moved meanwhile.
+    Without it the delay is the startup time plus the time output fell behind
+    real time since, i.e. only what the pipeline adds.
+    """
+
+    playlist_timeout = 5  # s
+    report_interval = 2.0  # s between reports
+
+    def __init__(self, metrics: TaskMetrics, playlist_url: Optional[str] = None, headers: Optional[dict] = None):
+        self._metrics = metrics
+        self._start = time.monotonic()
+        self._first_output: Optional[float] = None
+        self._out_time = 0.0
+        self._last_report = 0.0
+        self._anchor: Optional[float] = None  # capture time of the first output segment, epoch s
+        self.startup: Optional[float] = None
+        self.delay: Optional[float] = None
+        if playlist_url is not None:
+            threading.Thread(target=self._read_anchor, args=(playlist_url, headers or {}),
+                             name='LatencyAnchor', daemon=True).start()
+
+    @staticmethod
+    def parse_live_edge(playlist: str) -> Optional[float]:
+        """Return capture time of the last segment of a media playlist, None without program date time."""
+        pdt = None
+        duration = 0.0
+        last = None
+        for line in playlist.splitlines():
+            line = line.strip()
+            if line.startswith('#EXT-X-PROGRAM-DATE-TIME:'):
+                value = line.split(':', 1)[1].replace('Z', '+00:00')
+                try:
+                    pdt = datetime.datetime.fromisoformat(value).timestamp()
+                except ValueError:
+                    pdt = None
+            elif line.startswith('#EXTINF:'):
+                duration = float(line[8:].split(',')[0] or 0)
+            elif line and not line.startswith('#') and pdt is not None:
+                last = pdt
+                pdt += duration
+        return last
+
+    def _read_anchor(self, url: str, headers: dict):
+        try:
+            request = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(request, timeout=self.playlist_timeout) as resp:
+                playlist = resp.read().decode(errors='replace')
+        except Exception as e:
+            logging.debug(f'Couldn\'t read playlist for latency: {e}')
+            return
+        self._anchor = self.parse_live_edge(playlist)
+        if self._anchor is None:
+            logging.debug('Playlist has no program date time, measuring pipeline delay only')
+
+    def progress(self, line: str) -> Optional[str]:
+        """Handle a line of ffmpeg -progress output. Return a report every report_interval."""
+        key, _, val = line.partition('=')
+        if key != 'out_time_us' or not val.isdigit() or int(val) == 0:
+            return None
+        now = time.monotonic()
+        self._out_time = int(val) / 1e6
+        if self._first_output is None:
+            self._first_output = now
+            self.startup = now - self._start
+            self._metrics.first_byte()
+        if self._anchor is not None:
+            self.delay = max(0.0, time.time() - self._anchor - self._out_time)
+        else:
+            self.delay = self.startup + max(0.0, now - self._first_output - self._out_time)
+        if now - self._last_report < self.report_interval:
+            return None
+        self._last_report = now
+        self._metrics.set_latency(self.delay)
+        return self.describe()
+
+    def describe(self) -> str:
+        what = 'behind live' if self._anchor is not None else 'pipeline delay'
+        return f'{self.delay:.1f}s {what}, started in {self.startup:.1f}s'
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from ytdl_qt.tracing import tracer
+
+
+class TaskMetrics:
+    """Timings and counters of one task. Methods may be called from any thread."""
+
+    # Field name -> (prometheus metric name, help string)
+    fields = {
+        'extraction_latency': ('extraction_latency_seconds', 'Info extraction time'),
+        'ttfb': ('ttfb_seconds', 'Time from task start to the first received byte'),
+        'avg_throughput': ('avg_throughput_bytes_per_second', 'Average download throughput'),
+        'peak_throughput': ('peak_throughput_bytes_per_second', 'Peak download throughput'),
+        'retries': ('retries_total', 'Number of retries'),
+        'merge_duration': ('merge_duration_seconds', 'Duration of the merge step'),
+        'bytes_on_disk': ('bytes_on_disk', 'Size of the output file'),
+        'latency': ('latency_seconds', 'Delay of a live stream behind the live edge'),
+        'duration': ('duration_seconds', 'Task wall time'),
+    }
+
+    # Shorter intervals give noisy peaks
+    peak_window = 1.0  # s
+
+    def __init__(self, task_id: int, kind: str, label: str, on_change: Callable):
+        self.task_id = task_id
+        self.kind = kind
+        self.label = label
+        self.status = 'running'
+        self.error = ''
+
+        self.extraction_latency: Optional[float] = None
+        self.ttfb: Optional[float] = None
+        self.avg_throughput: Optional[float] = None
+        self.peak_throughput: Optional[float] = None
+        self.retries: int = 0
+        self.merge_duration: Optional[float] = None
+        self.bytes_on_disk: Optional[int] = None
+        self.latency: Optional[float] = None
+        self.duration: Optional[float] = None
+
+        self._on_change = on_change
+        self._start = time.monotonic()
+        self._window_start: Optional[float] = None
+        self._window_bytes = 0
+        self._bytes = 0
+        self._merge_start: Optional[float] = None
+        self._span = tracer.begin(kind, 'task', task=task_id, label=label)
+        self._merge_span = None
+
+    def first_byte(self):
+        if self.ttfb is None:
+            tracer.instant('first_byte', 'task', task=self.task_id)
+            self.ttfb = time.monotonic() - self._start
+            self._window_start = time.monotonic()
+            self._window_bytes = self._bytes
+
+    def progress(self, total_bytes: int):
+        """Report total bytes received so far."""
+        if total_bytes <= 0:
+            return
+        self.first_byte()
+        self._bytes = total_bytes
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= self.peak_window:
+            rate = (total_bytes - self._window_bytes) / elapsed
+            if self.peak_throughput is None or rate > self.peak_throughput:
+                self.peak_throughput = rate
+            self._window_start = now
+            self._window_bytes = total_bytes
+            self._on_change(self)
+
+    def get_bytes_received(self) -> int:
+        return self._bytes
+
+    def set_latency(self, seconds: float):
+        self.latency = seconds
+        self._on_change(self)
+
+    def retry(self):
+        self.retries += 1
+        self._on_change(self)
+
+    def merge_started(self):
+        self._merge_start = time.monotonic()
+        self._merge_span = tracer.begin('merge', 'task', task=self.task_id)
+
+    def merge_finished(self):
+        if self._merge_span is not None:
+            self._merge_span.end()
+        if self._merge_start is not None:
+            self.merge_duration = time.monotonic() - self._merge_start
+            self._merge_start = None
+
+    def finish(self, error: str = '', path: Optional[str] = None, cancelled: bool = False):
+        """Close the task. Size of path is recorded as bytes on disk."""
+        if self.status != 'running':
+            return
+        self.duration = time.monotonic() - self._start
+        if path is not None:
+            try:
+                self.bytes_on_disk = os.path.getsize(path)
+            except OSError:
+                pass
+        transferred = self._bytes or self.bytes_on_disk
+        if transferred and self.ttfb is not None:
+            transfer_time = self.duration - self.ttfb - (self.merge_duration or 0)
+            if transfer_time > 0:
+                self.avg_throughput = transferred / transfer_time
+        elif transferred and self.duration > 0:
+            self.avg_throughput = transferred / self.duration
+        if self.avg_throughput is not None and \
+                (self.peak_throughput is None or self.peak_throughput < self.avg_throughput):
+            self.peak_throughput = self.avg_throughput
+
+        self.error = error
+        if cancelled:
+            self.status = 'cancelled'
+        elif error:
+            self.status = 'error'
+        else:
+            self.status = 'finished'
+        if self._merge_span is not None:
+            self._merge_span.end()
+        self._span.end(status=self.status, error=error, bytes=self._bytes)
+        self._on_change(self)
+
+    def as_dict(self) -> dict:
+        d = {'task': self.task_id, 'kind': self.kind, 'label': self.label, 'status': self.status}
+        d.update({name: getattr(self, name) for name in self.fields})
+        d['error'] = self.error
+        return d
+
+
+class MetricsRegistry:
+    """Collects per-task metrics of executors and Info and exports them."""
+
+    prometheus_prefix = 'ytdl_qt_task_'
+    max_finished_tasks = 1000  # oldest finished tasks are forgotten beyond this
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[int, TaskMetrics] = {}
+        self._ids = itertools.count(1)
+        self._listeners: List[Callable] = []
+
+    def add_listener(self, cb: Callable):
+        """Callback gets TaskMetrics on change. Called from the reporting thread."""
+        self._listeners.append(cb)
+
+    def _changed(self, task: TaskMetrics):
+        for cb in self._listeners:
+            cb(task)
+
+    def new_task(self, kind: str, label: str, extraction_latency: Optional[float] = None) -> TaskMetrics:
+        with self._lock:
+            task = TaskMetrics(next(self._ids), kind, label, self._changed)
+            task.extraction_latency = extraction_latency
+            self._tasks[task.task_id] = task
+            self._forget_finished()
+        self._changed(task)
+        return task
+
+    def _forget_finished(self):
+        finished = [i for i in self._tasks.values() if i.status != 'running']
+        for task in finished[:max(0, len(finished) - self.max_finished_tasks)]:
+            del self._tasks[task.task_id]
+
+    def record_extraction(self, label: str, seconds: float):
+        """Info extraction is a task of its own."""
+        task = self.new_task('Info', label, seconds)
+        task.finish()
+        task.duration = seconds
+
+    def get_tasks(self) -> List[TaskMetrics]:
+        with self._lock:
+            return list(self._tasks.values())
+
+    def clear(self):
+        with self._lock:
+            self._tasks.clear()
+
+    def to_json(self) -> str:
+        return json.dumps([t.as_dict() for t in self.get_tasks()], indent=2)
+
+    def to_csv(self) -> str:
+        out = io.StringIO()
+        columns = ['task', 'kind', 'label', 'status'] + list(TaskMetrics.fields) + ['error']
+        writer = csv.DictWriter(out, fieldnames=columns, quotechar='\"', quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        for t in self.get_tasks():
+            writer.writerow(t.as_dict())
+        return out.getvalue()
+
+    @staticmethod
+    def _escape_label(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def to_prometheus(self) -> str:
+        """Text exposition format."""
+        tasks = self.get_tasks()
+        lines = []
+        for field, (name, help_str) in TaskMetrics.fields.items():
+            metric = self.prometheus_prefix + name
+            lines.append(f'# HELP {metric} {help_str}')
+            lines.append(f'# TYPE {metric} {"counter" if name.endswith("_total") else "gauge"}')
+            for t in tasks:
+                value = getattr(t, field)
+                if value is None:
+                    continue
+                labels = f'task="{t.task_id}",kind="{t.kind}",status="{t.status}",' \
+                         f'label="{self._escape_label(t.label)}"'
+                lines.append(f'{metric}{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: str):
+        """Format is chosen by extension: .json, .csv, anything else is prometheus text."""
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.json':
+            text = self.to_json()
+        elif ext == '.csv':
+            text = self.to_csv()
+        else:
+            text = self.to_prometheus()
+        with open(path, 'w', newline='') as f:
+            f.write(text)
+        logging.debug(f'Exported metrics to {path}')
+
+
+registry = MetricsRegistry()
@@ -1,12 +1,20 @@
 import os
 import pathlib
-from typing import Optional
+import tempfile
+from typing import Dict, Optional, Tuple
 
 
 class Paths:
     app_name = 'ytdl-qt'
     history_file = 'url-history.csv'
     config_name = 'config.ini'
+    profiles_dir = 'profiles'
+    executables_cache = 'executables.json'
+    archive_name = 'archive.sqlite'
+    daemon_token = 'daemon-token'
+
+    # (name, PATH) -> result of find_in_path
+    _found: Dict[Tuple[str, str], Optional[str]] = {}
 
     @staticmethod
     def get_history_path():
@@ -27,6 +35,14 @@ class Paths:
 
     @staticmethod
     def find_in_path(name: str) -> Optional[str]:
+        """Walks PATH once per name, later calls are served from memory."""
+        key = (name, os.environ.get('PATH', ''))
+        if key not in Paths._found:
+            Paths._found[key] = Paths._walk_path(name)
+        return Paths._found[key]
+
+    @staticmethod
+    def _walk_path(name: str) -> Optional[str]:
         if os.path.isfile(name):
             return os.path.abspath(name)
         else:
@@ -68,6 +84,51 @@ class Paths:
         else:
             assert True is False, 'Unknown OS'
 
+    @staticmethod
+    def get_cache_dir() -> pathlib.Path:
+        if os.name == 'nt':
+            return pathlib.Path(
+                os.getenv('LOCALAPPDATA', default=os.getenv('APPDATA')),
+                Paths.app_name,
+                'cache'
+            )
+        elif os.name == 'posix':
+            return pathlib.Path(
+                os.getenv('XDG_CACHE_HOME', default=f"{os.getenv('HOME')}/.cache"),
+                Paths.app_name
+            )
+        else:
+            assert True is False, 'Unknown OS'
+
+    @staticmethod
+    def get_profiles_dir() -> pathlib.Path:
+        return Paths.get_userdata_dir() / Paths.profiles_dir
+
+    @staticmethod
+    def get_ipc_name() -> str:
+        """Socket path on posix or pipe name on Windows."""
+        if os.name == 'nt':
+            return f"{Paths.app_name}-{os.getenv('USERNAME', 'user')}"
+        elif os.name == 'posix':
+            return os.path.join(
+                os.getenv('XDG_RUNTIME_DIR', default=tempfile.gettempdir()),
+                f'{Paths.app_name}-{os.getuid()}.sock'
+            )
+        else:
+            assert True is False, 'Unknown OS'
+
+    @staticmethod
+    def get_executables_cache_path() -> pathlib.Path:
+        return Paths.get_userdata_dir() / Paths.executables_cache
+
+    @staticmethod
+    def get_archive_path() -> pathlib.Path:
+        return Paths.get_userdata_dir() / Paths.archive_name
+
+    @staticmethod
+    def get_daemon_token_path() -> pathlib.Path:
+        return Paths.get_userdata_dir() / Paths.daemon_token
+
     @staticmethod
     def get_ffmpeg_path() -> Optional[str]:
         if os.name == 'nt':
@@ -75,3 +136,11 @@ class Paths:
         else:
             name = 'ffmpeg'
         return Paths.find_in_path(name)
+
+    @staticmethod
+    def get_aria2c_exe() -> Optional[str]:
+        if os.name == 'nt':
+            name = 'aria2c.exe'
+        else:
+            name = 'aria2c'
+        return Paths.find_in_path(name)
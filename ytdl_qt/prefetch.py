@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import os
+import time
+from typing import List
+
+from ytdl_qt.engine import engine
+from ytdl_qt.info_cache import info_cache
+
+
+class Prefetcher:
+    """
+    Resolves info of recent history items into the info cache while the app
+    is idle. One extraction at a time, no more than one per min_interval, and
+    only while CPU use is low. Pauses as soon as the user requests something,
+    the running prefetch is then joined by the engine if it's for the same URL.
+    """
+
+    max_items = 5
+    idle_delay = 5  # s without interactive requests
+    min_interval = 10  # s between the starts of two prefetches
+    max_cpu = 0.5  # share of one core used by this process
+    max_load = 0.75  # load average per core
+    poll_interval = 1  # s
+
+    def __init__(self):
+        self._task = None
+        self._cpu_sample = (time.monotonic(), time.process_time())
+
+    def start(self, urls: List[str]):
+        """Prefetch urls, most important first. Replaces the previous list."""
+        self.stop()
+        urls = urls[:self.max_items]
+        if urls:
+            self._task = engine.submit(self._run(urls))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _cpu_busy(self) -> bool:
+        now, cpu = time.monotonic(), time.process_time()
+        last_now, last_cpu = self._cpu_sample
+        self._cpu_sample = (now, cpu)
+        if now > last_now and (cpu - last_cpu) / (now - last_now) > self.max_cpu:
+            return True
+        if hasattr(os, 'getloadavg'):
+            return os.getloadavg()[0] / (os.cpu_count() or 1) > self.max_load
+        return False
+
+    async def _wait_idle(self, not_before: float):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            # Sampled every poll, so it's the CPU use of the last interval
+            cpu_busy = self._cpu_busy()
+            if time.monotonic() >= not_before and engine.is_idle(self.idle_delay) and not cpu_busy:
+                return
+
+    async def _run(self, urls: List[str]):
+        not_before = 0.0
+        for url in urls:
+            if url in info_cache:
+                continue
+            await self._wait_idle(not_before)
+            not_before = time.monotonic() + self.min_interval
+            logging.debug(f'Prefetching {url}')
+            try:
+                await engine.prefetch(url)
+            except Exception as e:
+                logging.debug(f'Prefetch of {url} failed: {e}')
+        logging.debug('Prefetch finished')
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import http.client
+import logging
+import re
+import ssl
+import threading
+import time
+import urllib.parse
+from typing import Dict, List, Optional, Tuple
+
+from ytdl_qt.tracing import tracer
+
+
+class ProbeResult:
+
+    def __init__(self, size: Optional[int], accept_ranges: bool, url: str):
+        self.size = size
+        self.accept_ranges = accept_ranges
+        self.url = url  # after redirects
+
+
+class Prober:
+    """
+    Asks format URLs for their size and byte range support with 1-byte range
+    requests, concurrently and within one deadline. Every worker thread keeps
+    its keep-alive connections, so formats on the same CDN host share them.
+    Results that miss the deadline are dropped.
+    """
+
+    protocols = ('http', 'https')
+    max_workers = 8
+    deadline = 3.0  # s for the whole probe
+    max_redirects = 5
+    content_range_re = re.compile(r'bytes \d+-\d+/(\d+)')
+
+    def __init__(self):
+        self._pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ssl_context = None
+
+    def _get_pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ThreadPoolExecutor(self.max_workers, thread_name_prefix='Probe')
+                self._ssl_context = ssl.create_default_context()
+            return self._pool
+
+    def _get_connection(self, scheme: str, netloc: str, timeout: float) -> http.client.HTTPConnection:
+        connections: Dict[Tuple[str, str], http.client.HTTPConnection] = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            if scheme == 'https':
+                conn = http.client.HTTPSConnection(netloc, timeout=timeout, context=self._ssl_context)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=timeout)
+            connections[(scheme, netloc)] = conn
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def _drop_connection(self, scheme: str, netloc: str):
+        conn = self._local.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _send(self, url: str, headers: dict, deadline: float) -> http.client.HTTPResponse:
+        parts = urllib.parse.urlsplit(url)
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        # A pooled connection may have been closed by the server, retry once on a new one
+        for attempt in range(2):
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise TimeoutError('Probe deadline passed')
+            conn = self._get_connection(parts.scheme, parts.netloc, timeout)
+            try:
+                conn.request('GET', path, headers=headers)
+                return conn.getresponse()
+            except (OSError, http.client.HTTPException):
+                self._drop_connection(parts.scheme, parts.netloc)
+                if attempt:
+                    raise
+
+    def _probe_one(self, url: str, headers: dict, deadline: float) -> Optional[ProbeResult]:
+        headers = dict(headers, Range='bytes=0-0')
+        headers['Accept-Encoding'] = 'identity'  # sizes of the bytes on disk
+        for _ in range(self.max_redirects + 1):
+            resp = self._send(url, headers, deadline)
+            parts = urllib.parse.urlsplit(url)
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader('Location'):
+                resp.read()
+                url = urllib.parse.urljoin(url, resp.getheader('Location'))
+                continue
+            if resp.status == 206:
+                resp.read()
+                match = self.content_range_re.match(resp.getheader('Content-Range') or '')
+                return ProbeResult(int(match[1]) if match else None, True, url)
+            # Don't read the body, the server ignored the range or failed
+            self._drop_connection(parts.scheme, parts.netloc)
+            if resp.status == 200:
+                length = resp.getheader('Content-Length')
+                return ProbeResult(int(length) if length and length.isdigit() else None, False, url)
+            logging.debug(f'Probe got HTTP {resp.status}')
+            return None
+        logging.debug('Probe gave up after too many redirects')
+        return None
+
+    def _probe_safe(self, url: str, headers: dict, deadline: float) -> Optional[ProbeResult]:
+        try:
+            return self._probe_one(url, headers, deadline)
+        except Exception as e:
+            logging.debug(f'Probe failed: {e}')
+            return None
+
+    def probe(self, formats: List[dict]) -> int:
+        """Fill size, range support and redirect target of direct-URL formats in place. Return number probed."""
+        candidates = [i for i in formats if i.get('protocol') in self.protocols and i.get('url')]
+        if not candidates:
+            return 0
+        deadline = time.monotonic() + self.deadline
+        pool = self._get_pool()
+        with tracer.span('probe', 'info', formats=len(candidates)):
+            futures = {
+                pool.submit(self._probe_safe, i['url'], i.get('http_headers') or {}, deadline): i
+                for i in candidates
+            }
+            done, not_done = concurrent.futures.wait(futures, timeout=self.deadline)
+        for future in not_done:
+            future.cancel()
+        probed = 0
+        for future in done:
+            result = future.result()
+            if result is None:
+                continue
+            fmt = futures[future]
+            if result.size is not None and not fmt.get('filesize'):
+                fmt['filesize'] = result.size
+            fmt['accept_ranges'] = result.accept_ranges
+            if result.url != fmt['url']:
+                fmt['url'] = result.url
+            probed += 1
+        logging.debug(f'Probed {probed} of {len(candidates)} format URLs, {len(not_done)} missed the deadline')
+        return probed
+
+
+prober = Prober()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from ytdl_qt.tracing import tracer
+
+
+class Watch:
+    """Supervised child process with its callbacks."""
+
+    def __init__(self, proc: subprocess.Popen, on_exit: Callable[[int], None],
+                 on_stdout: Optional[Callable[[str], None]], on_stderr: Optional[Callable[[str], None]],
+                 timeout: Optional[float]):
+        self.proc = proc
+        self.on_exit = on_exit
+        self.line_cbs = {}
+        self.streams = {}  # fd -> file object, closed once drained
+        for stream, cb in ((proc.stdout, on_stdout), (proc.stderr, on_stderr)):
+            if cb is not None and stream is not None:
+                self.line_cbs[stream.fileno()] = cb
+                self.streams[stream.fileno()] = stream
+        self.buffers: Dict[int, bytes] = {fd: b'' for fd in self.line_cbs}
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.pidfd: Optional[int] = None
+        self.returncode: Optional[int] = None
+        self.drain_deadline: Optional[float] = None
+        self.killed = False
+        self.span = tracer.begin(
+            os.path.basename(str(proc.args[0] if isinstance(proc.args, list) else proc.args)),
+            'process', pid=proc.pid)
+
+
+class ProcessSupervisor:
+    """
+    Watches every child process from a single thread: exit (pidfd where
+    available, polling otherwise), stdout/stderr lines and timeouts.
+    Callbacks are called from the supervisor thread one at a time,
+    in the order the events were seen.
+    """
+
+    poll_interval = 0.2  # s, when pidfd isn't available
+    kill_grace = 3  # s between SIGTERM and SIGKILL on timeout
+    drain_time = 1  # s to wait for pipes to close after exit
+    read_size = 64 * 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._selector = None
+        self._thread = None
+        self._watches: List[Watch] = []
+        self._new: List[Watch] = []
+        self._wake_r = self._wake_w = None
+        self._pidfd_supported = hasattr(os, 'pidfd_open')
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+            self._thread = threading.Thread(target=self._loop, name='ProcessSupervisor', daemon=True)
+            self._thread.start()
+
+    def watch(self, proc: subprocess.Popen, on_exit: Callable[[int], None],
+              on_stdout: Optional[Callable[[str], None]] = None,
+              on_stderr: Optional[Callable[[str], None]] = None,
+              timeout: Optional[float] = None) -> Watch:
+        """
+        Supervise process. on_exit gets the return code after the output is drained.
+        Line callbacks need the corresponding stream opened with subprocess.PIPE.
+        Process is terminated after timeout seconds.
+        """
+        w = Watch(proc, on_exit, on_stdout, on_stderr, timeout)
+        with self._lock:
+            self._ensure_started()
+            self._new.append(w)
+        os.write(self._wake_w, b'\0')
+        return w
+
+    def _add(self, w: Watch):
+        for fd in w.line_cbs:
+            os.set_blocking(fd, False)
+            self._selector.register(fd, selectors.EVENT_READ, (w, fd))
+        if self._pidfd_supported:
+            try:
+                w.pidfd = os.pidfd_open(w.proc.pid)
+                self._selector.register(w.pidfd, selectors.EVENT_READ, (w, None))
+            except OSError as e:
+                # Already reaped or not permitted; polling takes over
+                logging.debug(f'pidfd_open failed: {e}')
+                w.pidfd = None
+        self._watches.append(w)
+
+    def _timeout(self) -> float:
+        now = time.monotonic()
+        timeout = None
+        for w in self._watches:
+            for deadline in (w.deadline, w.drain_deadline):
+                if deadline is not None:
+                    left = max(0.0, deadline - now)
+                    timeout = left if timeout is None else min(timeout, left)
+            if w.pidfd is None and w.returncode is None:
+                timeout = self.poll_interval if timeout is None else min(timeout, self.poll_interval)
+        return timeout
+
+    def _loop(self):
+        while True:
+            for key, _ in self._selector.select(self._timeout()):
+                if key.data is None:
+                    try:
+                        os.read(self._wake_r, 4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                w, fd = key.data
+                if fd is None:
+                    self._reap(w)
+                else:
+                    self._read(w, fd)
+
+            with self._lock:
+                new, self._new = self._new, []
+            for w in new:
+                self._add(w)
+
+            now = time.monotonic()
+            for w in list(self._watches):
+                if w.returncode is None:
+                    if w.pidfd is None and w.proc.poll() is not None:
+                        self._reap(w)
+                    elif w.deadline is not None and now >= w.deadline:
+                        self._enforce_timeout(w)
+                if w.returncode is not None and (not w.line_cbs or now >= w.drain_deadline):
+                    self._complete(w)
+
+    def _enforce_timeout(self, w: Watch):
+        if not w.killed:
+            logging.debug(f'Timeout, terminating {w.proc.pid}')
+            w.proc.terminate()
+            w.killed = True
+            w.deadline = time.monotonic() + self.kill_grace
+        else:
+            logging.debug(f'Killing {w.proc.pid}')
+            w.proc.send_signal(signal.SIGKILL if hasattr(signal, 'SIGKILL') else signal.SIGTERM)
+            w.deadline = None
+
+    def _reap(self, w: Watch):
+        if w.pidfd is not None:
+            self._selector.unregister(w.pidfd)
+            os.close(w.pidfd)
+            w.pidfd = None
+        w.returncode = w.proc.wait()
+        w.deadline = None
+        w.drain_deadline = time.monotonic() + self.drain_time
+
+    def _read(self, w: Watch, fd: int):
+        try:
+            data = os.read(fd, self.read_size)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close_stream(w, fd)
+            return
+        # ffmpeg and aria2c redraw status lines with \r
+        buf = (w.buffers[fd] + data).replace(b'\r', b'\n')
+        *lines, w.buffers[fd] = buf.split(b'\n')
+        for line in lines:
+            if line:
+                self._call(w.line_cbs[fd], line.decode(errors='replace'))
+
+    def _close_stream(self, w: Watch, fd: int):
+        self._selector.unregister(fd)
+        w.streams.pop(fd).close()
+        rest = w.buffers.pop(fd)
+        cb = w.line_cbs.pop(fd)
+        if rest:
+            self._call(cb, rest.decode(errors='replace'))
+
+    def _complete(self, w: Watch):
+        for fd in list(w.line_cbs):
+            self._close_stream(w, fd)
+        self._watches.remove(w)
+        w.span.end(returncode=w.returncode, killed=w.killed)
+        self._call(w.on_exit, w.returncode)
+
+    @staticmethod
+    def _call(cb: Callable, arg):
+        try:
+            cb(arg)
+        except Exception:
+            logging.exception('Exception in process callback')
+
+
+supervisor = ProcessSupervisor()
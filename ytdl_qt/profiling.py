@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import contextlib
+import cProfile
+import datetime
+import io
+import logging
+import pstats
+import sys
+import threading
+import tracemalloc
+from typing import List, Optional
+
+from ytdl_qt.paths import Paths
+
+
+class Profiler:
+    """
+    cProfile and tracemalloc around the whole session or around single operations.
+    Only one cProfile runs at a time: since Python 3.12 it hooks the whole
+    interpreter and a second one fails. Operations overlapping a profiled
+    one aren't profiled. Before 3.12 a cProfile only sees its own thread,
+    the session then gets one per thread and their stats are merged.
+    """
+
+    class Scopes:
+
+        session = 'session'
+        info = 'info'
+        download = 'download'
+
+        all = [session, info, download]
+
+    stats_lines = 50
+    malloc_lines = 30
+    malloc_frames = 10
+
+    def __init__(self):
+        self.cpu_scope: Optional[str] = None
+        self.mem_scope: Optional[str] = None
+        self._session_profile: Optional[cProfile.Profile] = None
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._cpu_busy = False
+        self._counter = 0
+
+    def configure(self, cpu_scope: Optional[str], mem_scope: Optional[str]):
+        assert cpu_scope in self.Scopes.all + [None]
+        assert mem_scope in self.Scopes.all + [None]
+        self.cpu_scope = cpu_scope
+        self.mem_scope = mem_scope
+
+    def _dump_path(self, name: str, suffix: str):
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        path = Paths.get_profiles_dir()
+        path.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        return path / f'{stamp}-{counter:03}-{name}-{threading.current_thread().name}{suffix}'
+
+    def _dump_cpu(self, profile: cProfile.Profile, name: str, *others: cProfile.Profile):
+        """Write stats of profile merged with the others."""
+        path = self._dump_path(name, '.prof')
+        out = io.StringIO()
+        stats = pstats.Stats(profile, *others, stream=out)
+        stats.dump_stats(path)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.stats_lines)
+        path.with_suffix('.txt').write_text(out.getvalue())
+        logging.info(f'Profile written to {path}')
+
+    def _dump_mem(self, name: str, start_snapshot: Optional[tracemalloc.Snapshot]):
+        snapshot = tracemalloc.take_snapshot()
+        path = self._dump_path(name, '.snapshot')
+        snapshot.dump(str(path))
+        if start_snapshot is not None:
+            stats = snapshot.compare_to(start_snapshot, 'lineno')
+            title = 'Allocation difference during the operation'
+        else:
+            stats = snapshot.statistics('lineno')
+            title = 'Allocations at the end of the session'
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [title, f'Current: {current} B, peak: {peak} B', '']
+        lines += [str(i) for i in stats[:self.malloc_lines]]
+        path.with_suffix('.malloc.txt').write_text('\n'.join(lines) + '\n')
+        logging.info(f'Allocation snapshot written to {path}')
+
+    def start_session(self):
+        if self.mem_scope is not None:
+            # Operations compare against their own start snapshot,
+            # tracing simply stays on until the end of the session
+            tracemalloc.start(self.malloc_frames)
+        if self.cpu_scope == self.Scopes.session:
+            self._session_profile = cProfile.Profile()
+            self._session_profile.enable()
+            if sys.version_info < (3, 12):
+                # Called first thing in every thread started from now on
+                threading.setprofile(self._start_thread_profile)
+
+    def _start_thread_profile(self, frame, event, arg):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        # Replaces this function as the profiler of the thread
+        profile.enable()
+
+    def stop_session(self):
+        if self._session_profile is not None:
+            threading.setprofile(None)
+            self._session_profile.disable()
+            with self._lock:
+                # Threads still running are cut off here
+                others, self._thread_profiles = self._thread_profiles, []
+            self._dump_cpu(self._session_profile, self.Scopes.session, *others)
+            self._session_profile = None
+        if self.mem_scope == self.Scopes.session and tracemalloc.is_tracing():
+            self._dump_mem(self.Scopes.session, None)
+        tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def operation(self, scope: str):
+        """Profile the block if the scope was requested."""
+        profile = None
+        start_snapshot = None
+        if self.mem_scope == scope and tracemalloc.is_tracing():
+            start_snapshot = tracemalloc.take_snapshot()
+        if self.cpu_scope == scope:
+            with self._lock:
+                busy = self._cpu_busy
+                self._cpu_busy = True
+            if busy:
+                logging.debug(f'Another operation is being profiled, not profiling this {scope}')
+            else:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError as e:
+                    # Profiler or debugger of someone else
+                    logging.warning(f'Can\'t profile {scope}: {e}')
+                    profile = None
+                    self._cpu_busy = False
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._cpu_busy = False
+                self._dump_cpu(profile, scope)
+            if start_snapshot is not None:
+                self._dump_mem(scope, start_snapshot)
+
+
+profiler = Profiler()
@@ -73,3 +73,7 @@ class HistoryTableModel(QAbstractTableModel):
         assert index is not None
         logging.debug(self._data[len(self._data) - index.row() - 1][History.Keys.url])
         return self._data[len(self._data) - index.row() - 1][History.Keys.url]
+
+    def get_recent_urls(self, count: int):
+        """Return urls of the top count rows."""
+        return [i[History.Keys.url] for i in reversed(self._data[-count:])]
@@ -4,7 +4,6 @@ import logging
 import os
 import pkgutil
 import re
-import shlex
 from typing import List, Tuple
 
 from PyQt5.QtCore import Qt, pyqtSlot, Q_ARG, QModelIndex
@@ -18,13 +17,18 @@ from PyQt5.QtWidgets import (
 	QFileDialog
 )
 
+from ytdl_qt import metrics
+from ytdl_qt.clip_range import ClipRange
 from ytdl_qt.history import History
 from ytdl_qt.qt_historytablemodel import HistoryTableModel
+from ytdl_qt.qt_metricstablemodel import MetricsTableModel
 from ytdl_qt.qt_mainwindow_form import Ui_MainWindow
 from ytdl_qt.ytdl_info import Info
 from ytdl_qt.paths import Paths
 from ytdl_qt.core import Core, Callbacks
+from ytdl_qt.prefetch import prefetcher
 from ytdl_qt.settings import Settings
+from ytdl_qt.tracing import tracer
 
 
 class MainWindow(QMainWindow):
@@ -36,6 +40,11 @@ class MainWindow(QMainWindow):
 	# For clearing ANSI stuff from exception messages
 	ansi_esc = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
 
+	auto_backend_tooltip = 'Pick the fastest backend for the protocols of the selected formats'
+
+	# Entries of checksumComboBox
+	checksum_algorithms = ['', 'sha256', 'blake2b']
+
 	def __init__(self):
 		super().__init__()
 		self.ui = Ui_MainWindow()
@@ -50,7 +59,7 @@ class MainWindow(QMainWindow):
 		self.progressBar = QProgressBar()
 		self.statusBar().addPermanentWidget(self.progressBar)
 		self.progressBar.setVisible(False)
-		self.ui.ytdlRadio.setChecked(True)
+		self.ui.autoBackendRadio.setChecked(True)
 		self.ui.urlEdit.setFocus()
 		self.ui.historyView.verticalHeader().hide()
 
@@ -72,8 +81,18 @@ class MainWindow(QMainWindow):
 
 		self.ui.ffmpegPathEdit.setText(self.settings.ffmpeg_path.current)
 		self.ui.downloadDirEdit.setText(self.settings.download_dir.current)
+		self.ui.scratchDirEdit.setText(self.settings.scratch_dir.current)
+		self.ui.checksumComboBox.setCurrentIndex(self.checksum_algorithms.index(self.settings.checksum.current))
+		self.ui.ytdlProcessCheckBox.setChecked(self.settings.ytdl_process.get_value())
+		self.ui.extractProcessCheckBox.setChecked(self.settings.extract_processes.get_value())
 		self.ui.playerPathEdit.setText(self.settings.player_path.current)
 		self.ui.playerParamsEdit.setText(self.settings.player_params.current)
+		self.ui.policyEdit.setText(self.settings.format_policy.current)
+		self.ui.probeCheckBox.setChecked(self.settings.probe_formats.get_value())
+		self.ui.timeshiftSpinBox.setValue(self.settings.timeshift_minutes.get_minutes())
+		self.ui.segmentSpinBox.setValue(self.settings.segment_minutes.get_value())
+		self.ui.retentionHoursSpinBox.setValue(self.settings.retention_hours.get_value())
+		self.ui.retentionSizeSpinBox.setValue(self.settings.retention_gb.get_value())
 		self.set_settings_core()
 		self.set_settings_ui()
 
@@ -83,10 +102,19 @@ class MainWindow(QMainWindow):
 		logging.debug('Trying to load history')
 		self.ui.historyView.setModel(HistoryTableModel(History(Paths.get_history_path())))
 		logging.debug('History loaded')
+		prefetcher.start(self.ui.historyView.model().get_recent_urls(prefetcher.max_items))
+
+		self.ui.statsView.verticalHeader().hide()
+		self.ui.statsView.setModel(MetricsTableModel(metrics.registry))
+		metrics.registry.add_listener(self.metrics_changed)
 
 		self.download_button_text = self.ui.downloadButton.text()
 		self.download_button_status = True
 
+		# URLs handed over by other launches, loaded one by one after downloads
+		self.pending_urls: List[str] = []
+		self.loading_url = ''
+
 	def update_table(self, fmt_list: List[str]):
 		"""Update table contents."""
 		self.ui.infoTableWidget.clearContents()
@@ -102,6 +130,8 @@ class MainWindow(QMainWindow):
 		self.disconnect_history_widget()
 		self.ui.urlEdit.setDisabled(True)
 		self.ui.getInfoButton.setDisabled(True)
+		self.ui.autoButton.setDisabled(True)
+		self.ui.clipEdit.setDisabled(True)
 		self.progressBar.reset()
 		self.progressBar.setVisible(True)
 
@@ -110,6 +140,8 @@ class MainWindow(QMainWindow):
 		self.infoTableWidget_selectionChanged_slot()
 		self.ui.urlEdit.setEnabled(True)
 		self.urlEdit_textChanged()
+		self.ui.autoButton.setEnabled(self.core.ytdl_info is not None)
+		self.ui.clipEdit.setEnabled(True)
 		self.progressBar.reset()
 		self.progressBar.setVisible(False)
 
@@ -131,6 +163,13 @@ class MainWindow(QMainWindow):
 		logging.debug(f"Selected formats {fmt_set}")
 		return list(fmt_set)
 
+	def select_formats_in_table(self, fmt_id_list: List[str]):
+		"""Replace table selection with the rows of given format ids."""
+		self.ui.infoTableWidget.clearSelection()
+		for row in range(self.ui.infoTableWidget.rowCount()):
+			if self.ui.infoTableWidget.item(row, 0).data(Qt.DisplayRole) in fmt_id_list:
+				self.ui.infoTableWidget.selectRow(row)
+
 	def enable_apply_and_cancel_buttons(self):
 		self.ui.applyChangesButton.setEnabled(True)
 		self.ui.cancelChangesButton.setEnabled(True)
@@ -141,10 +180,7 @@ class MainWindow(QMainWindow):
 
 	# Settings stuff
 	def set_settings_core(self):
-		self.core.set_ffmpeg_path(self.settings.ffmpeg_path.current)
-		self.core.set_download_dir(self.settings.download_dir.current)
-		self.core.set_player_path(self.settings.player_path.current)
-		self.core.set_player_params(shlex.split(self.settings.player_params.current))
+		self.core.apply_settings(self.settings)
 
 	def set_settings_ui(self):
 		if self.settings.ffmpeg_path.current:
@@ -155,22 +191,45 @@ class MainWindow(QMainWindow):
 		try:
 			self.settings.ffmpeg_path.set(self.ui.ffmpegPathEdit.text().strip())
 			self.settings.download_dir.set(self.ui.downloadDirEdit.text().strip())
+			self.settings.scratch_dir.set(self.ui.scratchDirEdit.text().strip())
+			self.settings.checksum.set(self.checksum_algorithms[self.ui.checksumComboBox.currentIndex()])
+			self.settings.ytdl_process.set('1' if self.ui.ytdlProcessCheckBox.isChecked() else '0')
+			self.settings.extract_processes.set('1' if self.ui.extractProcessCheckBox.isChecked() else '0')
 			self.settings.player_path.set(self.ui.playerPathEdit.text().strip())
 			self.settings.player_params.set(self.ui.playerParamsEdit.text().strip())
+			self.settings.format_policy.set(self.ui.policyEdit.text().strip())
+			self.settings.probe_formats.set('1' if self.ui.probeCheckBox.isChecked() else '0')
+			self.settings.timeshift_minutes.set(str(self.ui.timeshiftSpinBox.value()))
+			self.settings.segment_minutes.set(str(self.ui.segmentSpinBox.value()))
+			self.settings.retention_hours.set(str(self.ui.retentionHoursSpinBox.value()))
+			self.settings.retention_gb.set(str(self.ui.retentionSizeSpinBox.value()))
 		except Exception as e:
 			self.error_dialog_exec('Settings', str(e))
 			return
 		self.settings.save()
 
+		self.ui.policyEdit.setText(self.settings.format_policy.current)
 		self.set_settings_core()
 		self.set_settings_ui()
 		self.disable_apply_and_cancel_buttons()
+		# Backends depend on the FFmpeg path
+		self.update_backend_choice()
 
 	def undo_settings(self):
 		self.ui.ffmpegPathEdit.setText(self.settings.ffmpeg_path.current)
 		self.ui.downloadDirEdit.setText(self.settings.download_dir.current)
+		self.ui.scratchDirEdit.setText(self.settings.scratch_dir.current)
+		self.ui.checksumComboBox.setCurrentIndex(self.checksum_algorithms.index(self.settings.checksum.current))
+		self.ui.ytdlProcessCheckBox.setChecked(self.settings.ytdl_process.get_value())
+		self.ui.extractProcessCheckBox.setChecked(self.settings.extract_processes.get_value())
 		self.ui.playerPathEdit.setText(self.settings.player_path.current)
 		self.ui.playerParamsEdit.setText(self.settings.player_params.current)
+		self.ui.policyEdit.setText(self.settings.format_policy.current)
+		self.ui.probeCheckBox.setChecked(self.settings.probe_formats.get_value())
+		self.ui.timeshiftSpinBox.setValue(self.settings.timeshift_minutes.get_minutes())
+		self.ui.segmentSpinBox.setValue(self.settings.segment_minutes.get_value())
+		self.ui.retentionHoursSpinBox.setValue(self.settings.retention_hours.get_value())
+		self.ui.retentionSizeSpinBox.setValue(self.settings.retention_gb.get_value())
 
 		self.disable_apply_and_cancel_buttons()
 
@@ -194,17 +253,52 @@ class MainWindow(QMainWindow):
 		else:
 			return None
 
+	def export_stats(self):
+		path, _ = QFileDialog.getSaveFileName(
+			parent=self,
+			caption='Export statistics',
+			filter='JSON (*.json);;CSV (*.csv);;Prometheus text (*.prom)'
+		)
+		if path:
+			try:
+				metrics.registry.export(path)
+			except Exception as e:
+				self.error_dialog_exec('Export Error', str(e))
+
+	def export_trace(self):
+		path, _ = QFileDialog.getSaveFileName(
+			parent=self,
+			caption='Export trace',
+			filter='Chrome trace (*.json)'
+		)
+		if path:
+			try:
+				tracer.export(path)
+			except Exception as e:
+				self.error_dialog_exec('Export Error', str(e))
+
+	def clear_stats(self):
+		metrics.registry.clear()
+		self.ui.statsView.model().refresh()
+
 	def pick_download_dir(self):
 		path = QFileDialog.getExistingDirectory(parent=self, caption='Provide path to the directory')
 		if path:
 			self.ui.downloadDirEdit.setText(path)
 			self.enable_apply_and_cancel_buttons()
 
+	def pick_scratch_dir(self):
+		path = QFileDialog.getExistingDirectory(parent=self, caption='Provide path to the scratch directory')
+		if path:
+			self.ui.scratchDirEdit.setText(path)
+			self.enable_apply_and_cancel_buttons()
+
 	def connect_signals(self):
 		self.ui.getInfoButton.clicked.connect(self.getInfoButton_clicked)
 		self.ui.urlEdit.textChanged.connect(self.urlEdit_textChanged)
 		self.ui.downloadButton.clicked.connect(self.downloadButton_clicked)
 		self.ui.streamButton.clicked.connect(self.streamButton_clicked)
+		self.ui.autoButton.clicked.connect(self.autoButton_clicked)
 		self.ui.infoTableWidget.itemDoubleClicked.connect(self.streamButton_clicked)
 		self.ui.infoTableWidget.itemSelectionChanged.connect(
 			self.infoTableWidget_selectionChanged_slot
@@ -214,18 +308,34 @@ class MainWindow(QMainWindow):
 
 		self.ui.ffmpegPathEdit.textEdited.connect(self.enable_apply_and_cancel_buttons)
 		self.ui.downloadDirEdit.textEdited.connect(self.enable_apply_and_cancel_buttons)
+		self.ui.scratchDirEdit.textEdited.connect(self.enable_apply_and_cancel_buttons)
+		self.ui.checksumComboBox.activated.connect(self.enable_apply_and_cancel_buttons)
+		self.ui.ytdlProcessCheckBox.toggled.connect(self.enable_apply_and_cancel_buttons)
+		self.ui.extractProcessCheckBox.toggled.connect(self.enable_apply_and_cancel_buttons)
 		self.ui.playerPathEdit.textEdited.connect(self.enable_apply_and_cancel_buttons)
 		self.ui.playerParamsEdit.textEdited.connect(self.enable_apply_and_cancel_buttons)
+		self.ui.policyEdit.textEdited.connect(self.enable_apply_and_cancel_buttons)
+		self.ui.probeCheckBox.toggled.connect(self.enable_apply_and_cancel_buttons)
+		self.ui.timeshiftSpinBox.valueChanged.connect(self.enable_apply_and_cancel_buttons)
+		self.ui.segmentSpinBox.valueChanged.connect(self.enable_apply_and_cancel_buttons)
+		self.ui.retentionHoursSpinBox.valueChanged.connect(self.enable_apply_and_cancel_buttons)
+		self.ui.retentionSizeSpinBox.valueChanged.connect(self.enable_apply_and_cancel_buttons)
 
 		self.ui.ffmpegPathButton.clicked.connect(self.pick_exe_ffmpeg)
 		self.ui.downloadDirButton.clicked.connect(self.pick_download_dir)
+		self.ui.scratchDirButton.clicked.connect(self.pick_scratch_dir)
 		self.ui.playerPathButton.clicked.connect(self.pick_exe_player)
 
+		self.ui.exportStatsButton.clicked.connect(self.export_stats)
+		self.ui.exportTraceButton.clicked.connect(self.export_trace)
+		self.ui.clearStatsButton.clicked.connect(self.clear_stats)
+
 		self.ui.applyChangesButton.clicked.connect(self.commit_settings)
 		self.ui.cancelChangesButton.clicked.connect(self.undo_settings)
 
 	def set_core_callbacks(self, core: Callbacks):
 		core.task_finished_cb = self.task_finish
+		core.info_loaded_cb = self.info_loaded
 		core.set_progress_max_cb = self.set_progressBar_max
 		core.set_progress_val_cb = self.set_progressBar_val
 		core.show_msg_cb = self.show_status_msg
@@ -233,27 +343,14 @@ class MainWindow(QMainWindow):
 
 	def download_info(self, url: str):
 		"""
-		Download URL info, update tableWidget and history, reset playback
-		information on success. Blocks UI.
+		Start loading URL info. Tabs stay disabled until info_loaded
+		updates tableWidget and history.
 		"""
 		logging.debug(f"Loading info for {url}")
 		self.ui.tabWidget.setDisabled(True)
 		self.show_status_msg('Downloading info')
-		self.redraw()
-
-		try:
-			self.core.download_info(url)
-
-			self.update_table(self.core.get_info())
-			self.setWindowTitle(self.window_title + ' :: ' + self.core.get_title())
-			self.show_status_msg('Info loaded')
-
-			self.history_add_item(self.core.get_title(), url)
-		except Exception as e:
-			self.error_dialog_exec('Info loading error', str(e))
-			self.show_status_msg('Info loading error')
-
-		self.ui.tabWidget.setDisabled(False)
+		self.loading_url = url
+		self.core.load_info(url)
 
 	def disconnect_history_widget(self):
 		if self.history_widget_connected:
@@ -276,6 +373,25 @@ class MainWindow(QMainWindow):
 			self.ui.downloadButton.setText(self.download_button_text)
 		self.download_button_status = not self.download_button_status
 
+	@pyqtSlot(list)
+	def open_urls(self, urls: List[str]):
+		"""Raise the window and load info of the first URL, queue the rest."""
+		self.setWindowState(self.windowState() & ~Qt.WindowMinimized)
+		self.raise_()
+		self.activateWindow()
+		self.pending_urls += urls
+		if not self.core.is_download_blocked() and not self.core.is_info_loading():
+			self.load_next_pending_url()
+		elif self.pending_urls:
+			self.show_status_msg(f'{len(self.pending_urls)} URL(s) queued')
+
+	def load_next_pending_url(self):
+		if self.pending_urls and not self.core.is_info_loading():
+			url = self.pending_urls.pop(0)
+			self.ui.urlEdit.setText(url)
+			self.ui.tabWidget.setCurrentWidget(self.ui.mainTab)
+			self.download_info(url)
+
 	@pyqtSlot()
 	def getInfoButton_clicked(self):
 		self.download_info(self.ui.urlEdit.text().strip())
@@ -311,14 +427,45 @@ class MainWindow(QMainWindow):
 		else:
 			self.ui.downloadButton.setEnabled(False)
 			self.ui.streamButton.setEnabled(False)
+		self.update_backend_choice()
+
+	def update_backend_choice(self):
+		"""Show which backend auto would pick for the selected formats and why."""
+		formats = self.get_selected_formats()
+		text = 'auto'
+		reason = self.auto_backend_tooltip
+		if formats and self.core.ytdl_info is not None:
+			try:
+				choice = self.core.choose_backend(formats)
+				text = f'auto ({choice.backend.name})'
+				reason = choice.reason
+			except Exception as e:
+				text = 'auto (none)'
+				reason = str(e)
+		self.ui.autoBackendRadio.setText(text)
+		self.ui.autoBackendRadio.setToolTip(reason)
+
+	def apply_clip(self, title: str) -> bool:
+		"""Pass the clip range to core. Return False after showing the error if it's malformed."""
+		try:
+			self.core.set_clip(ClipRange.parse(self.ui.clipEdit.text()))
+		except Exception as e:
+			self.error_dialog_exec(title, str(e))
+			return False
+		return True
 
 	@pyqtSlot()
 	def downloadButton_clicked(self):
 		"""Get selected formats and run selected downloader."""
+		if not self.apply_clip('Download Error'):
+			return
 		try:
 			formats = self.get_selected_formats()
 			logging.debug(f'Selected formats {formats}')
 			self.core.set_format(formats)
+			record = self.core.get_archived()
+			if record is not None and not self.archived_dialog_exec(record['path']):
+				return
 			self.setWindowTitle(
 				self.window_title + ' :: Downloading :: ' + self.core.get_title()
 			)
@@ -330,11 +477,18 @@ class MainWindow(QMainWindow):
 				os.makedirs(self.core.params.download_dir, exist_ok=True)
 				if not os.access(self.core.params.download_dir, mode=os.W_OK):
 					raise Exception('No permission to write to that directory')
-
-			if self.ui.ytdlRadio.isChecked():
-				self.core.download_with_ytdl()
+			if self.core.params.scratch_dir:
+				os.makedirs(self.core.params.scratch_dir, exist_ok=True)
+				if not os.access(self.core.params.scratch_dir, mode=os.W_OK):
+					raise Exception('No permission to write to the scratch directory')
+
+			if self.ui.autoBackendRadio.isChecked():
+				choice = self.core.download_auto(force=True)
+				self.show_status_msg(f'{choice.backend.name}: {choice.reason}')
+			elif self.ui.ytdlRadio.isChecked():
+				self.core.download_with_ytdl(force=True)
 			elif self.ui.ffmpegRadio.isChecked():
-				self.core.download_with_ffmpeg()
+				self.core.download_with_ffmpeg(force=True)
 			# elif self.ui.aria2Radio.isChecked():
 			# 	self.core.download_with_aria2()
 
@@ -343,6 +497,18 @@ class MainWindow(QMainWindow):
 			self.swap_d_s_buttons()
 			self.unlock_ui()
 
+	@pyqtSlot()
+	def autoButton_clicked(self):
+		"""Select formats according to the format policy and start download."""
+		try:
+			selection = self.core.select_formats(self.settings.format_policy.get_policy())
+		except Exception as e:
+			self.error_dialog_exec('Format policy', str(e))
+			return
+		self.select_formats_in_table(selection.fmt_id_list)
+		self.downloadButton_clicked()
+		self.show_status_msg(f'Auto: {selection.explain()}')
+
 	@pyqtSlot()
 	def cancelButton_clicked(self):
 		"""Send cancel signal to running downloader."""
@@ -355,6 +521,9 @@ class MainWindow(QMainWindow):
 		if not can_stream:
 			self.error_dialog_exec('Stream Error', 'Provide FFmpeg and player executables')
 			return
+		if not self.apply_clip('Stream Error'):
+			return
+		self.core.set_low_latency(self.ui.lowLatencyCheckBox.isChecked())
 		try:
 			formats = self.get_selected_formats()
 			logging.debug(f'Selected formats {formats}')
@@ -364,6 +533,29 @@ class MainWindow(QMainWindow):
 			self.error_dialog_exec('Stream Error', str(e))
 
 	# Asynchronous callbacks
+	def info_loaded(self, signal: Tuple[bool, str]):
+		success, error_str = signal
+		self.metaObject().invokeMethod(
+			self,
+			self._info_loaded_helper.__name__,
+			Qt.QueuedConnection,
+			Q_ARG(bool, success),
+			Q_ARG(str, error_str))
+
+	@pyqtSlot(bool, str)
+	def _info_loaded_helper(self, success: bool, error_str: str):
+		"""Update tableWidget and history, or show the error."""
+		if success:
+			self.update_table(self.core.get_info())
+			self.setWindowTitle(self.window_title + ' :: ' + self.core.get_title())
+			self.show_status_msg('Info loaded')
+			self.ui.autoButton.setEnabled(not self.core.is_download_blocked())
+			self.history_add_item(self.core.get_title(), self.loading_url)
+		else:
+			self.error_dialog_exec('Info loading error', error_str)
+			self.show_status_msg('Info loading error')
+		self.ui.tabWidget.setDisabled(False)
+
 	def task_finish(self, signal: Tuple[bool, str]):
 		success, error_str = signal
 		if not success:
@@ -376,6 +568,12 @@ class MainWindow(QMainWindow):
 		self.setWindowTitle(self.window_title + ' :: ' + self.core.get_title())
 		self.swap_d_s_buttons()
 		self.unlock_ui()
+		self.load_next_pending_url()
+
+	def metrics_changed(self, task: metrics.TaskMetrics):
+		"""Called from the reporting thread."""
+		model = self.ui.statsView.model()
+		self.metaObject().invokeMethod(model, model.refresh.__name__, Qt.QueuedConnection)
 
 	def redraw(self):
 		QApplication.processEvents()
@@ -440,3 +638,18 @@ class MainWindow(QMainWindow):
 			return True
 		else:
 			return False
+
+	@staticmethod
+	def archived_dialog_exec(path: str) -> bool:
+		"""Return True if download again is chosen."""
+		dialog = QMessageBox()
+		dialog.setIcon(QMessageBox.Question)
+		dialog.setText(f'Already downloaded to {path}. Download again?')
+		dialog.setWindowTitle('Download archive')
+		dialog.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+		dialog.setDefaultButton(QMessageBox.No)
+		ret = dialog.exec_()
+		if ret == QMessageBox.Yes:
+			return True
+		else:
+			return False
@@ -75,19 +75,34 @@ class Ui_MainWindow(object):
         self.ytdlRadio = QtWidgets.QRadioButton(self.dloadBox)
         self.ytdlRadio.setObjectName("ytdlRadio")
         self.gridLayout_2.addWidget(self.ytdlRadio, 0, 1, 1, 1)
+        self.autoBackendRadio = QtWidgets.QRadioButton(self.dloadBox)
+        self.autoBackendRadio.setObjectName("autoBackendRadio")
+        self.gridLayout_2.addWidget(self.autoBackendRadio, 2, 1, 1, 1)
         self.gridLayout_3.addWidget(self.dloadBox, 1, 0, 1, 1)
         self.streamBox = QtWidgets.QGroupBox(self.mainTab)
         self.streamBox.setObjectName("streamBox")
         self.horizontalLayout = QtWidgets.QHBoxLayout(self.streamBox)
         self.horizontalLayout.setObjectName("horizontalLayout")
+        self.clipEdit = QtWidgets.QLineEdit(self.streamBox)
+        self.clipEdit.setClearButtonEnabled(True)
+        self.clipEdit.setObjectName("clipEdit")
+        self.horizontalLayout.addWidget(self.clipEdit)
         self.downloadButton = QtWidgets.QPushButton(self.streamBox)
         self.downloadButton.setEnabled(False)
         self.downloadButton.setObjectName("downloadButton")
         self.horizontalLayout.addWidget(self.downloadButton)
+        self.lowLatencyCheckBox = QtWidgets.QCheckBox(self.streamBox)
+        self.lowLatencyCheckBox.setChecked(True)
+        self.lowLatencyCheckBox.setObjectName("lowLatencyCheckBox")
+        self.horizontalLayout.addWidget(self.lowLatencyCheckBox)
         self.streamButton = QtWidgets.QPushButton(self.streamBox)
         self.streamButton.setEnabled(False)
         self.streamButton.setObjectName("streamButton")
         self.horizontalLayout.addWidget(self.streamButton)
+        self.autoButton = QtWidgets.QPushButton(self.streamBox)
+        self.autoButton.setEnabled(False)
+        self.autoButton.setObjectName("autoButton")
+        self.horizontalLayout.addWidget(self.autoButton)
         self.gridLayout_3.addWidget(self.streamBox, 1, 1, 1, 2)
         self.tabWidget.addTab(self.mainTab, "")
         self.historyTab = QtWidgets.QWidget()
@@ -100,6 +115,30 @@ class Ui_MainWindow(object):
         self.historyView.horizontalHeader().setStretchLastSection(True)
         self.verticalLayout_2.addWidget(self.historyView)
         self.tabWidget.addTab(self.historyTab, "")
+        self.statsTab = QtWidgets.QWidget()
+        self.statsTab.setObjectName("statsTab")
+        self.verticalLayout_3 = QtWidgets.QVBoxLayout(self.statsTab)
+        self.verticalLayout_3.setObjectName("verticalLayout_3")
+        self.statsView = QtWidgets.QTableView(self.statsTab)
+        self.statsView.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.statsView.setObjectName("statsView")
+        self.statsView.horizontalHeader().setStretchLastSection(True)
+        self.verticalLayout_3.addWidget(self.statsView)
+        self.horizontalLayout_3 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_3.setObjectName("horizontalLayout_3")
+        spacerItem = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_3.addItem(spacerItem)
+        self.clearStatsButton = QtWidgets.QPushButton(self.statsTab)
+        self.clearStatsButton.setObjectName("clearStatsButton")
+        self.horizontalLayout_3.addWidget(self.clearStatsButton)
+        self.exportStatsButton = QtWidgets.QPushButton(self.statsTab)
+        self.exportStatsButton.setObjectName("exportStatsButton")
+        self.horizontalLayout_3.addWidget(self.exportStatsButton)
+        self.exportTraceButton = QtWidgets.QPushButton(self.statsTab)
+        self.exportTraceButton.setObjectName("exportTraceButton")
+        self.horizontalLayout_3.addWidget(self.exportTraceButton)
+        self.verticalLayout_3.addLayout(self.horizontalLayout_3)
+        self.tabWidget.addTab(self.statsTab, "")
         self.settingsTab = QtWidgets.QWidget()
         self.settingsTab.setObjectName("settingsTab")
         self.verticalLayout_5 = QtWidgets.QVBoxLayout(self.settingsTab)
@@ -156,13 +195,95 @@ class Ui_MainWindow(object):
         self.downloadDirButton = QtWidgets.QToolButton(self.groupBox_2)
         self.downloadDirButton.setObjectName("downloadDirButton")
         self.gridLayout_6.addWidget(self.downloadDirButton, 0, 2, 1, 1)
+        self.label_11 = QtWidgets.QLabel(self.groupBox_2)
+        self.label_11.setObjectName("label_11")
+        self.gridLayout_6.addWidget(self.label_11, 1, 0, 1, 1)
+        self.scratchDirEdit = QtWidgets.QLineEdit(self.groupBox_2)
+        self.scratchDirEdit.setClearButtonEnabled(True)
+        self.scratchDirEdit.setObjectName("scratchDirEdit")
+        self.gridLayout_6.addWidget(self.scratchDirEdit, 1, 1, 1, 1)
+        self.scratchDirButton = QtWidgets.QToolButton(self.groupBox_2)
+        self.scratchDirButton.setObjectName("scratchDirButton")
+        self.gridLayout_6.addWidget(self.scratchDirButton, 1, 2, 1, 1)
+        self.label_12 = QtWidgets.QLabel(self.groupBox_2)
+        self.label_12.setObjectName("label_12")
+        self.gridLayout_6.addWidget(self.label_12, 2, 0, 1, 1)
+        self.checksumComboBox = QtWidgets.QComboBox(self.groupBox_2)
+        self.checksumComboBox.setObjectName("checksumComboBox")
+        self.checksumComboBox.addItem("")
+        self.checksumComboBox.addItem("")
+        self.checksumComboBox.addItem("")
+        self.gridLayout_6.addWidget(self.checksumComboBox, 2, 1, 1, 2)
+        self.ytdlProcessCheckBox = QtWidgets.QCheckBox(self.groupBox_2)
+        self.ytdlProcessCheckBox.setObjectName("ytdlProcessCheckBox")
+        self.gridLayout_6.addWidget(self.ytdlProcessCheckBox, 3, 1, 1, 2)
+        self.extractProcessCheckBox = QtWidgets.QCheckBox(self.groupBox_2)
+        self.extractProcessCheckBox.setObjectName("extractProcessCheckBox")
+        self.gridLayout_6.addWidget(self.extractProcessCheckBox, 4, 1, 1, 2)
         self.verticalLayout_5.addWidget(self.groupBox_2)
-        spacerItem = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
-        self.verticalLayout_5.addItem(spacerItem)
+        self.policyBox = QtWidgets.QGroupBox(self.settingsTab)
+        self.policyBox.setObjectName("policyBox")
+        self.gridLayout_7 = QtWidgets.QGridLayout(self.policyBox)
+        self.gridLayout_7.setObjectName("gridLayout_7")
+        self.label_6 = QtWidgets.QLabel(self.policyBox)
+        self.label_6.setObjectName("label_6")
+        self.gridLayout_7.addWidget(self.label_6, 0, 0, 1, 1)
+        self.policyEdit = QtWidgets.QLineEdit(self.policyBox)
+        self.policyEdit.setClearButtonEnabled(True)
+        self.policyEdit.setObjectName("policyEdit")
+        self.gridLayout_7.addWidget(self.policyEdit, 0, 1, 1, 1)
+        self.probeCheckBox = QtWidgets.QCheckBox(self.policyBox)
+        self.probeCheckBox.setObjectName("probeCheckBox")
+        self.gridLayout_7.addWidget(self.probeCheckBox, 1, 1, 1, 1)
+        self.verticalLayout_5.addWidget(self.policyBox)
+        self.streamingBox = QtWidgets.QGroupBox(self.settingsTab)
+        self.streamingBox.setObjectName("streamingBox")
+        self.gridLayout_8 = QtWidgets.QGridLayout(self.streamingBox)
+        self.gridLayout_8.setObjectName("gridLayout_8")
+        self.label_7 = QtWidgets.QLabel(self.streamingBox)
+        self.label_7.setObjectName("label_7")
+        self.gridLayout_8.addWidget(self.label_7, 0, 0, 1, 1)
+        self.timeshiftSpinBox = QtWidgets.QSpinBox(self.streamingBox)
+        self.timeshiftSpinBox.setMaximum(240)
+        self.timeshiftSpinBox.setObjectName("timeshiftSpinBox")
+        self.gridLayout_8.addWidget(self.timeshiftSpinBox, 0, 1, 1, 1)
+        spacerItem1 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.gridLayout_8.addItem(spacerItem1, 0, 2, 1, 1)
+        self.recordingBox = QtWidgets.QGroupBox(self.streamingBox)
+        self.recordingBox.setObjectName("recordingBox")
+        self.gridLayout_9 = QtWidgets.QGridLayout(self.recordingBox)
+        self.gridLayout_9.setObjectName("gridLayout_9")
+        self.label_8 = QtWidgets.QLabel(self.recordingBox)
+        self.label_8.setObjectName("label_8")
+        self.gridLayout_9.addWidget(self.label_8, 0, 0, 1, 1)
+        self.segmentSpinBox = QtWidgets.QSpinBox(self.recordingBox)
+        self.segmentSpinBox.setMaximum(1440)
+        self.segmentSpinBox.setObjectName("segmentSpinBox")
+        self.gridLayout_9.addWidget(self.segmentSpinBox, 0, 1, 1, 1)
+        self.label_9 = QtWidgets.QLabel(self.recordingBox)
+        self.label_9.setObjectName("label_9")
+        self.gridLayout_9.addWidget(self.label_9, 1, 0, 1, 1)
+        self.retentionHoursSpinBox = QtWidgets.QSpinBox(self.recordingBox)
+        self.retentionHoursSpinBox.setMaximum(8760)
+        self.retentionHoursSpinBox.setObjectName("retentionHoursSpinBox")
+        self.gridLayout_9.addWidget(self.retentionHoursSpinBox, 1, 1, 1, 1)
+        self.label_10 = QtWidgets.QLabel(self.recordingBox)
+        self.label_10.setObjectName("label_10")
+        self.gridLayout_9.addWidget(self.label_10, 2, 0, 1, 1)
+        self.retentionSizeSpinBox = QtWidgets.QSpinBox(self.recordingBox)
+        self.retentionSizeSpinBox.setMaximum(100000)
+        self.retentionSizeSpinBox.setObjectName("retentionSizeSpinBox")
+        self.gridLayout_9.addWidget(self.retentionSizeSpinBox, 2, 1, 1, 1)
+        spacerItem2 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.gridLayout_9.addItem(spacerItem2, 0, 2, 1, 1)
+        self.gridLayout_8.addWidget(self.recordingBox)
+        self.verticalLayout_5.addWidget(self.streamingBox)
+        spacerItem3 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
+        self.verticalLayout_5.addItem(spacerItem3)
         self.horizontalLayout_2 = QtWidgets.QHBoxLayout()
         self.horizontalLayout_2.setObjectName("horizontalLayout_2")
-        spacerItem1 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
-        self.horizontalLayout_2.addItem(spacerItem1)
+        spacerItem4 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_2.addItem(spacerItem4)
         self.applyChangesButton = QtWidgets.QPushButton(self.settingsTab)
         self.applyChangesButton.setEnabled(False)
         self.applyChangesButton.setObjectName("applyChangesButton")
@@ -203,11 +324,24 @@ class Ui_MainWindow(object):
         self.dloadBox.setTitle(_translate("MainWindow", "Backend"))
         self.ffmpegRadio.setText(_translate("MainWindow", "ffmpeg"))
         self.ytdlRadio.setText(_translate("MainWindow", "ytdl"))
+        self.autoBackendRadio.setToolTip(_translate("MainWindow", "Pick the fastest backend for the protocols of the selected formats"))
+        self.autoBackendRadio.setText(_translate("MainWindow", "auto"))
         self.streamBox.setTitle(_translate("MainWindow", "Controls"))
+        self.clipEdit.setToolTip(_translate("MainWindow", "Download or stream only this time range, START-END with times as [[H:]M:]S. Either side may be left out."))
+        self.clipEdit.setPlaceholderText(_translate("MainWindow", "Clip, e.g. 1:20:00-1:25:30"))
         self.downloadButton.setText(_translate("MainWindow", "Download"))
+        self.lowLatencyCheckBox.setToolTip(_translate("MainWindow", "Stream live video with minimal buffering from the live edge and show how far playback is behind live. Turn off for sources that stutter."))
+        self.lowLatencyCheckBox.setText(_translate("MainWindow", "Low latency"))
         self.streamButton.setText(_translate("MainWindow", "Stream"))
+        self.autoButton.setToolTip(_translate("MainWindow", "Select formats using the format policy and download"))
+        self.autoButton.setText(_translate("MainWindow", "Auto"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.mainTab), _translate("MainWindow", "Download/Stream"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.historyTab), _translate("MainWindow", "History"))
+        self.clearStatsButton.setText(_translate("MainWindow", "Clear"))
+        self.exportStatsButton.setText(_translate("MainWindow", "Export..."))
+        self.exportTraceButton.setToolTip(_translate("MainWindow", "Save recent spans as Chrome trace-event JSON for chrome://tracing or Perfetto"))
+        self.exportTraceButton.setText(_translate("MainWindow", "Export trace..."))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.statsTab), _translate("MainWindow", "Stats"))
         self.ffmpegBox.setTitle(_translate("MainWindow", "FFmpeg"))
         self.label_2.setText(_translate("MainWindow", "Command:"))
         self.ffmpegPathButton.setText(_translate("MainWindow", "..."))
@@ -218,6 +352,41 @@ class Ui_MainWindow(object):
         self.groupBox_2.setTitle(_translate("MainWindow", "Download directory"))
         self.label_5.setText(_translate("MainWindow", "Path:"))
         self.downloadDirButton.setText(_translate("MainWindow", "..."))
+        self.label_11.setText(_translate("MainWindow", "Scratch:"))
+        self.scratchDirEdit.setToolTip(_translate("MainWindow", "Partial files are written here and moved to the download directory when complete. Empty to write in place."))
+        self.scratchDirButton.setText(_translate("MainWindow", "..."))
+        self.label_12.setText(_translate("MainWindow", "Checksum:"))
+        self.checksumComboBox.setToolTip(_translate("MainWindow", "Digest of finished files, written to a sidecar file and the download archive"))
+        self.checksumComboBox.setItemText(0, _translate("MainWindow", "Off"))
+        self.checksumComboBox.setItemText(1, _translate("MainWindow", "SHA-256"))
+        self.checksumComboBox.setItemText(2, _translate("MainWindow", "BLAKE2b"))
+        self.ytdlProcessCheckBox.setToolTip(_translate("MainWindow", "Run youtube-dl downloads in a separate process that is killed at once on cancel, partial files are removed"))
+        self.ytdlProcessCheckBox.setText(_translate("MainWindow", "youtube-dl in a separate process"))
+        self.extractProcessCheckBox.setToolTip(_translate("MainWindow", "Extract video info in worker processes, so busy extractors don\'t slow down the window"))
+        self.extractProcessCheckBox.setText(_translate("MainWindow", "Extract info in separate processes"))
+        self.policyBox.setTitle(_translate("MainWindow", "Format policy"))
+        self.label_6.setText(_translate("MainWindow", "Rules:"))
+        self.policyEdit.setPlaceholderText(_translate("MainWindow", "max_height=1080; vcodec=av1>vp9>h264; acodec=opus; min_abr=128; max_size=500M"))
+        self.probeCheckBox.setToolTip(_translate("MainWindow", "Ask format URLs for missing sizes and byte range support after loading info"))
+        self.probeCheckBox.setText(_translate("MainWindow", "Probe format URLs"))
+        self.streamingBox.setTitle(_translate("MainWindow", "Streaming"))
+        self.label_7.setText(_translate("MainWindow", "Timeshift:"))
+        self.timeshiftSpinBox.setToolTip(_translate("MainWindow", "Keep the last minutes of a stream on disk so the player can seek back"))
+        self.timeshiftSpinBox.setSpecialValueText(_translate("MainWindow", "Off"))
+        self.timeshiftSpinBox.setSuffix(_translate("MainWindow", " min"))
+        self.recordingBox.setTitle(_translate("MainWindow", "Live recording"))
+        self.label_8.setText(_translate("MainWindow", "Segment length:"))
+        self.segmentSpinBox.setToolTip(_translate("MainWindow", "Record live streams with FFmpeg into segments of this length with an index file"))
+        self.segmentSpinBox.setSpecialValueText(_translate("MainWindow", "Off"))
+        self.segmentSpinBox.setSuffix(_translate("MainWindow", " min"))
+        self.label_9.setText(_translate("MainWindow", "Keep for:"))
+        self.retentionHoursSpinBox.setToolTip(_translate("MainWindow", "Delete recorded segments older than this"))
+        self.retentionHoursSpinBox.setSpecialValueText(_translate("MainWindow", "Off"))
+        self.retentionHoursSpinBox.setSuffix(_translate("MainWindow", " h"))
+        self.label_10.setText(_translate("MainWindow", "Keep at most:"))
+        self.retentionSizeSpinBox.setToolTip(_translate("MainWindow", "Delete the oldest recorded segments above this total size"))
+        self.retentionSizeSpinBox.setSpecialValueText(_translate("MainWindow", "Off"))
+        self.retentionSizeSpinBox.setSuffix(_translate("MainWindow", " GB"))
         self.applyChangesButton.setText(_translate("MainWindow", "Apply"))
         self.cancelChangesButton.setText(_translate("MainWindow", "Cancel"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.settingsTab), _translate("MainWindow", "Settings"))
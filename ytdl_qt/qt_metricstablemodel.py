@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+from PyQt5.QtCore import QAbstractTableModel, Qt, pyqtSlot
+
+from ytdl_qt.metrics import MetricsRegistry, TaskMetrics
+from ytdl_qt.utils import convert_size
+
+
+class MetricsTableModel(QAbstractTableModel):
+
+    # Header -> function producing cell text
+    columns = [
+        ('task', lambda t: str(t.task_id)),
+        ('kind', lambda t: t.kind),
+        ('title', lambda t: t.label),
+        ('status', lambda t: t.status),
+        ('extraction', lambda t: MetricsTableModel._seconds(t.extraction_latency)),
+        ('ttfb', lambda t: MetricsTableModel._seconds(t.ttfb)),
+        ('avg', lambda t: MetricsTableModel._rate(t.avg_throughput)),
+        ('peak', lambda t: MetricsTableModel._rate(t.peak_throughput)),
+        ('retries', lambda t: str(t.retries)),
+        ('merge', lambda t: MetricsTableModel._seconds(t.merge_duration)),
+        ('latency', lambda t: MetricsTableModel._seconds(t.latency)),
+        ('size', lambda t: convert_size(t.bytes_on_disk) if t.bytes_on_disk is not None else None),
+        ('duration', lambda t: MetricsTableModel._seconds(t.duration)),
+    ]
+
+    def __init__(self, registry: MetricsRegistry, parent=None):
+        super().__init__(parent)
+        self._registry = registry
+        self._data = self._registry.get_tasks()
+
+    @staticmethod
+    def _seconds(val):
+        return f'{val:.2f}s' if val is not None else None
+
+    @staticmethod
+    def _rate(val):
+        return f'{convert_size(round(val))}/s' if val is not None else None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.row() >= len(self._data):
+            return None
+
+        if role == Qt.DisplayRole:
+            task: TaskMetrics = self._data[len(self._data) - index.row() - 1]
+            return self.columns[index.column()][1](task)
+        elif role == Qt.ToolTipRole:
+            return self._data[len(self._data) - index.row() - 1].error or None
+
+    def rowCount(self, index):
+        return len(self._data)
+
+    def columnCount(self, index):
+        return len(self.columns)
+
+    def headerData(self, section, orientation, role):
+        if role == Qt.DisplayRole:
+            if orientation == Qt.Horizontal:
+                return self.columns[section][0]
+            else:
+                return section
+
+    @pyqtSlot()
+    def refresh(self):
+        """Reload tasks from the registry. Newest task goes first."""
+        self.beginResetModel()
+        self._data = self._registry.get_tasks()
+        self.endResetModel()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import logging
+from typing import Dict
+
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+
+from ytdl_qt import single_instance
+from ytdl_qt.paths import Paths
+
+
+class SingleInstanceServer(QObject):
+    """Receives URLs from later launches. See single_instance for the client side."""
+
+    urls_received = pyqtSignal(list)
+
+    max_message = 1024 * 1024
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._server = QLocalServer(self)
+        self._server.setSocketOptions(QLocalServer.UserAccessOption)
+        self._server.newConnection.connect(self._new_connection)
+        self._buffers: Dict[QLocalSocket, bytes] = {}
+
+    def listen(self) -> bool:
+        name = Paths.get_ipc_name()
+        if not self._server.listen(name):
+            # Left behind by a crashed instance; nobody answered the client
+            QLocalServer.removeServer(name)
+            if not self._server.listen(name):
+                logging.warning(f'Couldn\'t listen on {name}: {self._server.errorString()}')
+                return False
+        logging.debug(f'Listening on {name}')
+        return True
+
+    @pyqtSlot()
+    def _new_connection(self):
+        while self._server.hasPendingConnections():
+            sock = self._server.nextPendingConnection()
+            self._buffers[sock] = b''
+            sock.readyRead.connect(lambda s=sock: self._read(s))
+            sock.disconnected.connect(lambda s=sock: self._finish(s))
+
+    def _read(self, sock: QLocalSocket):
+        self._buffers[sock] += bytes(sock.readAll())
+        if len(self._buffers[sock]) > self.max_message:
+            sock.abort()
+
+    def _finish(self, sock: QLocalSocket):
+        data = self._buffers.pop(sock, b'') + bytes(sock.readAll())
+        sock.deleteLater()
+        try:
+            urls = single_instance.decode_message(data)
+        except Exception as e:
+            logging.warning(f'Ignoring message from another instance: {e}')
+            return
+        logging.debug(f'Received {urls}')
+        self.urls_received.emit(urls)
+
+    def close(self):
+        self._server.close()
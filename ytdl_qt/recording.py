@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+import calendar
+import csv
+import datetime
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+
+class Segment:
+
+    def __init__(self, name: str, start: float, duration: float, size: int, discontinuity: bool = False):
+        self.name = name
+        self.start = start  # wall clock, s since epoch
+        self.duration = duration
+        self.size = size
+        self.discontinuity = discontinuity  # first segment of a recording session
+
+    def end(self) -> float:
+        return self.start + self.duration
+
+
+class SegmentRecorder:
+    """
+    Recording of a live stream as a directory of independently playable
+    MPEG-TS segments. ffmpeg's segment muxer reports finished segments in a
+    CSV list, the recorder tails it and keeps an m3u8 index of the segments
+    which players open like a single file. Segments out of the retention
+    limits are deleted oldest first. A crash loses the segment in progress
+    at most, it's picked up from disk the next time.
+    """
+
+    index_name = 'index.m3u8'
+    list_name = '.segments.csv'  # written by ffmpeg, one session
+    segment_ext = '.ts'
+    # Start time in UTC, strftime pattern for ffmpeg. Local time names
+    # would repeat in the hour the clocks go back and overwrite segments.
+    name_format = '%Y%m%d-%H%M%SZ'
+
+    def __init__(self, directory: str, segment_seconds: int, max_age: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.max_age = max_age  # s
+        self.max_bytes = max_bytes
+        self.segments: List[Segment] = []
+        self._sequence = 0  # media sequence of the first segment in the index
+        self._list_pos = 0
+        self._ended = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+        self._adopt_orphans()
+        self._list_path = os.path.join(directory, self.list_name)
+        with open(self._list_path, 'w'):
+            pass
+        self._new_session = True
+        self._apply_retention()
+        self._write_index()
+
+    def get_index_path(self) -> str:
+        return os.path.join(self.directory, self.index_name)
+
+    def output_args(self) -> List[str]:
+        """Return ffmpeg output options, the output file is the result of get_output_pattern."""
+        return [
+            '-f', 'segment',
+            '-segment_time', str(self.segment_seconds),
+            '-segment_format', 'mpegts',
+            '-segment_list', self._list_path,
+            '-segment_list_type', 'csv',
+            '-strftime', '1',
+        ]
+
+    @staticmethod
+    def ffmpeg_env() -> Dict[str, str]:
+        """Return environment for ffmpeg, its strftime has to work in UTC."""
+        return dict(os.environ, TZ='UTC0')
+
+    def get_output_pattern(self) -> str:
+        return os.path.join(self.directory, self.name_format + self.segment_ext)
+
+    def get_total_size(self) -> int:
+        return sum(i.size for i in self.segments)
+
+    def _load_index(self):
+        path = self.get_index_path()
+        try:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        start = None
+        duration = None
+        discontinuity = False
+        for line in lines:
+            if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+                self._sequence = int(line.partition(':')[2])
+            elif line == '#EXT-X-DISCONTINUITY':
+                discontinuity = True
+            elif line.startswith('#EXT-X-PROGRAM-DATE-TIME:'):
+                start = datetime.datetime.fromisoformat(line.partition(':')[2]).timestamp()
+            elif line.startswith('#EXTINF:'):
+                duration = float(line.partition(':')[2].rstrip(','))
+            elif line and not line.startswith('#'):
+                file = os.path.join(self.directory, line)
+                if os.path.isfile(file) and duration is not None:
+                    self.segments.append(Segment(
+                        line, start or os.path.getmtime(file) - duration, duration,
+                        os.path.getsize(file), discontinuity))
+                else:
+                    logging.debug(f'Dropping missing segment {line} from the index')
+                start = None
+                duration = None
+                discontinuity = False
+
+    def _parse_start(self, name: str) -> Optional[float]:
+        try:
+            stem = os.path.splitext(name)[0]
+            return calendar.timegm(time.strptime(stem, self.name_format))
+        except ValueError:
+            return None
+
+    def _adopt_orphans(self):
+        """Index segments left behind by a session that didn't end cleanly."""
+        known = {i.name for i in self.segments}
+        last = self.segments[-1].start if self.segments else 0
+        for name in sorted(os.listdir(self.directory)):
+            start = self._parse_start(name)
+            if not name.endswith(self.segment_ext) or name in known or start is None or start < last:
+                continue
+            file = os.path.join(self.directory, name)
+            duration = max(0.0, os.path.getmtime(file) - start)
+            logging.debug(f'Adopting unindexed segment {name}')
+            self.segments.append(Segment(name, start, duration, os.path.getsize(file), True))
+
+    def update(self) -> bool:
+        """Pick up segments finished by ffmpeg. Return True if the index changed."""
+        try:
+            with open(self._list_path, newline='') as f:
+                f.seek(self._list_pos)
+                data = f.read()
+        except OSError:
+            return False
+        # Only complete lines, ffmpeg may be in the middle of one
+        data = data[:data.rfind('\n') + 1]
+        if not data:
+            return False
+        self._list_pos += len(data.encode())
+        for row in csv.reader(data.splitlines()):
+            if len(row) < 3:
+                continue
+            name = os.path.basename(row[0])
+            duration = float(row[2]) - float(row[1])
+            file = os.path.join(self.directory, name)
+            try:
+                size = os.path.getsize(file)
+            except OSError:
+                continue
+            start = self._parse_start(name) or time.time() - duration
+            self.segments.append(Segment(name, start, duration, size, self._new_session))
+            self._new_session = False
+            logging.debug(f'Recorded segment {name}, {duration:.1f} s')
+        self._apply_retention()
+        self._write_index()
+        return True
+
+    def _apply_retention(self):
+        now = time.time()
+        while self.segments:
+            oldest = self.segments[0]
+            too_old = self.max_age is not None and oldest.end() < now - self.max_age
+            too_big = self.max_bytes is not None and self.get_total_size() > self.max_bytes
+            if not too_old and not too_big:
+                break
+            try:
+                os.remove(os.path.join(self.directory, oldest.name))
+            except OSError as e:
+                logging.warning(f'Couldn\'t remove segment {oldest.name}: {e}')
+            logging.debug(f'Retention removed segment {oldest.name}')
+            del self.segments[0]
+            self._sequence += 1
+
+    def _write_index(self):
+        target = max([self.segment_seconds] + [i.duration for i in self.segments])
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{int(target + 0.999)}',
+            f'#EXT-X-MEDIA-SEQUENCE:{self._sequence}',
+        ]
+        for i, segment in enumerate(self.segments):
+            if segment.discontinuity and i > 0:
+                lines.append('#EXT-X-DISCONTINUITY')
+            start = datetime.datetime.fromtimestamp(segment.start, datetime.timezone.utc)
+            lines.append(f'#EXT-X-PROGRAM-DATE-TIME:{start.isoformat(timespec="milliseconds")}')
+            lines.append(f'#EXTINF:{segment.duration:.3f},')
+            lines.append(segment.name)
+        if self._ended:
+            lines.append('#EXT-X-ENDLIST')
+        path = self.get_index_path()
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, path)
+
+    def finish(self):
+        """Call after ffmpeg exited. Indexes the last segment and closes the index."""
+        self.update()
+        self._ended = True
+        self._write_index()
+        try:
+            os.remove(self._list_path)
+        except OSError:
+            pass
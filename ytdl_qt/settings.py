@@ -1,6 +1,9 @@
+import logging
 import os
 
+from ytdl_qt.checksum import Checksum
 from ytdl_qt.config_file_manager import ConfigFileManager
+from ytdl_qt.format_policy import FormatPolicy
 from ytdl_qt.paths import Paths
 
 
@@ -41,6 +44,82 @@ class FfmpegSetting(Setting):
             super().set('')
 
 
+class FormatPolicySetting(Setting):
+
+    def __init__(self, default=''):
+        super().__init__(default)
+
+    def set(self, arg: str):
+        """Normalizes the policy string. Throws exception on malformed policy."""
+        if arg:
+            super().set(str(FormatPolicy.parse(arg)))
+        else:
+            super().set('')
+
+    def get_policy(self) -> FormatPolicy:
+        return FormatPolicy.parse(self.current)
+
+
+class ChecksumSetting(Setting):
+
+    def __init__(self, default=''):
+        super().__init__(default)
+
+    def set(self, arg: str):
+        """Throws exception on unknown algorithm."""
+        if arg and arg not in Checksum.algorithms:
+            raise Exception(f'Unknown checksum algorithm {arg}, use one of {", ".join(Checksum.algorithms)}')
+        super().set(arg)
+
+
+class FlagSetting(Setting):
+
+    def __init__(self, default='0'):
+        super().__init__(default)
+
+    def set(self, arg: str):
+        """Throws exception if not 0 or 1."""
+        if arg and arg not in ('0', '1'):
+            raise Exception(f'Flag must be 0 or 1, not {arg}')
+        super().set(arg)
+
+    def get_value(self) -> bool:
+        return self.current == '1'
+
+
+class RangeSetting(Setting):
+
+    def __init__(self, name: str, maximum: int, unit: str, default='0'):
+        super().__init__(default)
+        self.name = name
+        self.maximum = maximum
+        self.unit = unit
+
+    def set(self, arg: str):
+        """Throws exception if not a number in range."""
+        if arg:
+            value = int(arg)
+            if not 0 <= value <= self.maximum:
+                raise Exception(f'{self.name} must be 0 to {self.maximum} {self.unit}')
+            super().set(str(value))
+        else:
+            super().set('')
+
+    def get_value(self) -> int:
+        return int(self.current)
+
+
+class TimeshiftSetting(RangeSetting):
+
+    max_minutes = 240
+
+    def __init__(self, default='0'):
+        super().__init__('Timeshift', self.max_minutes, 'minutes', default)
+
+    def get_minutes(self) -> int:
+        return self.get_value()
+
+
 # class DownloadDirSetting(Setting):
 #
 # 	def __init__(self, default=''):
@@ -59,6 +138,16 @@ class Settings:
         self.player_params = Setting()
         # self.download_dir = DownloadDirSetting()
         self.download_dir = Setting()
+        self.scratch_dir = Setting()
+        self.checksum = ChecksumSetting()
+        self.ytdl_process = FlagSetting()
+        self.extract_processes = FlagSetting()
+        self.format_policy = FormatPolicySetting()
+        self.probe_formats = FlagSetting()
+        self.timeshift_minutes = TimeshiftSetting()
+        self.segment_minutes = RangeSetting('Segment length', 24 * 60, 'minutes')
+        self.retention_hours = RangeSetting('Retention age', 24 * 365, 'hours')
+        self.retention_gb = RangeSetting('Retention size', 100000, 'GB')
 
         self.config = ConfigFileManager()
 
@@ -66,10 +155,52 @@ class Settings:
         self.player_path.set(self.config.player_path)
         self.player_params.set(self.config.player_params)
         self.download_dir.set(self.config.download_dir)
+        self.scratch_dir.set(self.config.scratch_dir)
+        try:
+            self.checksum.set(self.config.checksum)
+        except Exception as e:
+            logging.warning(f'Ignoring saved checksum: {e}')
+        try:
+            self.format_policy.set(self.config.format_policy)
+        except Exception as e:
+            logging.warning(f'Ignoring saved format policy: {e}')
+        try:
+            self.ytdl_process.set(self.config.ytdl_process)
+        except Exception as e:
+            logging.warning(f'Ignoring saved youtube-dl process setting: {e}')
+        try:
+            self.extract_processes.set(self.config.extract_processes)
+        except Exception as e:
+            logging.warning(f'Ignoring saved extraction process setting: {e}')
+        try:
+            self.probe_formats.set(self.config.probe_formats)
+        except Exception as e:
+            logging.warning(f'Ignoring saved format probing: {e}')
+        try:
+            self.timeshift_minutes.set(self.config.timeshift_minutes)
+        except Exception as e:
+            logging.warning(f'Ignoring saved timeshift: {e}')
+        for setting, value in ((self.segment_minutes, self.config.segment_minutes),
+                               (self.retention_hours, self.config.retention_hours),
+                               (self.retention_gb, self.config.retention_gb)):
+            try:
+                setting.set(value)
+            except Exception as e:
+                logging.warning(f'Ignoring saved {setting.name.lower()}: {e}')
 
     def save(self):
         self.config.ffmpeg_path = self.ffmpeg_path.current
         self.config.player_path = self.player_path.current
         self.config.player_params = self.player_params.current
         self.config.download_dir = self.download_dir.current
+        self.config.scratch_dir = self.scratch_dir.current
+        self.config.checksum = self.checksum.current
+        self.config.ytdl_process = self.ytdl_process.current
+        self.config.extract_processes = self.extract_processes.current
+        self.config.format_policy = self.format_policy.current
+        self.config.probe_formats = self.probe_formats.current
+        self.config.timeshift_minutes = self.timeshift_minutes.current
+        self.config.segment_minutes = self.segment_minutes.current
+        self.config.retention_hours = self.retention_hours.current
+        self.config.retention_gb = self.retention_gb.current
         self.config.save()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import socket
+from typing import List
+
+from ytdl_qt.paths import Paths
+
+# Client side of the single-instance mode. Uses only the standard library,
+# so a second launch can hand its URLs over without importing Qt or yt-dlp.
+# The server side is qt_single_instance.
+
+connect_timeout = 0.5  # s
+
+
+def encode_message(urls: List[str]) -> bytes:
+    return json.dumps({'urls': urls}).encode() + b'\n'
+
+
+def decode_message(data: bytes) -> List[str]:
+    """Throws exception on malformed message."""
+    urls = json.loads(data.decode())['urls']
+    if not isinstance(urls, list) or not all(isinstance(i, str) for i in urls):
+        raise ValueError('Malformed URL list')
+    return urls
+
+
+def forward(urls: List[str]) -> bool:
+    """Send URLs to the running instance. Return False if there is none."""
+    name = Paths.get_ipc_name()
+    data = encode_message(urls)
+    try:
+        if os.name == 'nt':
+            with open(rf'\\.\pipe\{name}', 'wb', buffering=0) as pipe:
+                pipe.write(data)
+        else:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.settimeout(connect_timeout)
+                s.connect(name)
+                s.sendall(data)
+    except OSError as e:
+        logging.debug(f'No running instance at {name}: {e}')
+        return False
+    logging.debug(f'Forwarded {urls} to {name}')
+    return True
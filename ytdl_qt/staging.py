@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import errno
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Optional, Set
+
+from ytdl_qt.checksum import Checksum
+from ytdl_qt.disk_space import preallocate
+
+
+class Staging:
+    """
+    Partial files of one download live in a directory on the scratch
+    filesystem and are moved into the download directory once complete.
+    On the same device the move is a rename. Across devices the file is
+    copied in one sequential pass next to its destination and renamed
+    there, so the destination never has a partial file under its final name.
+    Existing files in the destination are never replaced, the new one gets
+    a ' (n)' suffix instead.
+    """
+
+    copy_chunk = 16 * 1024 * 1024
+    part_suffix = '.part'
+
+    # Final names of commits in progress, a copy takes a while before the name exists
+    _claimed: Set[str] = set()
+    _claim_lock = threading.Lock()
+
+    def __init__(self, scratch_dir: str):
+        self.scratch_dir = scratch_dir
+        self._dir = None
+
+    def get_dir(self) -> str:
+        """Private directory of the download, created on first use."""
+        if self._dir is None:
+            os.makedirs(self.scratch_dir, exist_ok=True)
+            self._dir = tempfile.mkdtemp(prefix='ytdl-qt-', dir=self.scratch_dir)
+        return self._dir
+
+    def commit(self, path: str, dest_dir: str, checksum: Optional[Checksum] = None,
+               cancelled: Optional[threading.Event] = None) -> str:
+        """
+        Move staged file to dest_dir and return the final path. Blocks.
+        If the file is copied, the bytes are fed to checksum on the way.
+        Throws exception if cancelled is set before the file is in place.
+        """
+        dest_dir = dest_dir or os.getcwd()
+        os.makedirs(dest_dir, exist_ok=True)
+        final = self._claim(os.path.join(dest_dir, os.path.basename(path)))
+        try:
+            self._check(cancelled)
+            try:
+                os.replace(path, final)
+                logging.debug(f'Renamed {path} to {final}')
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                self._copy(path, final, checksum, cancelled)
+                os.remove(path)
+        finally:
+            with self._claim_lock:
+                self._claimed.discard(final)
+        self.cleanup()
+        return final
+
+    @classmethod
+    def _claim(cls, path: str) -> str:
+        """Return path, or path with ' (n)' before the extension if it's taken."""
+        stem, ext = os.path.splitext(path)
+        candidate = path
+        with cls._claim_lock:
+            n = 1
+            while candidate in cls._claimed or os.path.lexists(candidate):
+                candidate = f'{stem} ({n}){ext}'
+                n += 1
+            cls._claimed.add(candidate)
+        if candidate != path:
+            logging.info(f'{path} exists, saving as {candidate}')
+        return candidate
+
+    @staticmethod
+    def _check(cancelled: Optional[threading.Event]):
+        if cancelled is not None and cancelled.is_set():
+            raise Exception('Cancelled')
+
+    @classmethod
+    def _copy(cls, src: str, dst: str, checksum: Optional[Checksum] = None,
+              cancelled: Optional[threading.Event] = None):
+        part = dst + cls.part_suffix
+        try:
+            with open(src, 'rb') as fin, open(part, 'wb') as fout:
+                size = os.fstat(fin.fileno()).st_size
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(fin.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                preallocate(fout.fileno(), size)
+                if checksum is not None:
+                    cls._copy_hashed(fin, fout, checksum, cancelled)
+                    checksum.path = dst
+                else:
+                    cls._copy_plain(fin, fout, size, cancelled)
+                fout.truncate()
+                fout.flush()
+                os.fsync(fout.fileno())
+            cls._check(cancelled)
+            os.replace(part, dst)
+        except BaseException:
+            # The staged file is still there, nothing is lost but the copy
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+            raise
+        logging.debug(f'Copied {size} B from {src} to {dst}')
+
+    @classmethod
+    def _copy_hashed(cls, fin, fout, checksum: Checksum, cancelled: Optional[threading.Event]):
+        # The bytes pass through userspace anyway, hash them in the same pass
+        while True:
+            cls._check(cancelled)
+            data = fin.read(cls.copy_chunk)
+            if not data:
+                break
+            checksum.update(data)
+            fout.write(data)
+
+    @classmethod
+    def _copy_plain(cls, fin, fout, size: int, cancelled: Optional[threading.Event]):
+        copied = 0
+        try:
+            # In-kernel copy without passing the data through Python
+            while copied < size:
+                cls._check(cancelled)
+                sent = os.sendfile(fout.fileno(), fin.fileno(), copied, cls.copy_chunk)
+                if sent == 0:
+                    break
+                copied += sent
+        except (AttributeError, OSError):
+            fin.seek(copied)
+            fout.seek(copied)
+            while True:
+                cls._check(cancelled)
+                data = fin.read(cls.copy_chunk)
+                if not data:
+                    break
+                fout.write(data)
+
+    def cleanup(self):
+        """Remove the directory with whatever is left in it."""
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+import logging
+import mmap
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import BinaryIO, Optional, Tuple
+
+from ytdl_qt.disk_space import preallocate
+
+
+class RingFile:
+    """
+    Fixed-size ring buffer in a memory-mapped file. Positions are absolute
+    stream offsets, the last size bytes of the stream are available.
+    Memory use doesn't grow with the stream, the pages are file-backed.
+    """
+
+    packet_size = 188  # MPEG-TS, keeps absolute offsets packet aligned
+
+    def __init__(self, path: str, size: int):
+        self.size = max(self.packet_size * 64, size - size % self.packet_size)
+        self._path = path
+        self._file = open(path, 'w+b')
+        try:
+            # Writes into the mapping can't report ENOSPC, a hole left by truncate
+            # would kill the process with SIGBUS on a full disk
+            if not preallocate(self._file.fileno(), self.size):
+                self._file.truncate(self.size)
+        except OSError:
+            self._file.close()
+            os.remove(path)
+            raise
+        self._map = mmap.mmap(self._file.fileno(), self.size)
+        self._cond = threading.Condition()
+        self.head = 0  # offset after the last written byte
+        self._writing_end = 0  # end of the write in progress
+        self.eof = False  # source ended, data stays readable
+        self.closed = False
+
+    def oldest(self) -> int:
+        return max(0, self.head - self.size)
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        if len(view) > self.size:
+            with self._cond:
+                self.head += len(view) - self.size
+            view = view[-self.size:]
+        with self._cond:
+            self._writing_end = self.head + len(view)
+        pos = self.head % self.size
+        first = min(len(view), self.size - pos)
+        self._map[pos:pos + first] = view[:first]
+        self._map[:len(view) - first] = view[first:]
+        with self._cond:
+            self.head = self._writing_end
+            self._cond.notify_all()
+
+    def clamp(self, offset: int) -> int:
+        """Return packet aligned offset within the available data."""
+        with self._cond:
+            offset = min(max(offset, self.oldest()), self.head)
+        offset -= offset % self.packet_size
+        if offset < self.oldest():
+            offset += self.packet_size
+        return offset
+
+    def read(self, offset: int, size: int, timeout: float) -> Optional[Tuple[int, bytes]]:
+        """
+        Return (offset, data) starting at offset or the oldest available offset
+        if it was overwritten. Waits for data at the live edge. None on timeout or close.
+        """
+        with self._cond:
+            if offset >= self.head and not self.closed and not self.eof:
+                self._cond.wait(timeout)
+            if self.closed or offset >= self.head:
+                return None
+        while True:
+            if offset < self.oldest():
+                offset = self.clamp(offset)
+            end = min(self.head, offset + size)
+            pos = offset % self.size
+            first = min(end - offset, self.size - pos)
+            data = self._map[pos:pos + first] + self._map[:end - offset - first]
+            with self._cond:
+                # Copied bytes are only valid if the writer didn't reach them meanwhile
+                if offset >= self._writing_end - self.size:
+                    return offset, data
+
+    def end(self):
+        with self._cond:
+            self.eof = True
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def release(self):
+        """Unmap and delete the file. Readers have to be gone."""
+        self._map.close()
+        self._file.close()
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+
+class TimeshiftRelay:
+    """
+    Copies MPEG-TS from source into a RingFile and serves it over local HTTP.
+    Range requests let the player seek anywhere inside the buffered window,
+    reads at the live edge wait for new data.
+    """
+
+    # Length announced to the player. Players only seek in streams of known length
+    virtual_size = 1 << 50
+    chunk_size = 64 * 1024
+    read_timeout = 1  # s
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, fmt, *args):
+            logging.debug(fmt % args)
+
+        def _headers(self) -> int:
+            relay: TimeshiftRelay = self.server.relay
+            ring = relay.ring
+            match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+            if match:
+                start = ring.clamp(int(match[1]))
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{relay.virtual_size - 1}/{relay.virtual_size}')
+            else:
+                start = ring.clamp(0)
+                self.send_response(200)
+            self.send_header('Content-Type', 'video/mp2t')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(relay.virtual_size - start))
+            self.end_headers()
+            return start
+
+        def do_HEAD(self):
+            self._headers()
+
+        def do_GET(self):
+            ring = self.server.relay.ring
+            pos = self._headers()
+            try:
+                while not ring.closed:
+                    chunk = ring.read(pos, TimeshiftRelay.chunk_size, TimeshiftRelay.read_timeout)
+                    if chunk is None:
+                        if ring.eof and pos >= ring.head:
+                            break
+                        continue
+                    offset, data = chunk
+                    if offset != pos:
+                        logging.debug(f'Reader fell behind the buffer, skipped {offset - pos} B')
+                    self.wfile.write(data)
+                    pos = offset + len(data)
+            except (BrokenPipeError, ConnectionResetError, ValueError):
+                # Player seeked or quit, or the buffer was released under us
+                pass
+
+    def __init__(self, source: BinaryIO, path: str, size: int):
+        self.ring = RingFile(path, size)
+        self._source = source
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self.Handler)
+        self._server.daemon_threads = True
+        self._server.relay = self
+        self._pump_thread = threading.Thread(target=self._pump, name='TimeshiftPump', daemon=True)
+        self._serve_thread = threading.Thread(target=self._server.serve_forever, name='TimeshiftServer', daemon=True)
+        self._pump_thread.start()
+        self._serve_thread.start()
+        logging.debug(f'Timeshift relay at {self.url()}, {self.ring.size} B buffer in {path}')
+
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/stream.ts'
+
+    def _pump(self):
+        fd = self._source.fileno()
+        while True:
+            try:
+                data = os.read(fd, self.chunk_size)
+            except OSError:
+                break
+            if not data:
+                break
+            self.ring.write(data)
+        self.ring.end()
+        logging.debug('Timeshift source ended')
+
+    def close(self):
+        self.ring.close()
+        self._server.shutdown()
+        self._server.server_close()
+        self._pump_thread.join()
+        self.ring.release()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import collections
+import contextlib
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+
+class AsyncSpan:
+    """Span that may end in another thread or interleave with others, e.g. in coroutines."""
+
+    def __init__(self, tracer, name: str, cat: str, span_id: int):
+        self._tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.id = span_id
+        self._ended = False
+
+    def end(self, **args):
+        """Close the span, args are added to it. Later calls do nothing."""
+        if self._ended:
+            return
+        self._ended = True
+        self._tracer._record('e', self.name, self.cat, args, span_id=self.id)
+
+
+class Tracer:
+    """
+    Lightweight spans and instant events kept in a ring buffer, exported as
+    Chrome trace-event JSON for chrome://tracing or Perfetto. Recording is
+    an append of a tuple, old events are dropped when the buffer is full.
+    """
+
+    capacity = 100000  # events
+
+    def __init__(self):
+        self._events = collections.deque(maxlen=self.capacity)
+        self._ids = itertools.count(1)
+        self._thread_names: Dict[int, str] = {}
+        self.enabled = True
+
+    @staticmethod
+    def _now() -> float:
+        return time.perf_counter() * 1e6  # trace timestamps are in µs
+
+    def _record(self, ph: str, name: str, cat: str, args: dict,
+                ts: Optional[float] = None, dur: Optional[float] = None, span_id: Optional[int] = None):
+        if not self.enabled:
+            return
+        tid = threading.get_native_id()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = threading.current_thread().name
+        # deque.append is atomic, no lock needed
+        self._events.append((ph, name, cat, self._now() if ts is None else ts, dur, tid, span_id, args))
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = '', **args):
+        """Trace the block in the current thread."""
+        start = self._now()
+        try:
+            yield
+        finally:
+            self._record('X', name, cat, args, ts=start, dur=self._now() - start)
+
+    def begin(self, name: str, cat: str = '', **args) -> AsyncSpan:
+        span = AsyncSpan(self, name, cat, next(self._ids))
+        self._record('b', name, cat, args, span_id=span.id)
+        return span
+
+    def instant(self, name: str, cat: str = '', **args):
+        self._record('i', name, cat, args)
+
+    def clear(self):
+        self._events.clear()
+
+    def as_dict(self) -> dict:
+        pid = os.getpid()
+        events = [
+            {'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+            for tid, name in list(self._thread_names.items())
+        ]
+        for ph, name, cat, ts, dur, tid, span_id, args in list(self._events):
+            event = {'ph': ph, 'name': name, 'cat': cat or 'default', 'ts': ts, 'pid': pid, 'tid': tid}
+            if dur is not None:
+                event['dur'] = dur
+            if span_id is not None:
+                event['id'] = span_id
+            if ph == 'i':
+                event['s'] = 't'
+            if args:
+                event['args'] = args
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, default=str)
+
+
+tracer = Tracer()
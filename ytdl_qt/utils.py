@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 
+import http.cookies
 import math
-import subprocess
+from typing import Dict, List
+
+from ytdl_qt import executables
 
 
 def convert_size(size_bytes):
@@ -23,29 +26,109 @@ def check_dict_attribute(item, key):
 
 
 def check_ffmpeg(path: str) -> bool:
-    try:
-        subprocess.run(
-            [path, '-version'],
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        return True
-    except Exception:
-        return False
-
-
-def build_ffmpeg_args_list(url_list, output_file=None, flv=False, force_ow=True, quiet=False, quoted=False):
-    """Return list with arguments for ffmpeg execution."""
+    """Probe result is cached per binary, see executables."""
+    exe = executables.registry.get(path)
+    return exe is not None and exe.usable()
+
+
+def ffmpeg_input_args(ffmpeg_path: str, protocol: str, clip=None) -> List[str]:
+    """
+    Return input options for the protocol which the installed ffmpeg supports.
+    clip is a ClipRange to read instead of the whole input.
+    """
+    args = clip.ffmpeg_input_args() if clip is not None else []
+    exe = executables.registry.get_ffmpeg(ffmpeg_path)
+    if exe is None:
+        return args
+    if protocol in ('http', 'https', 'm3u8', 'm3u8_native'):
+        # Resume the transfer instead of failing on dropped connections
+        if exe.has_option('reconnect'):
+            args += ['-reconnect', '1']
+        if exe.has_option('reconnect_streamed'):
+            args += ['-reconnect_streamed', '1']
+        if exe.has_option('reconnect_delay_max'):
+            args += ['-reconnect_delay_max', '5']
+    if protocol in ('http', 'https') and exe.has_option('multiple_requests'):
+        args += ['-multiple_requests', '1']
+    if protocol in ('m3u8', 'm3u8_native') and exe.has_option('http_persistent'):
+        # Keep-alive between playlist segments
+        args += ['-http_persistent', '1']
+    return args
+
+
+def ffmpeg_request_args(headers: Dict[str, str], cookies: List[http.cookies.Morsel]) -> List[str]:
+    """Input options sending the headers and cookies youtube-dl would send for the format."""
+    args = []
+    if headers:
+        args += ['-headers', ''.join(f'{k}: {v}\r\n' for k, v in headers.items())]
+    if cookies:
+        # Set-Cookie lines, ffmpeg sends each only to its domain
+        args += ['-cookies', ''.join(f'{c.key}={c.value}; path={c["path"] or "/"}; domain={c["domain"]};\n'
+                                     for c in cookies)]
+    return args
+
+
+def ffmpeg_live_input_args(ffmpeg_path: str, protocol: str) -> List[str]:
+    """
+    Input options of the low-latency live profile, on top of ffmpeg_input_args.
+    Short probing, no demuxer buffering and the playlist read from the live edge.
+    """
+    # Enough for the codec parameters of copied streams, the defaults are 5 MB and 5 s
+    args = ['-fflags', 'nobuffer', '-probesize', '500000', '-analyzeduration', '500000']
+    exe = executables.registry.get_ffmpeg(ffmpeg_path)
+    if exe is None or protocol not in ('m3u8', 'm3u8_native'):
+        return args
+    if exe.has_option('live_start_index'):
+        # Newest segment instead of the third to last
+        args += ['-live_start_index', '-1']
+    if exe.has_option('http_multiple'):
+        # Request the next segment while the current one is read
+        args += ['-http_multiple', '1']
+    if exe.has_option('reconnect_delay_max'):
+        # A stalled live stream is better restarted than waited for
+        args += ['-reconnect_delay_max', '1']
+    return args
+
+
+def player_low_latency_args(player_path: str) -> List[str]:
+    """Return cache options of known players for low-latency live playback, empty for others."""
+    exe = executables.registry.get_player(player_path)
+    if exe is None:
+        return []
+    if exe.player == 'mpv':
+        return ['--profile=low-latency', '--cache=no']
+    if exe.player == 'vlc':
+        return ['--file-caching=300', '--network-caching=300']
+    if exe.player == 'ffplay':
+        return ['-fflags', 'nobuffer', '-flags', 'low_delay', '-framedrop']
+    if exe.player == 'mplayer':
+        return ['-nocache']
+    return []
+
+
+def build_ffmpeg_args_list(url_list, output_file=None, flv=False, force_ow=True, quiet=False, quoted=False,
+                           input_args_list=None, progress=False, output_format=None, output_args=None,
+                           progress_url='pipe:1', low_latency=False):
+    """
+    Return list with arguments for ffmpeg execution. input_args_list holds options for every input.
+    progress writes key=value progress reports to progress_url instead of the stats line.
+    output_format overrides the container of stdout output.
+    output_args are options of the output file, e.g. of its muxer.
+    low_latency writes every packet out as soon as it's muxed.
+    """
     assert len(url_list) > 0
     ffmpeg_cmd = ['-hide_banner', '-nostdin']
     if quiet:
         ffmpeg_cmd += ['-loglevel', 'panic']
+    if progress:
+        ffmpeg_cmd += ['-progress', progress_url, '-nostats']
     if force_ow:
         ffmpeg_cmd.append('-y')
     else:
         ffmpeg_cmd.append('-n')
-    for item in url_list:
+    for index, item in enumerate(url_list):
+        if input_args_list and index < len(input_args_list):
+            ffmpeg_cmd += input_args_list[index]
         ffmpeg_cmd += ['-i', f"\"{item}\"" if quoted else item]
     url_list_len = len(url_list)
     if url_list_len > 1:
@@ -54,8 +137,14 @@ def build_ffmpeg_args_list(url_list, output_file=None, flv=False, force_ow=True,
             ffmpeg_cmd += ['-map', str(i)]
     # TODO: Figure out the AAC bullshit
     ffmpeg_cmd += ['-c', 'copy']
+    if low_latency:
+        ffmpeg_cmd += ['-flush_packets', '1', '-avioflags', 'direct', '-muxdelay', '0', '-muxpreload', '0']
+    if output_args:
+        ffmpeg_cmd += output_args
     if output_file is None:
-        if flv:
+        if output_format:
+            ffmpeg_cmd += ['-f', output_format, '-']
+        elif flv:
             ffmpeg_cmd += ['-f', 'flv', '-']
         else:
             ffmpeg_cmd += ['-f', 'matroska', '-']
@@ -1,10 +1,26 @@
 #!/usr/bin/env python3
 
-from typing import List
+import http.cookies
+import logging
+import re
+import threading
+import time
+import urllib.parse
+from typing import Dict, List, Optional
 
 from yt_dlp import YoutubeDL
+try:
+	from yt_dlp.cookies import LenientSimpleCookie
+except ImportError:
+	# yt-dlp older than the cookies field of formats
+	from http.cookies import SimpleCookie as LenientSimpleCookie
 #from youtube_dl import YoutubeDL
 
+from ytdl_qt import metrics
+from ytdl_qt.format_policy import FormatPolicy
+from ytdl_qt.probe import prober
+from ytdl_qt.profiling import profiler
+from ytdl_qt.tracing import tracer
 from ytdl_qt.utils import check_dict_attribute, convert_size
 
 # class LoggerForYtdl(object):
@@ -33,10 +49,20 @@ class Info:
 		formats_received = 'formats'
 		id = 'format_id'
 		hooks = 'progress_hooks'
+		pp_hooks = 'postprocessor_hooks'
 		title = 'title'
 		url = 'webpage_url'
 		format_url = 'url'
 		ffmpeg_location = 'ffmpeg_location'
+		duration = 'duration'
+		video_id = 'id'
+		extractor = 'extractor_key'
+		is_live = 'is_live'
+		accept_ranges = 'accept_ranges'  # filled by probing
+		http_headers = 'http_headers'
+		cookies = 'cookies'  # Set-Cookie syntax, scoped by domain
+		downloader_options = 'downloader_options'
+		http_chunk_size = 'http_chunk_size'
 
 		# For hooks
 		eta = 'eta'
@@ -47,7 +73,41 @@ class Info:
 		downloading = 'downloading'
 		finished = 'finished'
 		filename = 'filename'
+		tmpfilename = 'tmpfilename'
 		error = 'error'
+		started = 'started'
+		postprocessor = 'postprocessor'
+		info_dict = 'info_dict'
+		filepath = 'filepath'
+
+	# Format fields that change when URLs are signed again
+	url_fields = ['url', 'manifest_url', 'fragment_base_url', 'fragments', 'http_headers', 'cookies']
+
+	url_ttl = 5 * 3600  # s, for URLs that don't say when they expire
+	expiry_margin = 60  # s, refresh a bit early, downloads don't start instantly
+
+	# YoutubeDL instances kept per thread and parameters. Setting one up with
+	# its extractors takes tens of ms, extraction threads live long
+	_warm = threading.local()
+	max_warm = 4
+
+	@classmethod
+	def _get_ytdl(cls, ytdl_params: dict) -> YoutubeDL:
+		instances = getattr(cls._warm, 'instances', None)
+		if instances is None:
+			instances = cls._warm.instances = {}
+		key = repr(sorted(ytdl_params.items()))
+		ytdl = instances.get(key)
+		if ytdl is None:
+			if len(instances) >= cls.max_warm:
+				instances.pop(next(iter(instances))).close()
+			ytdl = instances[key] = YoutubeDL(ytdl_params)
+		return ytdl
+
+	@classmethod
+	def extract_info_dict(cls, url: str, ytdl_params: dict) -> dict:
+		"""Return raw extract_info output. YoutubeDL instances stay warm per thread."""
+		return cls._get_ytdl(ytdl_params).extract_info(url=url, download=False)
 
 	def __init__(self, url: str, ytdl_params=None):
 		assert url
@@ -55,8 +115,99 @@ class Info:
 		if ytdl_params is None:
 			ytdl_params = {}
 
-		with YoutubeDL(ytdl_params) as ytdl:
-			self._info = ytdl.extract_info(url=url, download=False)
+		start = time.monotonic()
+		with tracer.span('extract', 'info', url=url), profiler.operation(profiler.Scopes.info):
+			self._info = self.extract_info_dict(url, ytdl_params)
+		self.extraction_time = time.monotonic() - start
+		metrics.registry.record_extraction(self._info.get(Info.Keys.title, url), self.extraction_time)
+		self._init_expiry(ytdl_params)
+		self.probed = False
+
+	@classmethod
+	def from_info_dict(cls, info: dict, ytdl_params=None):
+		"""Build Info from an already extracted (e.g. recorded) info dictionary."""
+		obj = cls.__new__(cls)
+		obj._info = info
+		obj.extraction_time = None
+		obj._init_expiry(ytdl_params if ytdl_params is not None else {})
+		obj.probed = False
+		return obj
+
+	@classmethod
+	def from_extraction(cls, url: str, info: dict, extraction_time: float, ytdl_params=None):
+		"""Build Info from extract_info output of another process, see extract_pool."""
+		obj = cls.from_info_dict(info, ytdl_params)
+		obj.extraction_time = extraction_time
+		metrics.registry.record_extraction(info.get(Info.Keys.title, url), extraction_time)
+		return obj
+
+	def probe(self) -> int:
+		"""Fill in sizes, range support and redirect targets of direct format URLs. Blocks."""
+		count = prober.probe(self.get_formats())
+		self.probed = True
+		return count
+
+	def _init_expiry(self, ytdl_params: dict):
+		self._ytdl_params = ytdl_params
+		self._refresh_lock = threading.Lock()
+		# format id (None without formats) -> time its URL was fetched
+		self._fetched: Dict[Optional[str], float] = {}
+		self._extracted_at = time.time()
+
+	@staticmethod
+	def parse_expiry(url: str) -> Optional[float]:
+		"""Return expiry timestamp from a signed URL or None."""
+		parsed = urllib.parse.urlparse(url)
+		query = urllib.parse.parse_qs(parsed.query)
+		for key in ('expire', 'expires', 'Expires'):
+			if key in query and query[key][0].isdigit():
+				return float(query[key][0])
+		# Manifest URLs carry parameters in the path
+		match = re.search(r'/expire/(\d+)', parsed.path)
+		if match:
+			return float(match[1])
+		return None
+
+	def _get_url_dicts(self, fmt_ids: List[str]) -> Dict[Optional[str], dict]:
+		"""Return format dictionaries holding the URLs of the formats, the info itself without formats."""
+		if Info.Keys.formats_received not in self._info:
+			return {None: self._info}
+		return {i[Info.Keys.id]: i for i in self._info[Info.Keys.formats_received] if i[Info.Keys.id] in fmt_ids}
+
+	def get_expiry(self, fmt_ids: List[str]) -> float:
+		"""Return the earliest time one of the format URLs stops working."""
+		expiry = float('inf')
+		for fmt_id, fmt in self._get_url_dicts(fmt_ids).items():
+			url = fmt.get(Info.Keys.format_url) or ''
+			fmt_expiry = self.parse_expiry(url)
+			if fmt_expiry is None:
+				fmt_expiry = self._fetched.get(fmt_id, self._extracted_at) + self.url_ttl
+			expiry = min(expiry, fmt_expiry)
+		return expiry
+
+	def is_expired(self, fmt_ids: List[str]) -> bool:
+		return time.time() + self.expiry_margin >= self.get_expiry(fmt_ids)
+
+	def refresh_expired(self, fmt_ids: List[str]) -> bool:
+		"""
+		Extract again and take new URLs of the formats if they have expired.
+		Blocks. Concurrent callers wait for one extraction. Return True if refreshed.
+		"""
+		with self._refresh_lock:
+			if not self.is_expired(fmt_ids):
+				return False
+			logging.debug(f'Refreshing expired URLs of {fmt_ids or "the video"}')
+			fresh = Info(self.get_url(), self._ytdl_params)
+			fresh_dicts = fresh._get_url_dicts(fmt_ids)
+			now = time.time()
+			for fmt_id, fmt in self._get_url_dicts(fmt_ids).items():
+				if fmt_id not in fresh_dicts:
+					raise Exception(f'Format {fmt_id} is no longer available')
+				for field in Info.url_fields:
+					if field in fresh_dicts[fmt_id]:
+						fmt[field] = fresh_dicts[fmt_id][field]
+				self._fetched[fmt_id] = now
+			return True
 
 	def get_title(self):
 		"""Return video title."""
@@ -65,6 +216,23 @@ class Info:
 	def get_url(self):
 		return self._info[Info.Keys.url]
 
+	def get_video_id(self) -> str:
+		return self._info[Info.Keys.video_id]
+
+	def get_extractor(self) -> str:
+		return self._info[Info.Keys.extractor]
+
+	def get_duration(self):
+		"""Return duration in seconds or None."""
+		return self._info.get(Info.Keys.duration)
+
+	def is_live(self) -> bool:
+		return bool(self._info.get(Info.Keys.is_live))
+
+	def get_formats(self) -> List[dict]:
+		"""Return raw format dictionaries as received from youtube-dl."""
+		return self._info.get(Info.Keys.formats_received) or []
+
 	def get_format_str(self, fmt_id_list: List[str]) -> str:
 		if len(fmt_id_list) not in range(3):
 			raise Exception('Two inputs max')
@@ -93,6 +261,19 @@ class Info:
 			fmt_str = f'{fmt_dicts[0][Info.Keys.id]}+{fmt_dicts[1][Info.Keys.id]}'
 		return fmt_str
 
+	def estimate_size(self, fmt_id_list: List[str]) -> Optional[int]:
+		"""Return estimated size in bytes of the selected formats or None if unknown."""
+		if not fmt_id_list:
+			return None
+		formats = {i[Info.Keys.id]: i for i in self.get_formats()}
+		total = 0
+		for fmt_id in fmt_id_list:
+			size = FormatPolicy.estimate_size(formats.get(fmt_id, {}), self.get_duration())
+			if size is None:
+				return None
+			total += size
+		return total
+
 	def get_info_filtered(self):
 		"""Return shortened	info as a list of dictionaries (id, vcodec, dim, acodec, size, url)."""
 		# logging.debug(self._info)
@@ -154,6 +335,43 @@ class Info:
 			url_list = [self._info[Info.Keys.format_url]]
 		return url_list
 
+	def _get_format_dicts(self, fmt_ids: List[str]) -> List[dict]:
+		if Info.Keys.formats_received in self._info:
+			return [i for i in self._info[Info.Keys.formats_received] if i[Info.Keys.id] in fmt_ids]
+		return [self._info]
+
+	def get_http_headers_list(self, fmt_ids: List[str]) -> List[Dict[str, str]]:
+		"""Return headers youtube-dl would send with the format requests, cookies aside."""
+		return [
+			{k: v for k, v in (i.get(Info.Keys.http_headers) or {}).items() if k.lower() != 'cookie'}
+			for i in self._get_format_dicts(fmt_ids)]
+
+	def get_cookies_list(self, fmt_ids: List[str]) -> List[List[http.cookies.Morsel]]:
+		"""Return cookies of the format requests, each with its domain and path."""
+		cookies_list = []
+		for i in self._get_format_dicts(fmt_ids):
+			try:
+				cookies = list(LenientSimpleCookie(i.get(Info.Keys.cookies) or '').values())
+			except http.cookies.CookieError as e:
+				logging.warning(f'Ignoring malformed cookies of format {i.get(Info.Keys.id)}: {e}')
+				cookies = []
+			cookies_list.append([c for c in cookies if c['domain']])
+		return cookies_list
+
+	def get_range_support(self, fmt_ids: List[str]) -> List[Optional[bool]]:
+		"""Return byte range support of the formats, None where it wasn't probed."""
+		return [i.get(Info.Keys.accept_ranges) for i in self.get_formats() if i[Info.Keys.id] in fmt_ids]
+
+	def get_chunked(self, fmt_ids: List[str]) -> bool:
+		"""
+		Return whether a format has to be fetched in ranged requests of http_chunk_size,
+		e.g. googlevideo URLs throttle single GETs of a whole file.
+		"""
+		return any(
+			(i.get(Info.Keys.downloader_options) or {}).get(Info.Keys.http_chunk_size)
+			for i in self.get_formats() if i[Info.Keys.id] in fmt_ids
+		)
+
 	def get_protocol_list(self, fmt_ids: List[str]) -> List[str]:
 		"""Return list of protocols given the list of format ids."""
 		assert self._info is not None
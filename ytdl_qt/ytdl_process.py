@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from typing import Optional, Tuple
+
+# Fields of youtube-dl hook dictionaries the parent uses. The rest may not be picklable.
+hook_keys = ('status', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate', 'eta', 'filename',
+             'tmpfilename', 'fragment_index', 'fragment_count')
+
+
+class _Child:
+    """Runs in the worker process, forwards hooks and log messages over the pipe."""
+
+    def __init__(self, conn, heavy_postprocessors: Tuple[str, ...]):
+        self._conn = conn
+        self._heavy = heavy_postprocessors
+
+    def progress_hook(self, d: dict):
+        self._conn.send(('hook', {k: d[k] for k in hook_keys if k in d}))
+
+    def postprocessor_hook(self, d: dict):
+        info = d.get('info_dict') or {}
+        self._conn.send(('pp', {
+            'status': d['status'],
+            'postprocessor': d['postprocessor'],
+            'info_dict': {'filepath': info.get('filepath')},
+        }))
+        if d['status'] == 'started' and d['postprocessor'].startswith(self._heavy):
+            # Parent replies once it has a post-processing slot
+            self._conn.recv()
+
+    def debug(self, msg: str):
+        self._conn.send(('log', 'debug', msg))
+
+    def warning(self, msg: str):
+        self._conn.send(('log', 'warning', msg))
+
+    def error(self, msg: str):
+        self._conn.send(('log', 'error', msg))
+
+
+def _child_main(conn, url: str, ytdl_params: dict, heavy_postprocessors: Tuple[str, ...]):
+    # Own process group, so ffmpeg started by youtube-dl is killed along with it
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    from yt_dlp import YoutubeDL
+
+    child = _Child(conn, heavy_postprocessors)
+    params = dict(ytdl_params, progress_hooks=[child.progress_hook],
+                  postprocessor_hooks=[child.postprocessor_hook], logger=child)
+    try:
+        with YoutubeDL(params) as ytdl:
+            ytdl.download([url])
+        conn.send(('done', None))
+    except BaseException as e:
+        conn.send(('error', str(e)))
+
+
+class YtdlProcess:
+    """
+    youtube-dl download in a worker process that can be killed at any time,
+    also in the middle of a stalled read or of its own ffmpeg merge.
+    Messages are read with recv in the calling thread.
+    """
+
+    kill_grace = 2  # s between SIGTERM and SIGKILL
+
+    def __init__(self, url: str, ytdl_params: dict, heavy_postprocessors: Tuple[str, ...]):
+        # Forking a process with Qt and the engine threads running isn't safe
+        ctx = multiprocessing.get_context('spawn')
+        self._conn, child_conn = ctx.Pipe()
+        self._proc = ctx.Process(target=_child_main, args=(child_conn, url, ytdl_params, heavy_postprocessors),
+                                 name='ytdl', daemon=True)
+        self._proc.start()
+        child_conn.close()
+        self._killed = False
+        self._kill_timer: Optional[threading.Timer] = None
+
+    def recv(self) -> Optional[tuple]:
+        """Return next message, None once the process is gone."""
+        try:
+            return self._conn.recv()
+        except (EOFError, OSError):
+            return None
+
+    def send(self, msg: tuple):
+        try:
+            self._conn.send(msg)
+        except OSError:
+            pass
+
+    def _signal(self, sig: int):
+        try:
+            if hasattr(os, 'killpg'):
+                try:
+                    os.killpg(self._proc.pid, sig)
+                    return
+                except ProcessLookupError:
+                    # No group before the child has started up and called setsid
+                    pass
+            if sig == signal.SIGTERM:
+                self._proc.terminate()
+            else:
+                self._proc.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def kill(self):
+        """Terminate the process group, SIGKILL after kill_grace. Returns immediately."""
+        if self._killed or self._proc.exitcode is not None:
+            return
+        self._killed = True
+        logging.debug(f'Terminating youtube-dl process {self._proc.pid}')
+        self._signal(signal.SIGTERM)
+        self._kill_timer = threading.Timer(self.kill_grace, self._kill_hard)
+        self._kill_timer.daemon = True
+        self._kill_timer.start()
+
+    def _kill_hard(self):
+        if self._proc.exitcode is not None:
+            # Reaped, the pid may belong to someone else by now
+            return
+        self._signal(signal.SIGKILL if hasattr(signal, 'SIGKILL') else signal.SIGTERM)
+
+    def join(self) -> Optional[int]:
+        self._proc.join()
+        if self._kill_timer is not None:
+            self._kill_timer.cancel()
+        self._conn.close()
+        return self._proc.exitcode